@@ -1,38 +1,174 @@
 # app/api.py
 
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Header, status
+from fastapi import APIRouter, HTTPException, Request, Response, UploadFile, File, Header, status
+from fastapi.responses import FileResponse, StreamingResponse
+from app import metrics, models, profiling
+from app.cache import LRUCache, SingleFlight, normalize_query
+from app.concurrency import run_in_pool
+from app.inference import thread_counts
+from app.jobs import JobRegistry
 from app.parser.ner_model import extract_info
-from app.retriever.embedder import model as embedder
-from app.retriever.vector_store import load_faiss_index, search_clauses
-from app.retriever.evaluator import evaluate
+from app.pipeline import BATCH_CHUNK, analyze_chunk
+from app.retriever.embedder import embed_text, encode_batcher
+from app.retriever.snapshots import (
+    SnapshotManager, current_snapshot, finish_snapshot, ingest_snapshot, load_snapshot, new_snapshot_dir, publish,
+)
+from app.retriever.rules import get_rules
+from app.retriever.vector_store import (
+    clause_entities, clause_matches, rerank_batcher, rerank_pairs, search_clauses,
+)
+from app.retriever.evaluator import evaluate, get_nlp
+from app.retriever.ingest import SUPPORTED_EXTENSIONS
 from app.reasoner.output_generator import format_output
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import asyncio
+import hashlib
+import hmac
+import json
 import os
+import re
+import shutil
+import sys
+import time
+import uuid
 
 router = APIRouter()
 
-# Load FAISS index and metadata once (you can load on startup if preferred)
-INDEX_PATH = "app/data/embeddings/faiss_index.index"
-META_PATH = "app/data/embeddings/metadata.pkl"
+# The live index snapshot (FAISS index, chunk store and manifest, swapped as
+# one unit) is loaded on first use or by /api/warmup, so importing this module
+# stays fast. See app/retriever/snapshots.py for the on-disk layout.
+live = SnapshotManager()
+index_checked = False
+index_load_lock = asyncio.Lock()
 
-try:
-    index, metadata = load_faiss_index(INDEX_PATH, META_PATH)
-except Exception as e:
-    index, metadata = None, []
-    print(f"Error loading index: {e}")
+# Models loaded by /api/warmup (and at startup unless LLM_WARMUP_ON_STARTUP=0)
+WARMUP_MODELS = [m.strip() for m in os.environ.get("LLM_WARMUP_MODELS", "embedder,cross_encoder,insurance_rules,gazetteer").split(",") if m.strip()]
+warmup_state = {"status": "booting", "error": None, "seconds": None}
 
 DOCS_DIR = "app/data/documents"
+# Uploads are streamed here first and moved into DOCS_DIR once complete (same filesystem)
+UPLOAD_TMP_DIR = "app/data/uploads"
+UPLOAD_CHUNK_SIZE = 1 << 20
+MAX_UPLOAD_BYTES = int(os.environ.get("LLM_MAX_UPLOAD_MB", 500)) * 2**20
+BUILD_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "build_vector_index.py")
+# Niceness of the rebuild process, so it yields the CPU to request handling
+REBUILD_NICE = int(os.environ.get("LLM_REBUILD_NICE", 10))
+# Serializes uploads and rebuilds so each one starts from the snapshot the previous one produced
+ingest_lock = asyncio.Lock()
+jobs = JobRegistry(max_jobs=int(os.environ.get("LLM_MAX_JOBS", 1000)))
+# Strong references to running background tasks (the event loop only keeps weak ones)
+background_tasks = set()
+
+# Query embeddings only depend on the text, results also on domain and index version
+embedding_cache = LRUCache(
+    max_size=int(os.environ.get("LLM_EMBEDDING_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("LLM_EMBEDDING_CACHE_TTL", 3600)),
+)
+result_cache = LRUCache(
+    max_size=int(os.environ.get("LLM_RESULT_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("LLM_RESULT_CACHE_TTL", 300)),
+)
+in_flight = SingleFlight()
+
+def _index_stats():
+    current = live.current
+    if current is None:
+        return None
+    return {("chunks",): len(current.store), ("vectors",): current.index.ntotal}
+
+def _cache_stats(field):
+    return {("results",): result_cache.stats()[field], ("embeddings",): embedding_cache.stats()[field]}
+
+# Read from the live objects when /metrics is scraped
+metrics.Callback("llm_index_version", "Version of the serving index snapshot (bumped by uploads and rebuilds)",
+                 lambda: live.version)
+metrics.Callback("llm_index_size", "Chunks and vectors of the serving index", _index_stats, labels=("kind",))
+metrics.Callback("llm_cache_hits_total", "Query cache hits", lambda: _cache_stats("hits"), labels=("cache",),
+                 type="counter")
+metrics.Callback("llm_cache_misses_total", "Query cache misses", lambda: _cache_stats("misses"), labels=("cache",),
+                 type="counter")
+metrics.Callback("llm_requests_coalesced_total", "Requests that shared an identical in-flight computation",
+                 lambda: in_flight.stats()["coalesced"], type="counter")
+metrics.Callback("llm_model_load_seconds", "Load time of each loaded model",
+                 lambda: {(name,): seconds for name, seconds in models.loaded().items()}, labels=("model",))
+
+def _load_current():
+    try:
+        path = current_snapshot()
+        return (path, *load_snapshot(path)) if path else None
+    except Exception as e:
+        print(f"Error loading index: {e}")
+        return None
+
+async def ensure_index_loaded():
+    """Load the published snapshot once, off the event loop."""
+    global index_checked
+    if index_checked:
+        return
+    async with index_load_lock:
+        if not index_checked:
+            loaded = await run_in_pool("ingest", _load_current)
+            # An upload or rebuild may have installed a snapshot meanwhile
+            if loaded and not index_checked:
+                _swap_index(*loaded)
+            index_checked = True
+
+def _warm_models(names):
+    for name in names:
+        models.get(name)
+    # One tiny call each so tokenizer/kernel initialisation is paid here, not by the first user
+    if "embedder" in names:
+        embed_text(["warm-up"])
+    if "cross_encoder" in names:
+        rerank_pairs([("warm-up", "warm-up")])
+    if "nlp" in names:
+        get_nlp()("warm-up")
+
+async def warm_up(names=None):
+    """Load the index and the given models (default WARMUP_MODELS); readiness flips when done."""
+    warmup_state["status"] = "warming"
+    start = time.perf_counter()
+    try:
+        await ensure_index_loaded()
+        await run_in_pool("inference", _warm_models, names or WARMUP_MODELS)
+        warmup_state.update(status="ready", error=None)
+    except Exception as e:
+        print("Warm-up Error:", str(e))
+        warmup_state.update(status="failed", error=str(e))
+    warmup_state["seconds"] = time.perf_counter() - start
+    return warmup_state
+
+def _swap_index(path, new_index, new_store, new_manifest, new_lexical=None):
+    """Install a new live snapshot and drop every cached result computed against the old one."""
+    global index_checked
+    live.swap(path, new_index, new_store, new_manifest, new_lexical)
+    index_checked = True
+    result_cache.clear()
 
 class QueryRequest(BaseModel):
     query: str
     domain: str = "insurance"
     use_llm: bool = True
+    # Retrieval depth: retrieve `candidates`, rerank `rerank_depth`, return `top_k`
+    # (None falls back to the server defaults in app/retriever/vector_store.py)
+    top_k: int = Field(3, ge=1, le=50)
+    candidates: Optional[int] = Field(None, ge=1, le=500)
+    rerank_depth: Optional[int] = Field(None, ge=0, le=200)
+    rerank_budget_ms: Optional[float] = Field(None, ge=0)
+    # Search breadth for approximate indexes (IVF nprobe / HNSW efSearch)
+    nprobe: Optional[int] = Field(None, ge=1, le=65536)
+    ef_search: Optional[int] = Field(None, ge=1, le=65536)
+    # Lexical hits fused with the FAISS hits (0 turns hybrid retrieval off)
+    lexical_candidates: Optional[int] = Field(None, ge=0, le=500)
 @router.post("/analyze_query")
 async def analyze_query(request: QueryRequest):
-    if index is None or not metadata:
+    await ensure_index_loaded()
+    current = live.current
+    if current is None or not len(current.store):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Vector index or metadata not loaded. Please rebuild the index."
+            detail="Vector index or chunk store not loaded. Please rebuild the index."
         )
     try:
         query_text = request.query
@@ -41,34 +177,313 @@ async def analyze_query(request: QueryRequest):
         if not query_text:
             raise HTTPException(status_code=400, detail="Query is required")
 
-        # Step 1: Parse input
+        # Identical queries against the same index version share one result,
+        # and concurrent identical requests share one computation
+        key = _result_key(request)
+        cached = result_cache.get(key)
+        if cached is not None:
+            # Served without running the pipeline: say so, or the response looks unexplainably fast
+            metrics.note("cache", "hit")
+            return cached
+        if in_flight.running(key):
+            metrics.note("cache", "coalesced")
+        return await in_flight.do(key, lambda: _analyze(request, key))
+    except Exception as e:
+        print("Internal Server Error:", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal Server Error: {str(e)}"
+        )
+def _result_key(request):
+    return (normalize_query(request.query), request.domain, live.version, request.top_k,
+            request.candidates, request.rerank_depth, request.rerank_budget_ms,
+            request.nprobe, request.ef_search, request.lexical_candidates)
+
+async def _analyze(request, key, on_event=None):
+    # Hold the live snapshot for the whole request: a swap meanwhile does not
+    # change the index or chunks under it, and it is released afterwards
+    with live.use() as snapshot:
+        return await _analyze_snapshot(request, key, snapshot, on_event)
+
+async def _analyze_snapshot(request, key, snapshot, on_event=None):
+    """
+    Analyze one query against snapshot. on_event(event, data), which must be
+    safe to call from any thread, is told the "retrieved" clauses as soon as
+    the index search returns and the "reranked" ones once scoring is done.
+    """
+    query_text, domain = request.query, request.domain
+
+    # Step 1: Parse input (regex only, cheap enough for the event loop)
+    with metrics.stage("extract_info"), profiling.attach():
         structured = extract_info(query_text, domain=domain)
 
-        # Step 2: Embed and search
-        query_embedding = embedder.encode([query_text])[0]
-        relevant_clauses = search_clauses(query_embedding, index, metadata, context_window=1, query_text=query_text)
+    # Step 2: Embed and search. Model calls never run on the event loop:
+    # the query encode is micro-batched with other requests' encodes, and
+    # search + rerank (also micro-batched) runs on the inference pool.
+    normalized = key[0]
+    with metrics.stage("embed"):
+        query_embedding = embedding_cache.get(normalized)
+        if query_embedding is None:
+            query_embedding = await asyncio.wrap_future(encode_batcher.submit(normalized))
+            embedding_cache.set(normalized, query_embedding)
+    # "retrieve" includes the wait for an inference worker; index_search,
+    # lexical_search and rerank are timed inside search_clauses
+    with metrics.stage("retrieve"):
+        retrieved = await run_in_pool(
+            "inference", search_clauses, query_embedding, snapshot.index, snapshot.store,
+            top_k=request.top_k, context_window=1, query_text=query_text, scorer=rerank_batcher,
+            candidates=request.candidates, rerank_depth=request.rerank_depth,
+            budget_ms=request.rerank_budget_ms, with_scores=True,
+            nprobe=request.nprobe, ef_search=request.ef_search,
+            lexical=snapshot.lexical, lexical_candidates=request.lexical_candidates,
+            on_candidates=(lambda clauses: on_event("retrieved", {"clauses": clauses})) if on_event else None
+        )
+    if on_event is not None:
+        on_event("reranked", {"clauses": retrieved,
+                              "reranked": any(r["rerank_score"] is not None for r in retrieved)})
+    relevant_clauses = [r["clause"] for r in retrieved]
 
-        # Step 3: Evaluate
-        evaluation = evaluate(structured, relevant_clauses, domain=domain)
+    # Step 3: Evaluate (legal entities come from the chunk store when it has
+    # them, insurance rule matches from the per-chunk match cache)
+    entities = clause_entities(retrieved, snapshot.store) if domain == "legal" else None
+    matches = clause_matches(retrieved, snapshot.store, get_rules()) if domain == "insurance" else None
+    with metrics.stage("evaluate"):
+        evaluation = await run_in_pool("inference", evaluate, structured, relevant_clauses, domain=domain,
+                                       entities=entities, matches=matches)
 
-        # Step 4: Output
-        return format_output(evaluation, structured)
-    except Exception as e:
-        print("Internal Server Error:", str(e))
+    # Step 4: Output
+    with profiling.attach():
+        result = format_output(evaluation, structured, retrieved=retrieved)
+    if key[2] == snapshot.version and snapshot is live.current:
+        result_cache.set(key, result)
+    return result
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/analyze_stream")
+async def analyze_stream(request: QueryRequest):
+    """
+    /analyze_query as server-sent events, sent as each stage finishes:
+    "retrieved" (the top_k clauses in retrieval order, once the index search
+    returns), "reranked" (their final order, once the cross-encoder is done)
+    and "result" (what /analyze_query returns), or "error" on failure. A
+    cached result is sent as "result" alone.
+    """
+    await ensure_index_loaded()
+    current = live.current
+    if current is None or not len(current.store):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Internal Server Error: {str(e)}"
+            detail="Vector index or chunk store not loaded. Please rebuild the index."
         )
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query is required")
+
+    key = _result_key(request)
+    cached = result_cache.get(key)
+    queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    def send(message):
+        # Through the loop from any thread, so events keep the order they were sent in
+        loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    def on_event(event, data):
+        # Serialized right away: the dicts are still being worked on afterwards
+        send(_sse(event, data))
+
+    async def run():
+        # Not coalesced with identical requests (each stream needs its own
+        # events), but its result is cached for them
+        try:
+            on_event("result", await _analyze(request, key, on_event))
+        except Exception as e:
+            print("Internal Server Error:", str(e))
+            on_event("error", {"detail": f"Internal Server Error: {str(e)}"})
+        send(None)
+
+    if cached is not None:
+        metrics.note("cache", "hit")
+        queue.put_nowait(_sse("result", cached))
+        queue.put_nowait(None)
+    else:
+        # A background task, so a client that disconnects early does not
+        # cancel the work while a worker thread still uses the snapshot
+        _start_background(run())
+
+    async def events():
+        while (message := await queue.get()) is not None:
+            yield message
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class BatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=int(os.environ.get("LLM_MAX_BATCH_QUERIES", 100000)))
+    domain: str = "insurance"
+    top_k: int = Field(3, ge=1, le=50)
+    candidates: Optional[int] = Field(None, ge=1, le=500)
+    rerank_depth: Optional[int] = Field(None, ge=0, le=200)
+    nprobe: Optional[int] = Field(None, ge=1, le=65536)
+    ef_search: Optional[int] = Field(None, ge=1, le=65536)
+    lexical_candidates: Optional[int] = Field(None, ge=0, le=500)
+    chunk_size: Optional[int] = Field(None, ge=1, le=4096)  # default LLM_ANALYZE_BATCH_CHUNK
+
+@router.post("/analyze_batch")
+async def analyze_batch(request: BatchRequest):
+    """
+    Analyze many queries, streamed back as NDJSON in request order: one line
+    per query with its index and either "result" (as /analyze_query returns
+    it) or "error". A failing query does not abort the batch.
+    """
+    await ensure_index_loaded()
+    current = live.current
+    if current is None or not len(current.store):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Vector index or chunk store not loaded. Please rebuild the index."
+        )
+    chunk_size = request.chunk_size or BATCH_CHUNK
+    options = dict(top_k=request.top_k, candidates=request.candidates, rerank_depth=request.rerank_depth,
+                   nprobe=request.nprobe, ef_search=request.ef_search, lexical_candidates=request.lexical_candidates)
+
+    async def lines():
+        # The whole batch runs against one snapshot; the next chunk is
+        # analyzed while the previous one is being sent
+        snapshot = live.acquire()
+
+        def run(start):
+            return asyncio.ensure_future(run_in_pool(
+                "inference", analyze_chunk, request.queries[start:start + chunk_size], snapshot,
+                request.domain, start, **options,
+            ))
+
+        def release(future):
+            live.release(snapshot)
+            if not future.cancelled():
+                future.exception()  # retrieved, so an abandoned chunk's error is not logged as unhandled
+
+        pending = run(0)
+        try:
+            for start in range(chunk_size, len(request.queries) + chunk_size, chunk_size):
+                # Shielded: a disconnect cancels this await, not the chunk, so
+                # the snapshot and the pool slot are held until the thread is done
+                items = await asyncio.shield(pending)
+                pending = run(start) if start < len(request.queries) else None
+                yield "".join(json.dumps(item) + "\n" for item in items)
+        finally:
+            # A client that disconnects early leaves a chunk running on a
+            # worker thread; the snapshot stays held until it finishes
+            if pending is not None:
+                pending.add_done_callback(release)
+            else:
+                live.release(snapshot)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def sanitize_filename(filename):
+    """Base name of an uploaded file with anything but letters, digits, '.', '-', '_' and spaces replaced."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    name = re.sub(r"[^\w.\- ]", "_", name).strip(" .")
+    if not name.endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail=f"Unsupported file type; expected one of {', '.join(SUPPORTED_EXTENSIONS)}")
+    return name
+
+async def _save_upload(file):
+    """Stream an upload to a temporary file, hashing as it goes. Returns (tmp_path, sha256, size)."""
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                block = await file.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File larger than {MAX_UPLOAD_BYTES // 2**20} MB")
+                digest.update(block)
+                f.write(block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+def _find_duplicate(digest):
+    """Name of an indexed or queued document with the same content, if any."""
+    current = live.current
+    for name, entry in (current.manifest if current else {}).items():
+        if entry.get("sha256") == digest:
+            return name
+    for job in jobs.find(kind="ingest", sha256=digest):
+        return job["filename"]
+    return None
+
+async def _run_ingest_job(job_id, filename):
+    def on_progress(stage, progress):
+        if stage == "parsed":
+            jobs.update(job_id, status="embedding", chunks=progress.chunks)
+        else:
+            jobs.update(job_id, chunks_embedded=progress.embedded_chunks)
+
+    # Embed just this file into a new snapshot copied from the live one, then
+    # swap it in, so requests never see a half-updated index
+    try:
+        await ensure_index_loaded()
+        async with ingest_lock:
+            jobs.update(job_id, status="parsing")
+            with live.use() as base:
+                path, new_index, new_store, new_manifest, new_lexical, summary = await run_in_pool(
+                    "ingest", ingest_snapshot, base, DOCS_DIR, [filename], 1, on_progress
+                )
+            if path is not None:
+                publish(path, in_use=live.paths())
+                _swap_index(path, new_index, new_store, new_manifest, new_lexical)
+        jobs.update(job_id, status="indexed", chunks=summary["chunks_added"], index_version=live.version,
+                    chunks_embedded=summary["chunks_added"], timings=summary.get("timings"))
+    except Exception as e:
+        print("Ingestion Error:", str(e))
+        jobs.update(job_id, status="failed", error=str(e))
+
+def _start_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
 @router.post("/upload_document")
 async def upload_document(file: UploadFile = File(...)):
-    # Save uploaded file
+    """Save an upload and queue it for indexing; poll /api/jobs/{job_id} for progress"""
+    filename = sanitize_filename(file.filename)
+    tmp_path, digest, size = await _save_upload(file)
+
+    duplicate_of = _find_duplicate(digest)
+    if duplicate_of is not None:
+        os.remove(tmp_path)
+        job = jobs.create("ingest", filename=filename, sha256=digest, bytes=size, status="duplicate",
+                          duplicate_of=duplicate_of)
+        return {"message": f"Same content as {duplicate_of}; nothing to index.", **job}
+
     os.makedirs(DOCS_DIR, exist_ok=True)
-    file_path = os.path.join(DOCS_DIR, file.filename)
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
-    # Optionally, trigger ingestion or log
-    print(f"Uploaded and saved file: {file.filename}")
-    return {"message": "File uploaded and saved successfully."}
+    os.replace(tmp_path, os.path.join(DOCS_DIR, filename))
+    print(f"Uploaded and saved file: {filename} ({size} bytes)")
+    job = jobs.create("ingest", filename=filename, sha256=digest, bytes=size, chunks=0, chunks_embedded=0)
+    _start_background(_run_ingest_job(job["job_id"], filename))
+    return {"message": "File uploaded; indexing in the background.", **job}
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 50):
+    return {"jobs": jobs.list(limit)}
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
 
 @router.get("/list_documents")
 async def list_documents():
@@ -79,30 +494,120 @@ async def list_documents():
     except Exception as e:
         return {"error": str(e)}
 
-@router.post("/rebuild_index")
-async def rebuild_index():
-    """Rebuild the vector index from documents"""
+@router.get("/stats")
+async def stats():
+    return {
+        "index_version": live.version,
+        "snapshots": live.stats(),
+        "models": models.loaded(),
+        # Read on an inference worker: the FAISS (OpenMP) count is per thread
+        "threads": await run_in_pool("inference", thread_counts),
+        "batching": {
+            "encode": encode_batcher.stats(),
+            "rerank": rerank_batcher.stats(),
+        },
+        "cache": {
+            "embeddings": embedding_cache.stats(),
+            "results": result_cache.stats(),
+            **in_flight.stats(),
+        },
+    }
+
+class WarmupRequest(BaseModel):
+    models: Optional[List[str]] = None  # default WARMUP_MODELS
+
+@router.post("/warmup")
+async def warmup(request: Optional[WarmupRequest] = None):
+    """Load the index and models now instead of on the first query"""
+    names = request.models if request and request.models else None
+    unknown = set(names or []) - set(models.registered())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models: {sorted(unknown)}")
+    state = await warm_up(names)
+    return {**state, "index_loaded": live.current is not None, "models": models.loaded()}
+
+@router.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def health_ready(response: Response):
+    """200 once warm-up has finished, 503 while booting/warming or after a failed warm-up"""
+    if warmup_state["status"] != "ready":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {**warmup_state, "index_loaded": live.current is not None, "models": models.loaded()}
+
+def _check_profile_token(token):
+    # Profiles show stack frames and allocation sites: without a token nobody may read them
+    if not profiling.TOKEN:
+        raise HTTPException(status_code=404, detail="Set LLM_PROFILE_TOKEN to read profiles")
+    # Header values arrive decoded as latin-1: compare the raw bytes, as the middleware does
+    if token is None or not hmac.compare_digest(token.encode("latin-1"), profiling.TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Send the profiling token in the X-Profile header")
+
+@router.get("/admin/profiles")
+async def list_profiles(limit: int = 50, x_profile: Optional[str] = Header(None)):
+    """Saved request profiles, newest first (see app/profiling.py)"""
+    _check_profile_token(x_profile)
+    return {"enabled": profiling.ENABLED, "profiles": await run_in_pool("ingest", profiling.list_profiles, limit)}
+
+@router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json", x_profile: Optional[str] = Header(None)):
+    """A profile's summary (format=json) or its collapsed stacks for flame graph tools (format=collapsed)"""
+    _check_profile_token(x_profile)
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be json or collapsed")
+    path = profiling.profile_path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Unknown profile id")
+    return FileResponse(path, media_type="application/json" if format == "json" else "text/plain",
+                        filename=f"{profile_id}.{format}")
+
+BUILD_PROGRESS = re.compile(r"\[build\] (\d+)/(\d+) documents, (\d+) chunks")
+
+async def _run_rebuild_job(job_id):
+    # The build script runs as a separate (niced) process writing a new
+    # snapshot directory; serving continues on the current snapshot until the
+    # new one is complete, loaded and swapped in as one unit
+    partial = None
     try:
-        import subprocess
-        import sys
-        
-        # Run the build_vector_index.py script
-        script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "build_vector_index.py")
-        result = subprocess.run([sys.executable, script_path], 
-                               capture_output=True, 
-                               text=True)
-        
-        if result.returncode == 0:
-            # Reload the index
-            global index, metadata
-            try:
-                index, metadata = load_faiss_index(INDEX_PATH, META_PATH)
-                return {"message": "Index rebuilt and loaded successfully"}
-            except Exception as e:
-                return {"error": f"Index rebuilt but failed to load: {str(e)}"}
-        else:
-            return {"error": f"Failed to rebuild index: {result.stderr}"}
+        async with ingest_lock:
+            jobs.update(job_id, status="building")
+            partial = await run_in_pool("ingest", new_snapshot_dir)
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, BUILD_SCRIPT, "--output", partial, "--nice", str(REBUILD_NICE),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            )
+            log = []
+            async for raw in proc.stdout:
+                line = raw.decode("utf-8", "replace").rstrip()
+                log = (log + [line])[-20:]
+                match = BUILD_PROGRESS.search(line)
+                if match:
+                    jobs.update(job_id, documents=int(match.group(1)), total_documents=int(match.group(2)),
+                                chunks=int(match.group(3)))
+            if await proc.wait() != 0:
+                raise RuntimeError("Build failed:\n" + "\n".join(log))
+
+            path = await run_in_pool("ingest", finish_snapshot, partial)
+            partial = None
+            new_index, new_store, new_manifest, new_lexical = await run_in_pool("ingest", load_snapshot, path)
+            publish(path, in_use=live.paths())
+            _swap_index(path, new_index, new_store, new_manifest, new_lexical)
+        jobs.update(job_id, status="indexed", snapshot=os.path.basename(path), index_version=live.version,
+                    chunks=len(new_store), log=log)
     except Exception as e:
-        import traceback
-        print("Index Rebuild Error:", traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Index Rebuild Error: {str(e)}")
+        print("Index Rebuild Error:", str(e))
+        jobs.update(job_id, status="failed", error=str(e))
+        if partial is not None:
+            shutil.rmtree(partial, ignore_errors=True)
+
+@router.post("/rebuild_index")
+async def rebuild_index():
+    """Rebuild the vector index from documents in the background; poll /api/jobs/{job_id}"""
+    running = jobs.find(kind="rebuild")
+    if running:
+        return {"message": "A rebuild is already running.", **running[0]}
+    job = jobs.create("rebuild")
+    _start_background(_run_rebuild_job(job["job_id"]))
+    return {"message": "Index rebuild started.", **job}
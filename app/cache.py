@@ -0,0 +1,97 @@
+# app/cache.py
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    """Lowercase and collapse whitespace so trivially different queries share cache entries."""
+    return " ".join(text.lower().split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry time-to-live (seconds)."""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one running computation."""
+
+    def __init__(self):
+        self._pending = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._pending[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        # shield: a caller that disconnects must not cancel the work others are waiting on
+        return await asyncio.shield(task)
+
+    def running(self, key):
+        """Whether a computation for key is in flight (a do() now would join it)."""
+        return key in self._pending
+
+    def _done(self, key, task):
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved even if every waiter went away
+
+    def stats(self):
+        return {"in_flight": len(self._pending), "coalesced": self.coalesced}
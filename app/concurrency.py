@@ -0,0 +1,63 @@
+# app/concurrency.py
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app import profiling
+
+# Pool sizes can be tuned per deployment with environment variables.
+# "inference" runs the request path (embedding, FAISS search, cross-encoder, spaCy);
+# "ingest" runs upload indexing so it never competes with queries for a worker.
+POOL_SIZES = {
+    "inference": int(os.environ.get("LLM_INFERENCE_WORKERS", min(4, os.cpu_count() or 1))),
+    "ingest": int(os.environ.get("LLM_INGEST_WORKERS", 1)),
+}
+# Jobs that may wait in a pool's queue before callers are held back on the event loop
+MAX_PENDING = int(os.environ.get("LLM_MAX_PENDING", 64))
+
+_executors = {}
+_semaphores = {}
+# Per-thread setup run by every pool worker and batcher thread as it starts:
+# some settings (the OpenMP thread count in libgomp) only apply to the thread that sets them
+_thread_initializers = []
+
+
+def add_thread_initializer(fn):
+    _thread_initializers.append(fn)
+
+
+def init_thread():
+    for fn in _thread_initializers:
+        fn()
+
+
+def _get_pool(name):
+    if name not in _executors:
+        _executors[name] = ThreadPoolExecutor(max_workers=POOL_SIZES[name], thread_name_prefix=f"llm-{name}",
+                                              initializer=init_thread)
+        _semaphores[name] = asyncio.Semaphore(POOL_SIZES[name] + MAX_PENDING)
+    return _executors[name], _semaphores[name]
+
+
+async def run_in_pool(pool, fn, *args, **kwargs):
+    """Run a blocking function on the named bounded pool without stalling the event loop."""
+    executor, semaphore = _get_pool(pool)
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        # Carry context variables (e.g. per-request state) over to the worker thread
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        if profiling.ENABLED:
+            # A profiled request's samples include the worker thread while it runs this
+            call = profiling.attached(call)
+        return await loop.run_in_executor(executor, call)
+
+
+def shutdown_pools():
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+    _semaphores.clear()
@@ -1,51 +1,76 @@
 import gradio as gr
 import requests
-import re
 import json
 
-API_URL = "http://localhost:8000/api/analyze_query"
+STREAM_URL = "http://localhost:8000/api/analyze_stream"
 UPLOAD_URL = "http://localhost:8000/api/upload_document"
 LIST_URL = "http://localhost:8000/api/list_documents"
 REBUILD_URL = "http://localhost:8000/api/rebuild_index"
 
-# Function to call FastAPI backend for analysis
+# Events from the streaming endpoint, as they arrive
+def stream_events(query, domain, use_llm=True):
+    try:
+        response = requests.post(STREAM_URL, json={"query": query, "domain": domain, "use_llm": use_llm}, stream=True)
+        if response.status_code != 200:
+            yield "error", {"detail": response.text}
+            return
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event:
+                yield event, json.loads(line[len("data:"):])
+    except Exception as e:
+        yield "error", {"detail": str(e)}
+
+def format_clauses(details, parties=()):
+    output = ""
+    for detail in details:
+        if detail.get('section'):
+            output += f"\n**{detail['section']}** ({detail['document']})\n"
+        highlighted_clause = detail['text']
+        for party in parties:
+            if party:
+                highlighted_clause = highlighted_clause.replace(party, f"**{party}**")
+        output += f"- {highlighted_clause}\n"
+    return output
+
+def format_result(result):
+    output = f"""### Query Analysis Result\n\n**Decision:** {result['decision']}  \n**Amount:** {result['amount']}\n\n**Justification:** {result['justification']}\n\n---\n\n"""
+
+    if 'reasoning' in result:
+        output += f"**LLM Reasoning:**\n{result['reasoning']}\n\n---\n"
+
+    output += "**Relevant Clauses:**\n"
+    parties = result.get('parties', [])
+    # Structured fields from the chunk store; older servers only send clause strings
+    details = result.get('clause_details') or [{"text": clause} for clause in result['clauses']]
+    output += format_clauses(details, parties)
+
+    if parties:
+        output += f"\n**Parties:** {', '.join(parties)}"
+    organizations = result.get('organizations', [])
+    if organizations:
+        output += f"\n**Organizations:** {', '.join(organizations)}"
+    dates = result.get('dates', [])
+    if dates:
+        output += f"\n**Dates:** {', '.join(dates)}"
+    if 'jurisdiction' in result and result['jurisdiction']:
+        output += f"\n**Jurisdiction:** {result['jurisdiction']}"
+    return output
+
+# Analysis as Markdown, updated as the backend streams it: the retrieved
+# clauses as soon as the index search returns, their reranked order, then the decision
 def analyze(query, domain, use_llm=True):
-    response = requests.post(API_URL, json={"query": query, "domain": domain, "use_llm": use_llm})
-    if response.status_code == 200:
-        result = response.json()
-        output = f"""### Query Analysis Result\n\n**Decision:** {result['decision']}  \n**Amount:** {result['amount']}\n\n**Justification:** {result['justification']}\n\n---\n\n"""
-
-        if 'reasoning' in result:
-            output += f"**LLM Reasoning:**\n{result['reasoning']}\n\n---\n"
-
-        output += "**Relevant Clauses:**\n"
-        parties = result.get('parties', [])
-        for clause in result['clauses']:
-            match = re.match(r'([^:]+) :: \[(.*?)\] (.*)', clause)
-            if match:
-                filename, section_header, chunk_text = match.groups()
-                output += f"\n**{section_header}**\n"
-                highlighted_clause = chunk_text
-            else:
-                highlighted_clause = clause
-            for party in parties:
-                if party:
-                    highlighted_clause = highlighted_clause.replace(party, f"**{party}**")
-            output += f"- {highlighted_clause}\n"
-
-        if parties:
-            output += f"\n**Parties:** {', '.join(parties)}"
-        organizations = result.get('organizations', [])
-        if organizations:
-            output += f"\n**Organizations:** {', '.join(organizations)}"
-        dates = result.get('dates', [])
-        if dates:
-            output += f"\n**Dates:** {', '.join(dates)}"
-        if 'jurisdiction' in result and result['jurisdiction']:
-            output += f"\n**Jurisdiction:** {result['jurisdiction']}"
-        return output
-    else:
-        return f"Error: {response.text}"
+    for event, data in stream_events(query, domain, use_llm):
+        if event == "retrieved":
+            yield "### Query Analysis Result\n\n*Ranking clauses...*\n\n**Retrieved Clauses:**\n" + format_clauses(data['clauses'])
+        elif event == "reranked":
+            yield "### Query Analysis Result\n\n*Evaluating...*\n\n**Retrieved Clauses:**\n" + format_clauses(data['clauses'])
+        elif event == "result":
+            yield format_result(data)
+        elif event == "error":
+            yield f"Error: {data['detail']}"
 
 # Upload function
 def upload_document(file):
@@ -62,7 +87,8 @@ def upload_document(file):
         files = {"file": (file.name, content, file.type if hasattr(file, 'type') else "application/octet-stream")}
         response = requests.post(UPLOAD_URL, files=files)
         if response.status_code == 200:
-            return "Document uploaded and ingested successfully!"
+            job = response.json()
+            return f"{job['message']}\nJob {job['job_id']}: {job['status']}"
         else:
             return f"Upload failed: {response.text}"
     except Exception as e:
@@ -86,17 +112,19 @@ def rebuild_index():
     try:
         response = requests.post(REBUILD_URL)
         if response.status_code == 200:
-            return "Index rebuilt successfully!"
+            job = response.json()
+            return f"{job['message']}\nJob {job['job_id']}: {job['status']}"
         else:
             return f"Error: {response.text}"
     except Exception as e:
         return f"Error: {str(e)}"
 
 def chat(message, history, domain, use_llm=True):
-    history.append((message, ""))
-    response = analyze(message, domain, use_llm)
-    history[-1] = (message, response)
-    return history
+    history = (history or []) + [{"role": "user", "content": message}, {"role": "assistant", "content": "*Searching...*"}]
+    yield history
+    for response in analyze(message, domain, use_llm):
+        history[-1]["content"] = response
+        yield history
 
 # Main Gradio UI
 def main():
@@ -112,7 +140,8 @@ def main():
                     analyze_btn = gr.Button("Analyze")
                     use_llm = gr.Checkbox(label="Use LLM for reasoning", value=True)
                 output = gr.Markdown(label="Result")
-                analyze_btn.click(fn=lambda q, d, l: analyze(q, d, use_llm=l),
+                # Generator functions (not lambdas) so Gradio streams each update
+                analyze_btn.click(fn=analyze,
                                   inputs=[query, domain, use_llm],
                                   outputs=output)
 
@@ -122,7 +151,7 @@ def main():
                 with gr.Row():
                     chat_domain = gr.Dropdown(choices=["insurance", "legal"], value="insurance", label="Domain")
                     chat_use_llm = gr.Checkbox(label="Use LLM", value=True)
-                chat_input.submit(fn=lambda m, h, d, l: chat(m, h, d, l),
+                chat_input.submit(fn=chat,
                                   inputs=[chat_input, chatbot, chat_domain, chat_use_llm],
                                   outputs=[chatbot])
                 clear_btn = gr.Button("Clear Chat")
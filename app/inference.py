@@ -0,0 +1,139 @@
+# app/inference.py
+#
+# CPU inference backends for the sentence-transformers models (the embedder
+# and the cross-encoder), and the thread counts torch and FAISS use while
+# serving. Backends:
+# - torch:    the plain PyTorch model (default)
+# - int8:     PyTorch with every Linear layer dynamically quantized to int8
+#             weights; no extra dependency
+# - onnx:     ONNX Runtime through sentence-transformers (needs optimum and
+#             onnxruntime); LLM_ONNX_FILE selects a file of the model repo,
+#             e.g. the pre-quantized onnx/model_qint8_avx512_vnni.onnx
+# - openvino: OpenVINO through sentence-transformers (needs optimum-intel)
+# scripts/bench_backends.py checks a backend's parity with torch and its
+# speed before it is switched on.
+
+import importlib.util
+import os
+import sys
+
+import faiss
+
+from app.concurrency import POOL_SIZES, add_thread_initializer
+
+BACKENDS = ("torch", "int8", "onnx", "openvino")
+DEFAULT_BACKEND = os.environ.get("LLM_INFERENCE_BACKEND", "torch")
+ONNX_FILE = os.environ.get("LLM_ONNX_FILE")
+# Modules each runtime backend needs on top of sentence-transformers
+BACKEND_MODULES = {"onnx": ("optimum", "onnxruntime"), "openvino": ("optimum.intel", "openvino")}
+
+# Serving threads (0: derived from the CPU count, see configure_threads)
+TORCH_THREADS = int(os.environ.get("LLM_TORCH_THREADS", 0))
+FAISS_THREADS = int(os.environ.get("LLM_FAISS_THREADS", 0))
+
+_torch_threads = None
+_faiss_threads = None
+
+
+def model_id(name, backend):
+    """name plus the backend when it is not torch: vectors from different backends differ slightly."""
+    if backend == "torch":
+        return name
+    if backend == "onnx" and ONNX_FILE:
+        return f"{name}@{backend}:{ONNX_FILE}"
+    return f"{name}@{backend}"
+
+
+def check_backend(backend):
+    """Raise ValueError for an unknown backend and ImportError when its runtime is not installed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'; choose one of {', '.join(BACKENDS)}")
+    for module in BACKEND_MODULES.get(backend, ()):
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ModuleNotFoundError:
+            found = False
+        if not found:
+            raise ImportError(f"The {backend} backend needs {module}: pip install sentence-transformers[{backend}]")
+
+
+def _runtime_kwargs(backend):
+    if backend == "int8":
+        # Dynamically quantized layers only run on CPU
+        return {"device": "cpu"}
+    if backend == "torch":
+        return {}
+    kwargs = {"backend": backend}
+    if backend == "onnx" and ONNX_FILE:
+        kwargs["model_kwargs"] = {"file_name": ONNX_FILE}
+    return kwargs
+
+
+def _quantize(model):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _finish(model, backend):
+    if backend == "int8":
+        model = _quantize(model)
+    model.inference_backend = backend
+    _apply_torch_threads()
+    return model
+
+
+def load_sentence_transformer(name, backend=None):
+    """SentenceTransformer name (a hub id or a local path) with the given backend (default DEFAULT_BACKEND)."""
+    backend = backend or DEFAULT_BACKEND
+    check_backend(backend)
+    # Imported here: sentence_transformers pulls in torch, which alone takes seconds
+    from sentence_transformers import SentenceTransformer
+    return _finish(SentenceTransformer(name, **_runtime_kwargs(backend)), backend)
+
+
+def load_cross_encoder(name, backend=None):
+    """CrossEncoder name (a hub id or a local path) with the given backend (default DEFAULT_BACKEND)."""
+    backend = backend or DEFAULT_BACKEND
+    check_backend(backend)
+    from sentence_transformers import CrossEncoder
+    return _finish(CrossEncoder(name, **_runtime_kwargs(backend)), backend)
+
+
+def _apply_torch_threads():
+    if _torch_threads is not None and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(_torch_threads)
+
+
+def _apply_faiss_threads():
+    # libgomp keeps the count per thread, so every thread that searches sets it
+    if _faiss_threads is not None:
+        faiss.omp_set_num_threads(_faiss_threads)
+
+
+add_thread_initializer(_apply_faiss_threads)
+
+
+def configure_threads(torch_threads=None, faiss_threads=None):
+    """
+    Split the CPU between model forward passes and FAISS searches so they do
+    not oversubscribe it. By default torch gets half the cores (the encode
+    and rerank batchers each run one forward pass at a time) and FAISS
+    OpenMP the other half, shared by the inference pool's threads, which
+    search concurrently. The FAISS count is applied by each pool worker and
+    batcher thread as it starts, so this is called before they start: by the
+    API at startup. Scripts keep the libraries' defaults (all cores).
+    Returns the chosen counts.
+    """
+    global _torch_threads, _faiss_threads
+    cpus = os.cpu_count() or 1
+    _torch_threads = torch_threads or TORCH_THREADS or max(1, cpus // 2)
+    _faiss_threads = faiss_threads or FAISS_THREADS or max(1, (cpus - _torch_threads) // POOL_SIZES["inference"])
+    _apply_faiss_threads()
+    # Models loaded later apply the torch count when they are built
+    _apply_torch_threads()
+    return {"torch": _torch_threads, "faiss": _faiss_threads}
+
+
+def thread_counts():
+    """Thread counts as seen by the calling thread (run it on a pool worker to see what searches use)."""
+    return {"torch": _torch_threads, "faiss": faiss.omp_get_max_threads()}
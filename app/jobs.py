@@ -0,0 +1,66 @@
+# app/jobs.py
+#
+# In-memory registry of background jobs (document ingestion for now). Jobs are
+# plain dicts so they can be returned by the API as they are; updates come
+# from worker threads, hence the lock.
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Uploads: queued -> parsing -> embedding -> indexed, or duplicate / failed
+# Rebuilds: queued -> building -> indexed, or failed
+JOB_STATES = ("queued", "parsing", "embedding", "building", "indexed", "duplicate", "failed")
+FINISHED_STATES = ("indexed", "duplicate", "failed")
+
+
+class JobRegistry:
+    """Keeps the last max_jobs jobs; finished ones are dropped first when it is full."""
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, kind, **fields):
+        now = time.time()
+        job = {"job_id": uuid.uuid4().hex, "kind": kind, "status": "queued", "error": None,
+               "created_at": now, "updated_at": now, **fields}
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._evict()
+            return dict(job)
+
+    def update(self, job_id, **fields):
+        status = fields.get("status")
+        if status is not None and status not in JOB_STATES:
+            raise ValueError(f"Unknown job status: {status}")
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def find(self, **fields):
+        """Unfinished jobs whose fields match, oldest first."""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()
+                    if job["status"] not in FINISHED_STATES and all(job.get(k) == v for k, v in fields.items())]
+
+    def list(self, limit=50):
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())][:limit]
+
+    def _evict(self):
+        if len(self._jobs) <= self.max_jobs:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED_STATES]
+        for job_id in finished + list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            self._jobs.pop(job_id, None)
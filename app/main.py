@@ -1,6 +1,40 @@
-from fastapi import FastAPI
-from app.api import router as api_router
+import asyncio
+import os
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="LLM Query Processor")
+from fastapi import FastAPI, Response
+from app import metrics, profiling
+from app.api import router as api_router, warm_up
+from app.concurrency import shutdown_pools
+from app.inference import configure_threads
+
+
+@asynccontextmanager
+async def lifespan(app):
+    configure_threads()
+    # Warm up in the background so the server accepts connections (and answers
+    # /api/health/live) immediately; /api/health/ready flips once this is done
+    warmup_task = None
+    if os.environ.get("LLM_WARMUP_ON_STARTUP", "1") != "0":
+        warmup_task = asyncio.create_task(warm_up())
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    shutdown_pools()
+
+
+app = FastAPI(title="LLM Query Processor", lifespan=lifespan)
 
 app.include_router(api_router, prefix="/api")
+# Opt-in per-request profiles (LLM_PROFILE_TOKEN / LLM_PROFILE_SAMPLE_RATE); inside the
+# metrics middleware so profiles include the request's stage timings
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+# Request counts and latency per route, and a Server-Timing header with the pipeline stages
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text format; see app/metrics.py"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
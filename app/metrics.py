@@ -0,0 +1,253 @@
+# app/metrics.py
+#
+# Request and pipeline-stage metrics in the Prometheus text format, without
+# a client library. Counters and histograms are updated under one small
+# lock per metric (a perf_counter pair and a bisect per observation), and
+# values other modules already track (caches, batchers, the live index) are
+# read by callbacks only when /metrics is scraped, so instrumentation can
+# stay on in production. stage() also records each timed block in the
+# current request's timings, which MetricsMiddleware returns in a
+# Server-Timing header. LLM_METRICS=0 turns all of it off.
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("LLM_METRICS", "1") != "0"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers sub-millisecond parsing up to slow reranks and rebuilds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+# (stage, seconds) pairs of the request being handled; run_in_pool carries it to worker threads
+_timings = contextvars.ContextVar("llm_stage_timings", default=None)
+# (name, description) notes on how the request was served, e.g. ("cache", "hit")
+_notes = contextvars.ContextVar("llm_timing_notes", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        lines = self._header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Callback(_Metric):
+    """A gauge or counter read from fn() at scrape time: a number, or {label values tuple: number}."""
+
+    def __init__(self, name, help, fn, labels=(), type="gauge"):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self.type = type
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []  # e.g. nothing loaded yet
+        if value is None:
+            return []
+        items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        return self._header() + [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUESTS = Counter("llm_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+REQUEST_SECONDS = Histogram("llm_http_request_duration_seconds", "HTTP request latency until the response starts",
+                            ("route", "method"))
+STAGE_SECONDS = Histogram("llm_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",))
+STAGE_ERRORS = Counter("llm_stage_errors_total", "Exceptions raised inside a pipeline stage", ("stage",))
+
+
+@contextmanager
+def stage(name):
+    """Time a block as pipeline stage name: histogram, error count, and the request's Server-Timing."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+
+def request_timings():
+    """(stage, seconds) pairs recorded so far for the current request, or None outside a request."""
+    return _timings.get()
+
+
+def note(name, description):
+    """Tell how the current request was served (e.g. note("cache", "hit")); sent as a Server-Timing entry."""
+    notes = _notes.get()
+    if notes is not None:
+        notes.append((name, description))
+
+
+def request_notes():
+    """(name, description) notes of the current request, or None outside a request."""
+    return _notes.get()
+
+
+def server_timing(timings, total, notes=()):
+    """
+    Server-Timing header value: the notes (name;desc=description), then each
+    stage's total duration in ms in first-seen order, then the total.
+    """
+    merged = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};desc={description}" for name, description in notes]
+    parts += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    return ", ".join(parts + [f"total;dur={total * 1000:.2f}"])
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests per route and status, timing them, and
+    adding a Server-Timing header with the stages the request went through.
+    The route label is the matched path template (/api/jobs/{job_id}), so
+    label values stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        timings, notes = [], []
+        token, notes_token = _timings.set(timings), _notes.set(notes)
+        start = time.perf_counter()
+        started = False
+
+        async def send_with_timing(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                elapsed = time.perf_counter() - start
+                self._record(scope, message["status"], elapsed)
+                header = server_timing(timings, elapsed, notes)
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except BaseException:
+            if not started:
+                self._record(scope, 500, time.perf_counter() - start)
+            raise
+        finally:
+            _timings.reset(token)
+            _notes.reset(notes_token)
+
+    @staticmethod
+    def _route(scope):
+        route = scope.get("route")
+        template = getattr(route, "path_format", None) or getattr(route, "path", None)
+        if template is None:
+            return "unmatched"
+        # Routes of an included router may report their path without its
+        # prefix (/jobs/{job_id} for /api/jobs/abc); take it from the request
+        extra = scope["path"].rstrip("/").count("/") - template.rstrip("/").count("/")
+        if extra > 0:
+            template = "/".join(scope["path"].split("/")[:extra + 1]) + template
+        return template
+
+    @classmethod
+    def _record(cls, scope, status, seconds):
+        path = cls._route(scope)
+        REQUESTS.inc(route=path, method=scope["method"], status=str(status))
+        REQUEST_SECONDS.observe(seconds, route=path, method=scope["method"])
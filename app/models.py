@@ -0,0 +1,78 @@
+# app/models.py
+#
+# Small registry of lazily loaded models. Modules register a loader under a
+# name at import time (cheap); the model itself is only built the first time
+# get() is called, so importing the app or running the build script only pays
+# for the models it actually uses. With LLM_STUB_MODELS=1 (or use_stubs())
+# the models that have one come from app/stub_models.py instead: small
+# deterministic stand-ins for offline benchmarks and smoke tests.
+
+import os
+import threading
+import time
+
+_loaders = {}
+_models = {}
+_load_seconds = {}
+_locks = {}
+_registry_lock = threading.Lock()
+_use_stubs = os.environ.get("LLM_STUB_MODELS", "0") != "0"
+
+
+def register(name, loader):
+    """Register (or replace) the loader for a model; a loaded instance is dropped."""
+    with _registry_lock:
+        _loaders[name] = loader
+        _locks.setdefault(name, threading.Lock())
+        _models.pop(name, None)
+        _load_seconds.pop(name, None)
+
+
+def get(name):
+    """Return the model, loading it on first use. Safe to call from many threads."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name not in _loaders:
+        raise KeyError(f"No model registered under '{name}'")
+    with _locks[name]:
+        if name not in _models:
+            start = time.perf_counter()
+            _models[name] = _loader(name)()
+            _load_seconds[name] = time.perf_counter() - start
+            print(f"Loaded model '{name}' in {_load_seconds[name]:.2f}s")
+        return _models[name]
+
+
+def _loader(name):
+    if _use_stubs:
+        from app.stub_models import STUBS
+        if name in STUBS:
+            return STUBS[name]
+    return _loaders[name]
+
+
+def use_stubs(enabled=True):
+    """Switch to (or back from) the stub models; loaded models are dropped and rebuilt on next use."""
+    global _use_stubs
+    with _registry_lock:
+        _use_stubs = enabled
+        _models.clear()
+        _load_seconds.clear()
+
+
+def stubs_enabled():
+    return _use_stubs
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def registered():
+    return sorted(_loaders)
+
+
+def loaded():
+    """Load time in seconds of every model loaded so far."""
+    return dict(_load_seconds)
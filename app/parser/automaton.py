@@ -0,0 +1,99 @@
+# app/parser/automaton.py
+#
+# Aho-Corasick multi-pattern matcher: every pattern occurring in a text is
+# found in one pass over the text, however many patterns there are. Matching
+# is case-insensitive and by substring, like `pattern in text.lower()`. Uses
+# the pyahocorasick C extension when it is installed, and a pure-Python
+# automaton otherwise.
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class Automaton:
+    """Compiled set of patterns; search() returns the ids (list positions) of those occurring in a text."""
+
+    def __init__(self, patterns, native=None):
+        self.patterns = [p.lower() for p in patterns]
+        native = ahocorasick is not None if native is None else native
+        self._native = None
+        if native and self.patterns:
+            self._native = ahocorasick.Automaton()
+            for pid, pattern in enumerate(self.patterns):
+                # A pattern listed twice keeps every id
+                self._native.add_word(pattern, self._native.get(pattern, ()) + (pid,))
+            self._native.make_automaton()
+        else:
+            self._build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _build(self):
+        # Trie of goto dicts, then failure links and merged outputs breadth-first
+        goto = [{}]
+        out = [()]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] += (pid,)
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                out[nxt] += out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def finditer(self, text):
+        """(start, end, pattern id) of every occurrence in text, by end position; text is lowercased first."""
+        text = text.lower()
+        if self._native is not None:
+            for last, ids in self._native.iter(text):
+                for pid in ids:
+                    yield last + 1 - len(self.patterns[pid]), last + 1, pid
+            return
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            for pid in out[state]:
+                yield i + 1 - len(self.patterns[pid]), i + 1, pid
+
+    def search(self, text):
+        """Set of ids of the patterns occurring in text."""
+        text = text.lower()
+        if self._native is not None:
+            found = set()
+            for _, ids in self._native.iter(text):
+                found.update(ids)
+            return found
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            if out[state]:
+                found.update(out[state])
+        return found
@@ -0,0 +1,118 @@
+# app/parser/gazetteer.py
+#
+# Query parser for the insurance domain. The gazetteers in
+# app/data/gazetteers (procedures, cities, hospitals, ICD codes) are loaded
+# once into a single Aho-Corasick automaton, so a query is scanned once for
+# all of them whatever their size; ages and policy durations come from one
+# precompiled regex. Entries only match as whole words.
+
+import os
+import re
+
+from app import models
+from app.parser.automaton import Automaton
+
+GAZETTEER_DIR = os.environ.get("LLM_GAZETTEER_DIR", "app/data/gazetteers")
+# Output field -> (file, whether every match is kept or only the highest-priority one)
+GAZETTEERS = {
+    "procedure": ("procedures.txt", False),
+    "location": ("cities.txt", False),
+    "hospital": ("hospitals.txt", False),
+    "icd_codes": ("icd_codes.txt", True),
+}
+
+NUMBERS = re.compile(
+    r"(?P<age>\d{2})[- ]?year[- ]?old"
+    r"|(?P<months>\d+)[ -]?month[- ]?old insurance policy"
+)
+
+
+def read_gazetteer(path):
+    """(entry, value) pairs of a gazetteer file in priority order; value is the second column or the entry."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            entry, _, value = line.partition("\t")
+            entries.append((entry.strip(), value.strip() or entry.strip()))
+    return entries
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class QueryParser:
+    """Compiled gazetteers; parse() returns the structured insurance query."""
+
+    def __init__(self, gazetteers):
+        # gazetteers: field -> ([(entry, value), ...], keep_all)
+        patterns = []
+        self._meta = []  # per pattern id: (field, priority, entry, value)
+        self._keep_all = {}
+        for field, (entries, keep_all) in gazetteers.items():
+            self._keep_all[field] = keep_all
+            for priority, (entry, value) in enumerate(entries):
+                patterns.append(entry)
+                self._meta.append((field, priority, entry, value))
+        self.automaton = Automaton(patterns)
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = directory or GAZETTEER_DIR
+        gazetteers = {}
+        for field, (filename, keep_all) in GAZETTEERS.items():
+            path = os.path.join(directory, filename)
+            gazetteers[field] = (read_gazetteer(path) if os.path.exists(path) else [], keep_all)
+        return cls(gazetteers)
+
+    def _matches(self, text):
+        """Whole-word gazetteer matches of text as (start, end, pattern id)."""
+        n = len(text)
+        return [(start, end, pid) for start, end, pid in self.automaton.finditer(text)
+                if (start == 0 or not _is_word_char(text[start - 1])) and (end == n or not _is_word_char(text[end]))]
+
+    def parse(self, query):
+        text = query.lower()
+        age = None
+        policy_duration = None
+        for m in NUMBERS.finditer(text):
+            if m.group("age") and age is None:
+                age = int(m.group("age"))
+            elif m.group("months") and policy_duration is None:
+                policy_duration = int(m.group("months"))
+
+        best = {}
+        spans = {}
+        for start, end, pid in self._matches(text):
+            field, priority, entry, value = self._meta[pid]
+            if self._keep_all[field]:
+                spans.setdefault(field, []).append((start, end, entry, value))
+            elif field not in best or priority < best[field][0]:
+                best[field] = (priority, value)
+
+        codes = []
+        # Of overlapping codes ("M17" inside "M17.1") only the longest is kept
+        for start, end, entry, value in sorted(spans.get("icd_codes", []), key=lambda s: (s[0], -s[1])):
+            if codes and start < codes[-1][1]:
+                continue
+            codes.append((start, end, entry, value))
+
+        return {
+            "age": age,
+            "procedure": best["procedure"][1] if "procedure" in best else "unknown",
+            "location": best["location"][1] if "location" in best else "unknown",
+            "policy_duration_months": policy_duration,
+            "hospital": best["hospital"][1] if "hospital" in best else None,
+            "icd_codes": [{"code": entry, "description": value if value != entry else None}
+                          for _, _, entry, value in codes],
+        }
+
+
+models.register("gazetteer", QueryParser.load)
+
+
+def get_parser():
+    return models.get("gazetteer")
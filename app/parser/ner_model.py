@@ -1,31 +1,12 @@
 # app/parser/ner_model.py
 
-import re
+from app.parser.gazetteer import get_parser
 
 def extract_info(query: str, domain: str = "insurance") -> dict:
     if domain == "insurance":
-        # Extract age
-        age_match = re.search(r'(\d{2})[- ]?year[- ]?old', query.lower())
-        age = int(age_match.group(1)) if age_match else None
-
-        # Extract procedure (very basic for now)
-        procedures = ['knee surgery', 'heart surgery', 'hip replacement', 'bypass surgery']
-        procedure = next((p for p in procedures if p in query.lower()), 'unknown')
-
-        # Extract location
-        locations = ['Pune', 'Delhi', 'Mumbai', 'Bangalore', 'Chennai']
-        location = next((loc for loc in locations if loc.lower() in query.lower()), 'unknown')
-
-        # Extract policy duration
-        duration_match = re.search(r'(\d+)[ -]?month[- ]?old insurance policy', query.lower())
-        policy_duration = int(duration_match.group(1)) if duration_match else None
-
-        return {
-            "age": age,
-            "procedure": procedure,
-            "location": location,
-            "policy_duration_months": policy_duration
-        }
+        # Age, procedure, location, policy duration, hospital and ICD codes
+        # in one pass over the query (see app/parser/gazetteer.py)
+        return get_parser().parse(query)
     elif domain == "legal":
         # Placeholder for legal domain extraction logic
         # Example: extract parties, case type, date, etc.
@@ -38,3 +19,11 @@ def extract_info(query: str, domain: str = "insurance") -> dict:
         }
     else:
         raise ValueError(f"Unsupported domain: {domain}")
+
+def extract_info_batch(queries, domain: str = "insurance") -> list:
+    """extract_info for many queries, in order; repeated queries are parsed once."""
+    parsed = {}
+    for query in queries:
+        if query not in parsed:
+            parsed[query] = extract_info(query, domain=domain)
+    return [dict(parsed[query]) for query in queries]
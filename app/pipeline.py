@@ -0,0 +1,108 @@
+# app/pipeline.py
+#
+# Bulk query analysis for offline jobs (e.g. nightly claim processing). The
+# same steps as /api/analyze_query, but each stage runs once per chunk of
+# queries instead of once per query: the queries are parsed, their distinct
+# texts are encoded in one call, FAISS is searched with the whole query matrix
+# and the cross-encoder scores every (query, clause) pair of the chunk in one
+# call. A query that fails gets an error item; the rest of the batch goes on.
+
+import os
+from itertools import islice
+
+from app import metrics
+from app.cache import normalize_query
+from app.parser.ner_model import extract_info, extract_info_batch
+from app.reasoner.output_generator import format_output
+from app.retriever.embedder import embed_text
+from app.retriever.evaluator import evaluate
+from app.retriever.snapshots import Snapshot, current_snapshot, load_snapshot
+from app.retriever.rules import get_rules
+from app.retriever.vector_store import clause_entities, clause_matches, search_clauses_batch
+
+# Queries analyzed together: bigger chunks batch better, smaller ones stream sooner
+BATCH_CHUNK = int(os.environ.get("LLM_ANALYZE_BATCH_CHUNK", 256))
+
+
+def analyze_chunk(queries, snapshot, domain="insurance", start=0, **search_options):
+    """
+    Analyze queries against a loaded snapshot. Returns one item per query, in
+    order: {"index", "query", "result"} or {"index", "query", "error"}, where
+    index is the query's position plus start. search_options are passed on
+    to search_clauses_batch (top_k, candidates, rerank_depth, nprobe, ...).
+    """
+    items = [{"index": start + i, "query": q} for i, q in enumerate(queries)]
+    for item in items:
+        if not item["query"] or not item["query"].strip():
+            item["error"] = "Query is required"
+    parsed = [item for item in items if "error" not in item]
+    try:
+        with metrics.stage("extract_info"):
+            structured_queries = extract_info_batch([item["query"] for item in parsed], domain=domain)
+        for item, structured in zip(parsed, structured_queries):
+            item["structured"] = structured
+    except Exception:
+        # Parse one by one to find the queries that fail
+        for item in parsed:
+            try:
+                item["structured"] = extract_info(item["query"], domain=domain)
+            except Exception as e:
+                item["error"] = str(e)
+        parsed = [item for item in parsed if "error" not in item]
+
+    if parsed:
+        try:
+            # Repeated claim texts are encoded and searched once
+            texts = list(dict.fromkeys(normalize_query(item["query"]) for item in parsed))
+            with metrics.stage("embed"):
+                embeddings = embed_text(texts)
+            retrieved = search_clauses_batch(
+                embeddings, snapshot.index, snapshot.store, query_texts=texts,
+                with_scores=True, lexical=snapshot.lexical, **search_options,
+            )
+            by_text = dict(zip(texts, retrieved))
+            for item in parsed:
+                # Copies, so items sharing a text do not share result dicts
+                item["retrieved"] = [dict(r) for r in by_text[normalize_query(item["query"])]]
+        except Exception as e:
+            for item in parsed:
+                item["error"] = f"Retrieval failed: {e}"
+
+    for item in parsed:
+        if "error" in item:
+            continue
+        try:
+            clauses = [r["clause"] for r in item["retrieved"]]
+            entities = clause_entities(item["retrieved"], snapshot.store) if domain == "legal" else None
+            matches = clause_matches(item["retrieved"], snapshot.store, get_rules()) if domain == "insurance" else None
+            with metrics.stage("evaluate"):
+                evaluation = evaluate(item["structured"], clauses, domain=domain, entities=entities, matches=matches)
+            item["result"] = format_output(evaluation, item["structured"], retrieved=item["retrieved"])
+        except Exception as e:
+            item["error"] = str(e)
+
+    return [{"index": item["index"], "query": item["query"],
+             **({"error": item["error"]} if "error" in item else {"result": item["result"]})}
+            for item in items]
+
+
+def analyze_batch(queries, snapshot=None, domain="insurance", chunk_size=None, **search_options):
+    """
+    Yield analyze_chunk items for an iterable of queries, in order, one chunk
+    at a time. Without snapshot the published index snapshot is loaded, so a
+    script can run this without the API server.
+    """
+    if snapshot is None:
+        path = current_snapshot()
+        if path is None:
+            raise RuntimeError("No index snapshot published; run scripts/build_vector_index.py first")
+        snapshot = Snapshot(0, path, *load_snapshot(path))
+    chunk_size = chunk_size or BATCH_CHUNK
+    queries = iter(queries)
+    start = 0
+    while True:
+        chunk = list(islice(queries, chunk_size))
+        if not chunk:
+            return
+        yield from analyze_chunk(chunk, snapshot, domain, start, **search_options)
+        start += len(chunk)
@@ -0,0 +1,331 @@
+# app/profiling.py
+#
+# Opt-in profiles of single requests, for the one-off slow query that
+# aggregated metrics cannot explain. A request is profiled when it carries
+# "X-Profile: <LLM_PROFILE_TOKEN>" or is picked at LLM_PROFILE_SAMPLE_RATE.
+# While it runs, a sampler thread records the Python stacks of the threads
+# working for it: the event loop around its synchronous glue (attach()),
+# the inference workers running its run_in_pool calls (search_clauses,
+# evaluate and spaCy) and the micro-batcher threads running batches that
+# hold its items (the embedder and cross-encoder calls, shared with the
+# requests batched alongside). With LLM_PROFILE_ALLOCATIONS, tracemalloc
+# also runs for the request and the allocations it left behind are listed
+# by source line (tracemalloc is process-wide, so concurrent requests
+# count too). Each profile is saved under LLM_PROFILE_DIR as a JSON
+# summary and a collapsed-stack file for flame graph tools, and served by
+# /api/admin/profiles. With neither a token nor a sample rate set, the
+# middleware is not installed and the hooks are skipped.
+
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from app.metrics import request_notes, request_timings
+
+TOKEN = os.environ.get("LLM_PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.environ.get("LLM_PROFILE_SAMPLE_RATE", 0))
+ENABLED = bool(TOKEN) or SAMPLE_RATE > 0
+INTERVAL_MS = float(os.environ.get("LLM_PROFILE_INTERVAL_MS", 1))
+ALLOCATIONS = os.environ.get("LLM_PROFILE_ALLOCATIONS", "1") != "0"
+# Profiles running at once; further requests are not profiled, bounding the overhead
+MAX_ACTIVE = int(os.environ.get("LLM_PROFILE_MAX_ACTIVE", 2))
+PROFILE_DIR = os.environ.get("LLM_PROFILE_DIR", "app/data/profiles")
+KEEP = int(os.environ.get("LLM_PROFILE_KEEP", 100))
+HEADER = "x-profile"
+# Requests never profiled: reading profiles and scraping metrics
+SKIP_PATHS = ("/api/admin/profiles", "/metrics")
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 30
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+_current = contextvars.ContextVar("llm_profile", default=None)
+_active = []
+_active_lock = threading.Condition()
+_sampler = None
+_tracing = 0
+_switch_interval = None
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    """Samples and allocation baseline of one request."""
+
+    def __init__(self, method, path, trigger):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.created = time.time()
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self._threads = {}  # ident -> nesting depth of attach()
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    def enter(self, ident):
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def exit(self, ident):
+        with self._lock:
+            depth = self._threads.pop(ident, 1) - 1
+            if depth:
+                self._threads[ident] = depth
+
+    def sample(self, frames, names):
+        with self._lock:
+            idents = list(self._threads)
+        for ident in idents:
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def summary(self, status, seconds, timings, notes, allocations):
+        self_samples, total_samples, threads = Counter(), Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            threads[frames[0]] += count
+            self_samples[frames[-1]] += count
+            for name in set(frames[1:]):
+                total_samples[name] += count
+        return {
+            "id": self.id, "created": self.created, "method": self.method, "path": self.path,
+            "trigger": self.trigger, "status": status, "duration_ms": seconds * 1000,
+            "interval_ms": INTERVAL_MS, "samples": self.samples, "threads": dict(threads),
+            "stages": [{"stage": name, "ms": s * 1000} for name, s in timings],
+            # e.g. {"cache": "hit"}: why a request has no pipeline stages
+            "notes": dict(notes),
+            # Where the time went: functions by samples on top of the stack, then by samples anywhere in it
+            "top_functions": [{"function": name, "self_samples": self_samples[name], "total_samples": total_samples[name]}
+                              for name in sorted(total_samples, key=lambda n: (self_samples[n], total_samples[n]),
+                                                 reverse=True)[:TOP_FUNCTIONS]],
+            "allocations": allocations,
+        }
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def attach(*profiles):
+    """Count the current thread's stacks in profiles (default: the current request's) while the block runs."""
+    profiles = [p for p in profiles if p is not None] if profiles else [p for p in (_current.get(),) if p]
+    if not profiles:
+        yield
+        return
+    ident = threading.get_ident()
+    for profile in profiles:
+        profile.enter(ident)
+    try:
+        yield
+    finally:
+        for profile in profiles:
+            profile.exit(ident)
+
+
+def attached(fn):
+    """fn, run attached to the current request's profile when there is one (for work handed to another thread)."""
+    profile = _current.get()
+    if profile is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with attach(profile):
+            return fn(*args, **kwargs)
+    return run
+
+
+def _sample_forever():
+    interval = INTERVAL_MS / 1000
+    me = threading.get_ident()
+    while True:
+        with _active_lock:
+            while not _active:
+                _active_lock.wait()
+            profiles = list(_active)
+        frames = sys._current_frames()
+        frames.pop(me, None)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for profile in profiles:
+            profile.sample(frames, names)
+        time.sleep(interval)
+
+
+def _start_tracing():
+    global _tracing
+    with _active_lock:
+        _tracing += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            return None
+    # Already tracing for another profile: this one's allocations are the difference
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracing(baseline):
+    global _tracing
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+    _, peak = tracemalloc.get_traced_memory()
+    with _active_lock:
+        _tracing -= 1
+        if not _tracing:
+            tracemalloc.stop()
+    if baseline is not None:
+        stats = [(s.traceback, s.size_diff, s.count_diff)
+                 for s in snapshot.compare_to(baseline.filter_traces(ignore), "lineno")]
+    else:
+        stats = [(s.traceback, s.size, s.count) for s in snapshot.statistics("lineno")]
+    top = [{"location": str(where), "size_diff": size, "count_diff": count}
+           for where, size, count in stats if size > 0][:TOP_ALLOCATIONS]
+    return {"retained_bytes": sum(size for _, size, _ in stats), "peak_traced_bytes": peak, "top": top}
+
+
+def start(method, path, trigger):
+    """A running Profile for a request, or None when MAX_ACTIVE profiles are already running."""
+    global _sampler, _switch_interval
+    profile = Profile(method, path, trigger)
+    with _active_lock:
+        if len(_active) >= MAX_ACTIVE:
+            return None
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_forever, name="llm-profiler", daemon=True)
+            _sampler.start()
+        if not _active:
+            # Busy threads hand over the GIL every switch interval (5 ms by
+            # default); the sampler needs it at least once per sampling interval
+            _switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_switch_interval, INTERVAL_MS / 2000))
+        _active.append(profile)
+        _active_lock.notify()
+    if ALLOCATIONS:
+        profile._baseline = _start_tracing()
+    return profile
+
+
+def finish(profile, status, timings, notes=()):
+    """Stop sampling profile and save it; returns its summary."""
+    seconds = time.perf_counter() - profile.started
+    with _active_lock:
+        _active.remove(profile)
+        if not _active:
+            sys.setswitchinterval(_switch_interval)
+    allocations = _stop_tracing(profile._baseline) if ALLOCATIONS else None
+    summary = profile.summary(status, seconds, timings, notes, allocations)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile.id}.collapsed"), "w", encoding="utf-8") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in profile.stacks.most_common())
+    # The summary goes last: list_profiles() only shows complete profiles
+    with open(os.path.join(PROFILE_DIR, f"{profile.id}.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f)
+    _prune()
+    return summary
+
+
+def _prune():
+    names = [n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")]
+    if len(names) <= KEEP:
+        return
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)))
+    for name in names[:len(names) - KEEP]:
+        for suffix in (".json", ".collapsed"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-len(".json")] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=50):
+    """Summaries (without stacks and allocations) of the saved profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")),
+                   key=lambda n: os.path.getmtime(os.path.join(PROFILE_DIR, n)), reverse=True)
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue  # pruned or being written meanwhile
+        profiles.append({k: summary[k] for k in ("id", "created", "method", "path", "trigger", "status",
+                                                  "duration_ms", "samples")})
+    return profiles
+
+
+def profile_path(profile_id, kind="json"):
+    """Path of a saved profile's summary ("json") or collapsed stacks ("collapsed"), or None."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
+
+
+def _trigger(scope):
+    if TOKEN:
+        for name, value in scope["headers"]:
+            # Compared as bytes (compare_digest rejects non-ASCII str); a wrong
+            # token is ignored and the request may still be sampled
+            if name == HEADER.encode("latin-1") and hmac.compare_digest(value, TOKEN.encode()):
+                return "header"
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests picked by _trigger; the response names its profile in X-Profile-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(SKIP_PATHS):
+            await self.app(scope, receive, send)
+            return
+        trigger = _trigger(scope)
+        profile = start(scope["method"], scope["path"], trigger) if trigger else None
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode("latin-1"))]}
+            await send(message)
+
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current.reset(token)
+            # The response has been sent; snapshot and files are written off the event loop
+            await asyncio.to_thread(finish, profile, status, list(request_timings() or []),
+                                    list(request_notes() or []))
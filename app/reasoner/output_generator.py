@@ -1,6 +1,6 @@
 # app/reasoner/output_generator.py
 
-def format_output(evaluation, structured_query):
+def format_output(evaluation, structured_query, retrieved=None):
     output = {
         "input": structured_query,
         "decision": evaluation["decision"],
@@ -17,4 +17,11 @@ def format_output(evaluation, structured_query):
         output["jurisdiction"] = evaluation["jurisdiction"]
     if "dates" in evaluation:
         output["dates"] = evaluation["dates"]
+    # Every retrieved clause with its FAISS distance, lexical and rerank scores, so
+    # clients can apply their own relevance thresholds
+    if retrieved is not None:
+        output["retrieved_clauses"] = retrieved
+        # Document, section and chunk text of the clauses the decision is based on
+        used = set(evaluation["clauses"])
+        output["clause_details"] = [r for r in retrieved if r["clause"] in used]
     return output
@@ -0,0 +1,149 @@
+# app/retriever/batcher.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app import metrics, profiling
+from app.concurrency import init_thread
+
+# Defaults for every batcher; each instance can override them
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get("LLM_BATCH_MAX_SIZE", 32))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("LLM_BATCH_MAX_WAIT_MS", 5))
+
+BATCH_SECONDS = metrics.Histogram("llm_batch_duration_seconds", "Time to run one micro-batch", ("batcher",))
+BATCH_ITEMS = metrics.Histogram("llm_batch_items", "Items per micro-batch", ("batcher",),
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+QUEUE_WAIT_SECONDS = metrics.Histogram("llm_batch_queue_wait_seconds", "Time a submission waited for its batch",
+                                       ("batcher",))
+
+
+class MicroBatcher:
+    """
+    Collects work submitted concurrently from many threads and runs it through
+    fn as one batch. A batch is dispatched when max_batch_size items are queued
+    or max_wait_ms after its first item arrived, whichever comes first.
+    fn takes a list of items and returns a sequence of results in the same order.
+    """
+
+    def __init__(self, fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, name="batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._items = 0
+        self._max_batch = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, item):
+        """Queue one item; the Future resolves to its result."""
+        future = Future()
+        self._enqueue([item], future, single=True)
+        return future
+
+    def submit_many(self, items):
+        """Queue several items that must stay in one batch; the Future resolves to a list."""
+        future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        self._enqueue(list(items), future, single=False)
+        return future
+
+    def __call__(self, items):
+        """Blocking helper so a batcher can stand in for fn (e.g. a scorer in search_clauses)."""
+        return self.submit_many(items).result()
+
+    def _enqueue(self, items, future, single):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"llm-{self.name}", daemon=True)
+                    self._thread.start()
+        # Profiled requests also sample the batcher thread while it runs a batch holding their items
+        profile = profiling.current() if profiling.ENABLED else None
+        self._queue.put((items, future, single, time.perf_counter(), profile))
+
+    def _collect(self):
+        entries = [self._queue.get()]
+        size = len(entries[0][0])
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            entries.append(entry)
+            size += len(entry[0])
+        return entries, size
+
+    def _run(self):
+        init_thread()
+        while True:
+            entries, _ = self._collect()
+            # Drop submissions whose caller gave up (e.g. a cancelled request); the
+            # rest can no longer be cancelled, so setting their results cannot fail
+            entries = [entry for entry in entries if entry[1].set_running_or_notify_cancel()]
+            if not entries:
+                continue
+            size = sum(len(entry[0]) for entry in entries)
+            started = time.perf_counter()
+            self._record(entries, size, started)
+            batch = [item for items, _, _, _, _ in entries for item in items]
+            try:
+                with profiling.attach(*(entry[4] for entry in entries)):
+                    results = self.fn(batch)
+                if len(results) != len(batch):
+                    raise ValueError(f"{self.name} batch returned {len(results)} results for {len(batch)} items")
+                offset = 0
+                for items, future, single, _, _ in entries:
+                    chunk = results[offset:offset + len(items)]
+                    offset += len(items)
+                    future.set_result(chunk[0] if single else chunk)
+            except Exception as e:
+                # Every submission not answered yet gets the error; the thread keeps serving
+                for _, future, _, _, _ in entries:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                BATCH_SECONDS.observe(time.perf_counter() - started, batcher=self.name)
+
+    def _record(self, entries, size, started):
+        waits = [started - entry[3] for entry in entries]
+        BATCH_ITEMS.observe(size, batcher=self.name)
+        for wait in waits:
+            QUEUE_WAIT_SECONDS.observe(wait, batcher=self.name)
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(entries)
+            self._items += size
+            self._max_batch = max(self._max_batch, size)
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self._batches,
+                "requests": self._requests,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "largest_batch": self._max_batch,
+                "avg_queue_wait_ms": 1000 * self._wait_total / self._requests if self._requests else 0.0,
+                "max_queue_wait_ms": 1000 * self._wait_max,
+                "queued": self._queue.qsize(),
+            }
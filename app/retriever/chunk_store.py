@@ -0,0 +1,326 @@
+# app/retriever/chunk_store.py
+
+import json
+import mmap
+import os
+import pickle
+import re
+import shutil
+import threading
+from array import array
+
+import numpy as np
+
+# One fixed-size row per chunk; the chunk text lives in text.bin at [text_start, text_end)
+ROW_DTYPE = np.dtype([
+    ("doc_id", "<i4"),       # index into strings.json "documents"
+    ("section_id", "<i4"),   # index into strings.json "sections", -1 when there is no header
+    ("char_start", "<i8"),   # character offsets of the chunk in its source document (-1 if unknown)
+    ("char_end", "<i8"),
+    ("text_start", "<i8"),   # byte offsets of the UTF-8 text in text.bin
+    ("text_end", "<i8"),
+])
+
+ROWS_FILE = "rows.bin"
+TEXT_FILE = "text.bin"
+STRINGS_FILE = "strings.json"
+# Optional legal entities of each chunk: (label id, string id) int32 pairs in
+# entities.bin, chunk i's pairs at [offsets[i], offsets[i + 1]); the strings
+# are interned in strings.json "entities" (string id -1 means no text)
+ENTITIES_FILE = "entities.bin"
+ENTITY_OFFSETS_FILE = "entity_offsets.bin"
+ENTITY_LABELS = ("PERSON", "ORG", "DATE", "GPE", "JURISDICTION", "JURISDICTION_MENTION")
+# Context runs: chunk ids where a run of consecutive chunks of one document
+# section starts, plus the chunk count. Context windows never leave a run,
+# and within a run text.bin holds the chunks joined by CONTEXT_SEPARATOR, so
+# a window's text is one contiguous slice of it
+RUNS_FILE = "runs.bin"
+CONTEXT_SEPARATOR = "\n---\n"
+SEPARATOR_BYTES = CONTEXT_SEPARATOR.encode("utf-8")
+
+# "file :: [SECTION] chunk text" entries of the old metadata.pkl
+LEGACY_ENTRY = re.compile(r"^(.*?) :: (?:\[(.*?)\] )?(.*)$", re.DOTALL)
+
+
+class ChunkStore:
+    """
+    Read-only columnar chunk store. Rows and text are memory-mapped on first
+    access, so opening is instant and the pages are shared by every worker
+    process that maps the same files. Chunk ids are FAISS vector positions.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rows = None
+        self._text = None
+        self._documents = None
+        self._sections = None
+        self._doc_lookup = None
+        self._entity_pairs = None
+        self._entity_offsets = None
+        self._entity_strings = None
+        self._runs = None
+        self._joined = False
+
+    def _open(self):
+        with self._lock:
+            if self._rows is not None:
+                return
+            rows_path = os.path.join(self.path, ROWS_FILE)
+            text_path = os.path.join(self.path, TEXT_FILE)
+            with open(os.path.join(self.path, STRINGS_FILE), "r", encoding="utf-8") as f:
+                strings = json.load(f)
+            self._documents = strings["documents"]
+            self._sections = strings["sections"]
+            self._doc_lookup = {name: i for i, name in enumerate(self._documents)}
+            self._entity_strings = strings.get("entities")
+            # Stores written before context runs have nothing between their chunks
+            self._joined = strings.get("context_separator") == CONTEXT_SEPARATOR
+            # mmap cannot map empty files
+            if os.path.getsize(text_path):
+                with open(text_path, "rb") as f:
+                    self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._text = b""
+            if os.path.getsize(rows_path):
+                self._rows = np.memmap(rows_path, dtype=ROW_DTYPE, mode="r")
+            else:
+                self._rows = np.zeros(0, dtype=ROW_DTYPE)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._open()
+        return self._rows
+
+    @property
+    def documents(self):
+        if self._rows is None:
+            self._open()
+        return self._documents
+
+    def __len__(self):
+        return len(self.rows)
+
+    def close(self):
+        """Unmap the files (they are mapped again if the store is used after this)."""
+        with self._lock:
+            if isinstance(self._text, mmap.mmap):
+                self._text.close()
+            self._rows = None
+            self._text = None
+            self._entity_pairs = None
+            self._entity_offsets = None
+            self._runs = None
+
+    @property
+    def has_entities(self):
+        """Whether entities were extracted for every chunk when the store was written."""
+        if self._rows is None:
+            self._open()
+        return self._entity_strings is not None
+
+    def entities(self, i):
+        """Legal entity (label, text) pairs of chunk i, in text order."""
+        if self._rows is None:
+            self._open()
+        if self._entity_offsets is None:
+            with self._lock:
+                offsets = np.fromfile(os.path.join(self.path, ENTITY_OFFSETS_FILE), dtype=np.int64)
+                pairs_path = os.path.join(self.path, ENTITIES_FILE)
+                self._entity_pairs = (np.memmap(pairs_path, dtype=np.int32, mode="r").reshape(-1, 2)
+                                      if os.path.getsize(pairs_path) else np.zeros((0, 2), dtype=np.int32))
+                self._entity_offsets = offsets
+        start, end = self._entity_offsets[i], self._entity_offsets[i + 1]
+        return [(ENTITY_LABELS[label], self._entity_strings[string] if string >= 0 else None)
+                for label, string in self._entity_pairs[start:end].tolist()]
+
+    @property
+    def runs(self):
+        """Start chunk ids of the context runs, followed by the chunk count."""
+        if self._runs is None:
+            rows = self.rows
+            runs_path = os.path.join(self.path, RUNS_FILE)
+            if os.path.exists(runs_path):
+                runs = np.fromfile(runs_path, dtype=np.int64)
+            else:
+                # Older stores: a run ends wherever the document or section changes
+                changes = (rows["doc_id"][1:] != rows["doc_id"][:-1]) | (rows["section_id"][1:] != rows["section_id"][:-1])
+                runs = np.concatenate(([0], np.flatnonzero(changes) + 1, [len(rows)])).astype(np.int64)
+            self._runs = runs
+        return self._runs
+
+    def window(self, i, radius):
+        """Chunk ids [start, end) of the context window of chunk i: up to radius chunks each side, within its run."""
+        runs = self.runs
+        r = int(np.searchsorted(runs, i, side="right")) - 1
+        return max(int(runs[r]), i - radius), min(int(runs[r + 1]), i + radius + 1)
+
+    def window_text(self, start, end):
+        """Text of the chunks [start, end) of one run, joined by CONTEXT_SEPARATOR."""
+        rows = self.rows
+        if not self._joined:
+            return CONTEXT_SEPARATOR.join(self.text(i) for i in range(start, end))
+        with memoryview(self._text) as view:
+            # Decoded straight from the mapped file, without an intermediate bytes copy
+            return str(view[rows[start]["text_start"]:rows[end - 1]["text_end"]], "utf-8")
+
+    def text(self, i):
+        row = self.rows[i]
+        return self._text[row["text_start"]:row["text_end"]].decode("utf-8")
+
+    def document(self, i):
+        return self.documents[self.rows[i]["doc_id"]]
+
+    def section(self, i):
+        section_id = self.rows[i]["section_id"]
+        return self._sections[section_id] if section_id >= 0 else None
+
+    def chunk(self, i):
+        """All fields of one chunk as a dict."""
+        row = self.rows[i]
+        return {
+            "chunk_id": int(i),
+            "document": self._documents[row["doc_id"]],
+            "section": self._sections[row["section_id"]] if row["section_id"] >= 0 else None,
+            "char_start": int(row["char_start"]),
+            "char_end": int(row["char_end"]),
+            "text": self.text(i),
+        }
+
+    def positions(self, document):
+        """Chunk ids belonging to document, in order."""
+        if self._rows is None:
+            self._open()
+        doc_id = self._doc_lookup.get(document)
+        if doc_id is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.rows["doc_id"] == doc_id)
+
+
+class ChunkStoreWriter:
+    """
+    Streams chunks into a new store written next to path and swapped in by
+    close(). Rows are flushed in blocks so memory does not grow with the corpus.
+    """
+
+    FLUSH_ROWS = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self._text = open(os.path.join(self.tmp_path, TEXT_FILE), "wb")
+        self._rows_file = open(os.path.join(self.tmp_path, ROWS_FILE), "wb")
+        self._pending = []
+        self._documents = {}
+        self._sections = {}
+        self._offset = 0
+        self.count = 0
+        self._entities_file = open(os.path.join(self.tmp_path, ENTITIES_FILE), "wb")
+        self._entity_offsets = array("q", [0])
+        self._entity_strings = {}
+        # Entities are only kept when every chunk came with them
+        self._entities_complete = True
+        self._runs = array("q", [0])
+        self._run_key = None
+
+    def add(self, document, section, text, char_start=-1, char_end=-1, entities=None):
+        """Append one chunk and return its chunk id. entities: its (label, text) pairs, if extracted."""
+        if entities is None:
+            self._entities_complete = False
+        elif self._entities_complete:
+            pairs = [(ENTITY_LABELS.index(label),
+                      self._entity_strings.setdefault(value, len(self._entity_strings)) if value is not None else -1)
+                     for label, value in entities]
+            if pairs:
+                self._entities_file.write(np.array(pairs, dtype=np.int32).tobytes())
+            self._entity_offsets.append(self._entity_offsets[-1] + len(pairs))
+        doc_id = self._documents.setdefault(document, len(self._documents))
+        section_id = self._sections.setdefault(section, len(self._sections)) if section else -1
+        data = text.encode("utf-8")
+        if self.count and (doc_id, section_id) == self._run_key:
+            self._text.write(SEPARATOR_BYTES)
+            self._offset += len(SEPARATOR_BYTES)
+        elif self.count:
+            self._runs.append(self.count)
+        self._run_key = (doc_id, section_id)
+        self._text.write(data)
+        self._pending.append((doc_id, section_id, char_start, char_end, self._offset, self._offset + len(data)))
+        self._offset += len(data)
+        if len(self._pending) >= self.FLUSH_ROWS:
+            self._flush()
+        self.count += 1
+        return self.count - 1
+
+    def copy_from(self, store, positions):
+        """Append existing chunks of another store, keeping their fields."""
+        entities = store.has_entities
+        for i in positions:
+            row = store.rows[i]
+            self.add(store.document(i), store.section(i), store.text(i), int(row["char_start"]), int(row["char_end"]),
+                     store.entities(i) if entities else None)
+
+    def _flush(self):
+        if self._pending:
+            self._rows_file.write(np.array(self._pending, dtype=ROW_DTYPE).tobytes())
+            self._pending = []
+
+    def abort(self):
+        """Discard everything written so far, leaving the store at path untouched."""
+        self._text.close()
+        self._rows_file.close()
+        self._entities_file.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def close(self):
+        """Finish writing, replace the store at path and return it opened."""
+        self._flush()
+        self._text.close()
+        self._rows_file.close()
+        self._entities_file.close()
+        strings = {"documents": list(self._documents), "sections": list(self._sections),
+                   "context_separator": CONTEXT_SEPARATOR}
+        if self.count:
+            self._runs.append(self.count)
+            np.frombuffer(self._runs, dtype=np.int64).tofile(os.path.join(self.tmp_path, RUNS_FILE))
+        if self._entities_complete and self.count:
+            np.frombuffer(self._entity_offsets, dtype=np.int64).tofile(os.path.join(self.tmp_path, ENTITY_OFFSETS_FILE))
+            strings["entities"] = list(self._entity_strings)
+        else:
+            os.remove(os.path.join(self.tmp_path, ENTITIES_FILE))
+        with open(os.path.join(self.tmp_path, STRINGS_FILE), "w", encoding="utf-8") as f:
+            json.dump(strings, f)
+        old_path = self.path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(self.tmp_path, self.path)
+        # Readers that still map the old files keep them alive until they let go
+        shutil.rmtree(old_path, ignore_errors=True)
+        return ChunkStore(self.path)
+
+
+def open_chunk_store(path, legacy_metadata_path=None):
+    """Open the store at path, converting an old metadata.pkl once if that is all there is."""
+    if not os.path.exists(os.path.join(path, STRINGS_FILE)):
+        if legacy_metadata_path and os.path.exists(legacy_metadata_path):
+            return convert_legacy_metadata(legacy_metadata_path, path)
+        raise FileNotFoundError(f"No chunk store at {path}")
+    return ChunkStore(path)
+
+
+def convert_legacy_metadata(metadata_path, path):
+    with open(metadata_path, "rb") as f:
+        metadata = pickle.load(f)
+    writer = ChunkStoreWriter(path)
+    for entry in metadata:
+        match = LEGACY_ENTRY.match(entry)
+        if match:
+            writer.add(match.group(1), match.group(2), match.group(3))
+        else:
+            writer.add("", None, entry)
+    print(f"Converted {len(metadata)} entries of {metadata_path} into {path}")
+    return writer.close()
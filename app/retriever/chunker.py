@@ -1,72 +1,291 @@
 # app/retriever/chunker.py
+#
+# Streaming chunker. The source is a string or any iterable of text pieces
+# (file lines, PDF pages), read line by line, so memory stays flat however
+# large the document is. Lengths are measured in tokens of the embedding
+# model's tokenizer: text longer than the budget is cut at sentence or word
+# boundaries into pieces that overlap by a few tokens, instead of being
+# truncated by the model. Every chunk is an exact slice of the source text
+# and carries its character offsets.
 
+import os
 import re
+from collections import namedtuple
 
-def split_text_to_chunks(text, max_len=300, overlap=50, strategy="paragraph", context_window=0):
+from app.retriever.embedder import get_tokenizer
+
+# all-MiniLM-L6-v2 reads at most 256 tokens, two of them [CLS] and [SEP]
+CHUNK_MAX_TOKENS = int(os.environ.get("LLM_CHUNK_MAX_TOKENS", 254))
+# Tokens repeated at the start of the next piece when text is cut by the budget
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("LLM_CHUNK_OVERLAP_TOKENS", 32))
+# Lines longer than this (characters) are handed on in pieces cut at whitespace,
+# and sentences at the first line end past it, so no unit grows without bound
+MAX_UNIT_CHARS = 100_000
+
+# Lines in ALL CAPS or starting with 'section' are section headers
+HEADER_LINE = re.compile(r'^[A-Z\s\d:]+$')
+# Lines starting a numbered or titled clause start a new chunk in the section strategy
+CLAUSE_START = re.compile(r'^([A-Z][A-Z\s]+:|\d+\.|[IVX]+\.|Section \d+)')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+# Stand-in tokens when the embedding tokenizer cannot be loaded
+APPROX_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+Chunk = namedtuple("Chunk", ["section", "text", "start", "end"])
+
+_tokenizer_failed = False
+
+
+def token_offsets(text):
+    """(start, end) character offsets of the embedding tokenizer's tokens in text."""
+    global _tokenizer_failed
+    if not _tokenizer_failed:
+        try:
+            tokenizer = get_tokenizer()
+        except Exception as e:
+            print(f"Embedding tokenizer unavailable ({e}); approximating chunk lengths with word tokens")
+            _tokenizer_failed = True
+        else:
+            return tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                             verbose=False)["offset_mapping"]
+    return [m.span() for m in APPROX_TOKEN.finditer(text)]
+
+
+def count_tokens(text):
+    return len(token_offsets(text)) if text.strip() else 0
+
+
+def is_header(line):
+    return bool(HEADER_LINE.match(line)) or line.lower().startswith("section")
+
+
+def iter_lines(source):
+    """(line, start) for each line of source (a string or an iterable of text pieces); lines keep their newline."""
+    if isinstance(source, str):
+        source = (source,)
+    offset = 0
+    pending = ""
+    for piece in source:
+        pending += piece
+        pos = 0
+        while True:
+            newline = pending.find("\n", pos)
+            if newline < 0:
+                break
+            yield pending[pos:newline + 1], offset + pos
+            pos = newline + 1
+        while len(pending) - pos > MAX_UNIT_CHARS:
+            cut = pending.rfind(" ", pos, pos + MAX_UNIT_CHARS) + 1
+            if cut <= pos:
+                cut = pos + MAX_UNIT_CHARS
+            yield pending[pos:cut], offset + pos
+            pos = cut
+        offset += pos
+        pending = pending[pos:]
+    if pending:
+        yield pending, offset
+
+
+def _word_start(offsets, k):
+    """Whether token k starts a word (whitespace before it), so text can be cut there."""
+    return k == 0 or offsets[k][0] > offsets[k - 1][1]
+
+
+def _cut(text, offsets, i, j):
+    """Where to end a piece covering tokens [i, j): at a sentence end, else a word boundary, in its second half."""
+    words = [k for k in range(j, i + (j - i) // 2, -1) if _word_start(offsets, k)]
+    for k in words:
+        if text[offsets[k - 1][1] - 1] in ".!?;:":
+            return k
+    return words[0] if words else j
+
+
+def split_span(text, start, max_tokens, overlap, offsets=None):
+    """
+    Cut text (found at start in the source) into pieces of at most max_tokens
+    tokens, each repeating about overlap tokens of the previous one. Yields
+    (text, start, end) with source offsets.
     """
-    Split text into chunks using the specified strategy.
-    - strategy: 'paragraph', 'section', or 'sentence'
-    - context_window: number of neighboring chunks to include as context
-    Returns a list of (section_header, chunk_text) tuples.
+    offsets = token_offsets(text) if offsets is None else offsets
+    n = len(offsets)
+    i = 0
+    while i < n:
+        j = min(i + max_tokens, n)
+        if j < n:
+            j = _cut(text, offsets, i, j)
+        s, e = offsets[i][0], offsets[j - 1][1]
+        yield text[s:e], start + s, start + e
+        if j >= n:
+            return
+        i = max(j - overlap, i + 1)
+        while i < j and not _word_start(offsets, i):
+            i += 1
+
+
+def _emit(section, text, start, max_tokens, overlap):
+    """Chunks of one stripped span: itself when it fits, otherwise its split_span pieces."""
+    if len(text) <= max_tokens:
+        # Every token covers at least one character
+        yield Chunk(section, text, start, start + len(text))
+        return
+    offsets = token_offsets(text)
+    if len(offsets) <= max_tokens:
+        yield Chunk(section, text, start, start + len(text))
+        return
+    for piece, s, e in split_span(text, start, max_tokens, overlap, offsets):
+        yield Chunk(section, piece, s, e)
+
+
+def _pack(units, max_tokens, overlap):
+    """
+    Pack units (section, text, start, tokens, breaks) into chunks of at most
+    max_tokens tokens. Units are contiguous slices of the source, so a chunk
+    is their concatenation, stripped. A unit with breaks set (or a new
+    section) starts a new chunk; a full chunk passes its last units, up to
+    overlap tokens, on to the next one.
     """
-    import re
-    chunks = []
-    section_header = None
+    group, group_tokens, section = [], 0, None
+
+    def flush():
+        text = "".join(u[1] for u in group)
+        stripped = text.strip()
+        if stripped:
+            start = group[0][2] + len(text) - len(text.lstrip())
+            yield Chunk(section, stripped, start, start + len(stripped))
+
+    for unit in units:
+        unit_section, text, start, tokens, breaks = unit
+        if group and (breaks or unit_section != section):
+            yield from flush()
+            group, group_tokens = [], 0
+        section = unit_section
+        if tokens > max_tokens:
+            yield from flush()
+            group, group_tokens = [], 0
+            stripped = text.strip()
+            yield from _emit(section, stripped, start + len(text) - len(text.lstrip()), max_tokens, overlap)
+            continue
+        if group_tokens + tokens > max_tokens:
+            yield from flush()
+            carried, carried_tokens = [], 0
+            for u in reversed(group):
+                if carried_tokens + u[3] > min(overlap, max_tokens - tokens):
+                    break
+                carried.insert(0, u)
+                carried_tokens += u[3]
+            group, group_tokens = carried, carried_tokens
+        group.append(unit)
+        group_tokens += tokens
+    if group:
+        yield from flush()
+
+
+def _sentence_units(lines):
+    """Sentences as contiguous source slices (each with the whitespace after it)."""
+    parts, start, size = [], None, 0
+    for line, line_start in lines:
+        pos = 0
+        for m in SENTENCE_END.finditer(line):
+            if start is None:
+                start = line_start + pos
+            parts.append(line[pos:m.end()])
+            text = "".join(parts)
+            yield None, text, start, count_tokens(text), False
+            parts, start, size, pos = [], None, 0, m.end()
+        if pos < len(line):
+            if start is None:
+                start = line_start + pos
+            parts.append(line[pos:])
+            size += len(line) - pos
+            if size > MAX_UNIT_CHARS:
+                text = "".join(parts)
+                yield None, text, start, count_tokens(text), False
+                parts, start, size = [], None, 0
+    if parts:
+        text = "".join(parts)
+        yield None, text, start, count_tokens(text), False
+
 
+def _section_units(lines):
+    """Lines of each section; header lines set the section, numbered clauses start a new chunk."""
+    section = None
+    for line, start in lines:
+        stripped = line.strip()
+        if stripped and is_header(stripped):
+            section = stripped
+            continue
+        yield section, line, start, count_tokens(line), bool(CLAUSE_START.match(stripped))
+
+
+def iter_chunks(source, strategy="paragraph", max_tokens=None, overlap=None):
+    """
+    Yield Chunk(section, text, start, end) tuples of source, a string or an
+    iterable of text pieces, where source_text[start:end] == text.
+    - strategy 'paragraph': one chunk per non-empty line
+    - strategy 'sentence': sentences packed up to max_tokens
+    - strategy 'section': the lines of each section packed up to max_tokens
+    Section headers (ALL CAPS lines, or lines starting with 'section') are not
+    chunked themselves but set the section of the chunks after them ('sentence'
+    keeps them as text). Text over max_tokens (default CHUNK_MAX_TOKENS) is
+    cut into pieces overlapping by overlap tokens (default CHUNK_OVERLAP_TOKENS).
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap = CHUNK_OVERLAP_TOKENS if overlap is None else min(overlap, max_tokens // 2)
+    lines = iter_lines(source)
     if strategy == "paragraph":
-        paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-        for para in paragraphs:
-            # Detect section headers (e.g., lines in ALL CAPS or starting with 'SECTION')
-            if re.match(r'^[A-Z\s\d:]+$', para) or para.lower().startswith('section'):
-                section_header = para
-            else:
-                chunks.append((section_header, para))
+        section = None
+        for line, start in lines:
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if is_header(stripped):
+                section = stripped
+                continue
+            yield from _emit(section, stripped, start + len(line) - len(line.lstrip()), max_tokens, overlap)
     elif strategy == "section":
-        # Split on lines that look like section headers
-        raw_chunks = re.split(r'(?m)^([A-Z][A-Z\s]+:|\d+\.|[IVX]+\.|Section \d+)', text)
-        raw_chunks = [c.strip() for c in raw_chunks if c.strip()]
-        for chunk in raw_chunks:
-            if re.match(r'^[A-Z\s\d:]+$', chunk) or chunk.lower().startswith('section'):
-                section_header = chunk
-            else:
-                chunks.append((section_header, chunk))
+        yield from _pack(_section_units(lines), max_tokens, overlap)
     else:  # sentence
-        sentences = text.split('. ')
-        chunk = ""
-        for sentence in sentences:
-            if len(chunk) + len(sentence) <= max_len:
-                chunk += sentence + ". "
-            else:
-                chunks.append((section_header, chunk.strip()))
-                chunk = sentence + ". "
-        if chunk:
-            chunks.append((section_header, chunk.strip()))
-
-    # Add overlap and context window if needed (not implemented for section headers here)
-    return chunks
+        yield from _pack(_sentence_units(lines), max_tokens, overlap)
+
+
+def split_text_to_chunks(text, max_len=None, overlap=None, strategy="paragraph", context_window=0):
+    """
+    Split text into chunks using the specified strategy ('paragraph',
+    'section' or 'sentence'); see iter_chunks. max_len and overlap are in
+    tokens. context_window is kept for compatibility: neighbouring chunks are
+    added at query time (search_clauses). Returns a list of (section_header,
+    chunk_text) tuples.
+    """
+    return [(c.section, c.text) for c in iter_chunks(text, strategy, max_len, overlap)]
+
 
 if __name__ == "__main__":
-    # Unit tests for split_text_to_chunks
+    # Unit tests for the chunker
     sample_text = """Section 1\nThis is the first paragraph.\n\nSection 2\nThis is the second paragraph. It has two sentences.\n\nSection 3\nA short one."""
 
-    # Test paragraph strategy
-    chunks = split_text_to_chunks(sample_text, strategy="paragraph")
+    # Paragraph strategy: headers become sections, offsets point into the source
+    chunks = list(iter_chunks(sample_text, strategy="paragraph"))
     print("Paragraph chunks:", chunks)
-    assert len(chunks) == 6, f"Expected 6 paragraphs, got {len(chunks)}"
+    assert [c.section for c in chunks] == ["Section 1", "Section 2", "Section 3"], chunks
+    assert all(sample_text[c.start:c.end] == c.text for c in chunks), "Offsets must slice the source"
 
-    # Test section strategy
+    # Section strategy
     chunks = split_text_to_chunks(sample_text, strategy="section")
     print("Section chunks:", chunks)
-    assert any("Section 1" in c for c in chunks), "Section 1 should be in a chunk"
+    assert ("Section 2", "This is the second paragraph. It has two sentences.") in chunks, "Section chunking failed"
 
-    # Test sentence strategy
-    chunks = split_text_to_chunks(sample_text, strategy="sentence", max_len=50)
+    # Sentence strategy packs sentences up to the budget
+    chunks = list(iter_chunks(sample_text, strategy="sentence", max_tokens=12, overlap=0))
     print("Sentence chunks:", chunks)
-    assert any("first paragraph." in c for c in chunks), "Sentence chunking failed"
+    assert any("first paragraph." in c.text for c in chunks), "Sentence chunking failed"
+    assert all(count_tokens(c.text) <= 12 for c in chunks), "Chunks must fit the token budget"
 
-    # Test context window
-    chunks = split_text_to_chunks(sample_text, strategy="paragraph", context_window=1)
-    print("Paragraph chunks with context:", chunks)
-    assert all("Section" in c for c in chunks), "Context window should include section headers"
+    # Long text is cut into overlapping pieces within the budget, from any iterable of pieces
+    long_text = "Intro line.\n" + " ".join(f"Clause {i} covers knee surgery after {i} months." for i in range(200))
+    pieces = [long_text[i:i + 37] for i in range(0, len(long_text), 37)]
+    chunks = list(iter_chunks(pieces, strategy="paragraph", max_tokens=64, overlap=8))
+    print("Long paragraph:", len(chunks), "chunks")
+    assert len(chunks) > 2 and all(count_tokens(c.text) <= 64 for c in chunks), "Budget not applied"
+    assert all(long_text[c.start:c.end] == c.text for c in chunks), "Offsets must slice the source"
+    assert all(a.end > b.start for a, b in zip(chunks[1:-1], chunks[2:])), "Pieces should overlap"
 
     print("All tests passed.")
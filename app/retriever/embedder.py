@@ -1,8 +1,47 @@
 # app/retriever/embedder.py
 
-from sentence_transformers import SentenceTransformer
+import os
+from app import models
+from app.inference import DEFAULT_BACKEND, load_sentence_transformer, model_id
+from app.retriever.batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, MicroBatcher
 
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.environ.get("LLM_EMBEDDING_BACKEND", DEFAULT_BACKEND)
+# Identifies the vectors this model and backend produce (embedding cache key)
+EMBEDDING_MODEL_ID = model_id(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+
+def embedding_model_id():
+    """EMBEDDING_MODEL_ID, or the stub embedder's id while stub models are on."""
+    if models.stubs_enabled():
+        from app.stub_models import STUB_MODEL_ID
+        return STUB_MODEL_ID
+    return EMBEDDING_MODEL_ID
+
+def _load_model():
+    return load_sentence_transformer(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+
+models.register("embedder", _load_model)
+
+def get_model():
+    return models.get("embedder")
+
+def _load_tokenizer():
+    # Just the tokenizer (no torch), so parser processes can measure chunk lengths cheaply
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+
+models.register("tokenizer", _load_tokenizer)
+
+def get_tokenizer():
+    return models.get("tokenizer")
 
 def embed_text(texts: list[str]):
-    return model.encode(texts, show_progress_bar=False)
+    return get_model().encode(texts, show_progress_bar=False)
+
+# Query encodes from concurrent requests are coalesced into one forward pass
+encode_batcher = MicroBatcher(
+    embed_text,
+    max_batch_size=int(os.environ.get("LLM_ENCODE_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)),
+    max_wait_ms=float(os.environ.get("LLM_ENCODE_BATCH_WAIT_MS", DEFAULT_MAX_WAIT_MS)),
+    name="encode",
+)
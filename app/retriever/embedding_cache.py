@@ -0,0 +1,234 @@
+# app/retriever/embedding_cache.py
+#
+# On-disk cache of chunk embeddings, keyed by (model name, hash of the chunk
+# text), so a rebuild only encodes text the model has not seen before,
+# whatever changed in between (documents, chunking strategy, index type).
+# Each model has its own directory of immutable segments: a sorted array of
+# 16-byte text hashes and the matching float32 vectors, both .npy files that
+# are memory-mapped on open. Writers only ever add segments (written under a
+# temporary name and renamed), so several processes can share the cache;
+# small segments are merged when a writer closes, and gc() drops entries no
+# snapshot uses any more.
+
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+
+from app.retriever.embedder import embedding_model_id
+
+CACHE_DIR = os.environ.get("LLM_EMBEDDING_CACHE_DIR", "app/data/embeddings/cache")  # "" disables the cache
+# New entries buffered before they are written out as a segment
+FLUSH_ROWS = int(os.environ.get("LLM_EMBEDDING_CACHE_FLUSH_ROWS", 65536))
+# More segments than this are merged (smallest first) when a writer closes
+MAX_SEGMENTS = int(os.environ.get("LLM_EMBEDDING_CACHE_MAX_SEGMENTS", 8))
+# Vectors copied per step when segments are merged
+MERGE_BLOCK = 65536
+
+KEY_DTYPE = np.dtype("S16")
+KEYS_SUFFIX = ".keys.npy"
+VECTORS_SUFFIX = ".vectors.npy"
+
+
+def text_keys(texts):
+    """Cache keys (16-byte BLAKE2b hashes) of texts as a numpy array."""
+    return np.array([hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts], dtype=KEY_DTYPE)
+
+
+def model_dir(model_name, root=None):
+    return os.path.join(root or CACHE_DIR, re.sub(r"[^\w.-]+", "--", model_name))
+
+
+class _Segment:
+    def __init__(self, path, name):
+        self.name = name
+        self.keys = np.load(os.path.join(path, name + KEYS_SUFFIX), mmap_mode="r").view(np.ndarray)
+        self.vectors = np.load(os.path.join(path, name + VECTORS_SUFFIX), mmap_mode="r").view(np.ndarray)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _write_segment(path, keys, vectors):
+    """Write sorted keys and their vectors (an array, or a callable filling the output in blocks) as one segment."""
+    name = f"seg-{time.time_ns():x}-{os.getpid()}"
+    tmp = os.path.join(path, f".{name}.tmp.npy")
+    filled = isinstance(vectors, np.ndarray)
+    dim = vectors.shape[1] if filled else vectors.dim
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(keys), dim))
+    if filled:
+        out[:] = vectors
+    else:
+        vectors(out)
+    out.flush()
+    del out
+    os.replace(tmp, os.path.join(path, name + VECTORS_SUFFIX))
+    # The keys file goes last: a segment exists once its keys do
+    np.save(tmp, keys)
+    os.replace(tmp, os.path.join(path, name + KEYS_SUFFIX))
+    return name
+
+
+class _Gather:
+    """Fills a merged segment's vectors with rows (segment, row) of other segments, a block at a time."""
+
+    def __init__(self, segments, sources, rows):
+        self.segments = segments
+        self.sources = sources
+        self.rows = rows
+        self.dim = segments[0].vectors.shape[1]
+
+    def __call__(self, out):
+        for start in range(0, len(self.rows), MERGE_BLOCK):
+            sources = self.sources[start:start + MERGE_BLOCK]
+            rows = self.rows[start:start + MERGE_BLOCK]
+            for s, segment in enumerate(self.segments):
+                mask = sources == s
+                if mask.any():
+                    out[start + np.flatnonzero(mask)] = segment.vectors[rows[mask]]
+
+
+class EmbeddingCache:
+    """The cached embeddings of one model; see the module comment for the layout."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._segments = self._open_segments()
+        self._pending_keys = []
+        self._pending_vectors = []
+        self._pending_rows = 0
+        self._pending_lookup = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_model(cls, model_name, root=None):
+        return cls(model_dir(model_name, root))
+
+    def _open_segments(self):
+        segments = []
+        for filename in sorted(os.listdir(self.path)):
+            if filename.startswith("seg-") and filename.endswith(KEYS_SUFFIX):
+                try:
+                    segments.append(_Segment(self.path, filename[:-len(KEYS_SUFFIX)]))
+                except FileNotFoundError:
+                    pass  # merged away by another process since the listing
+        return segments
+
+    def __len__(self):
+        return sum(len(s) for s in self._segments) + self._pending_rows
+
+    def nbytes(self):
+        return sum(s.keys.nbytes + s.vectors.nbytes for s in self._segments)
+
+    def lookup(self, keys):
+        """(vectors, found): vectors holds the cached embedding of every found key (None when nothing is cached)."""
+        found = np.zeros(len(keys), dtype=bool)
+        vectors = None
+        for segment in self._segments:
+            if found.all():
+                break
+            todo = np.flatnonzero(~found)
+            pos = np.searchsorted(segment.keys, keys[todo])
+            hit = pos < len(segment)
+            hit[hit] = segment.keys[pos[hit]] == keys[todo[hit]]
+            if hit.any():
+                if vectors is None:
+                    vectors = np.zeros((len(keys), segment.vectors.shape[1]), dtype=np.float32)
+                vectors[todo[hit]] = segment.vectors[pos[hit]]
+                found[todo[hit]] = True
+        if self._pending_lookup and not found.all():
+            for i in np.flatnonzero(~found):
+                vector = self._pending_lookup.get(keys[i])
+                if vector is not None:
+                    if vectors is None:
+                        vectors = np.zeros((len(keys), len(vector)), dtype=np.float32)
+                    vectors[i] = vector
+                    found[i] = True
+        return vectors, found
+
+    def add(self, keys, vectors):
+        """Queue new entries; they are written out as a segment every FLUSH_ROWS entries and on close()."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._pending_keys.append(keys)
+        self._pending_vectors.append(vectors)
+        self._pending_rows += len(keys)
+        self._pending_lookup.update(zip(keys.tolist(), vectors))
+        if self._pending_rows >= FLUSH_ROWS:
+            self.flush()
+
+    def encode(self, texts, encode):
+        """Embeddings of texts (float32 matrix), calling encode(list of texts) only for the ones not cached."""
+        keys = text_keys(texts)
+        vectors, found = self.lookup(keys)
+        missing = np.flatnonzero(~found)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if len(missing):
+            # Repeated texts are encoded once
+            new_keys, first, inverse = np.unique(keys[missing], return_index=True, return_inverse=True)
+            fresh = np.asarray(encode([texts[i] for i in missing[first]]), dtype=np.float32)
+            if vectors is None:
+                vectors = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+            vectors[missing] = fresh[inverse.reshape(-1)]
+            self.add(new_keys, fresh)
+        return vectors
+
+    def flush(self):
+        if not self._pending_rows:
+            return
+        keys = np.concatenate(self._pending_keys)
+        vectors = np.concatenate(self._pending_vectors)
+        keys, first = np.unique(keys, return_index=True)
+        name = _write_segment(self.path, keys, vectors[first])
+        self._segments.append(_Segment(self.path, name))
+        self._pending_keys, self._pending_vectors, self._pending_rows = [], [], 0
+        self._pending_lookup = {}
+
+    def _rewrite(self, segments, keep=None):
+        """Replace segments by one holding their entries (deduplicated, and only keys in keep when given)."""
+        if segments:
+            keys = np.concatenate([s.keys for s in segments])
+            sources = np.repeat(np.arange(len(segments)), [len(s) for s in segments])
+            rows = np.concatenate([np.arange(len(s)) for s in segments])
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+            select = np.ones(len(keys), dtype=bool)
+            select[1:] = keys[1:] != keys[:-1]
+            if keep is not None:
+                select &= np.isin(keys, keep)
+            order = order[select]
+            if len(order):
+                name = _write_segment(self.path, keys[select], _Gather(segments, sources[order], rows[order]))
+                self._segments.append(_Segment(self.path, name))
+        for segment in segments:
+            self._segments.remove(segment)
+            for suffix in (KEYS_SUFFIX, VECTORS_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.path, segment.name + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        """Write pending entries and merge the smallest segments while there are more than MAX_SEGMENTS."""
+        self.flush()
+        if len(self._segments) > MAX_SEGMENTS:
+            smallest = sorted(self._segments, key=len)[:len(self._segments) - MAX_SEGMENTS + 1]
+            self._rewrite(smallest)
+
+    def gc(self, keep):
+        """Drop every entry whose key is not in keep (an array of text_keys), leaving one segment."""
+        self.flush()
+        before = len(self)
+        self._rewrite(list(self._segments), keep=np.unique(np.asarray(keep, dtype=KEY_DTYPE)))
+        return before - len(self)
+
+
+def open_embedding_cache(model_name=None):
+    """The cache of model_name (default: the embedding model and backend), or None when LLM_EMBEDDING_CACHE_DIR is empty."""
+    if not CACHE_DIR:
+        return None
+    return EmbeddingCache.for_model(model_name or embedding_model_id())
@@ -1,74 +1,101 @@
 # app/reasoner/evaluator.py
 import re
-import spacy
-nlp = spacy.load("en_core_web_sm")
+from app import metrics, models
+from app.retriever.rules import get_rules
 
-def evaluate(structured_query, clauses, domain="insurance"):
-    if domain == "insurance":
-        age = structured_query.get("age")
-        procedure = structured_query.get("procedure")
-        duration = structured_query.get("policy_duration_months")
+SPACY_MODEL = "en_core_web_sm"
+
+def _load_nlp():
+    import spacy
+    return spacy.load(SPACY_MODEL)
+
+# Only the legal domain needs spaCy; it is loaded on first use
+models.register("nlp", _load_nlp)
 
-        decision = "rejected"
-        amount = 0
-        matching_clauses = []
+def get_nlp():
+    return models.get("nlp")
 
-        for clause in clauses:
-            clause_text = clause.lower()
+# Entity labels kept for the legal domain, plus the jurisdiction fallbacks
+# found by keyword: "jurisdiction of <place>", or just a mention of it
+LEGAL_LABELS = ("PERSON", "ORG", "DATE", "GPE")
+JURISDICTION_OF = re.compile(r'jurisdiction of ([A-Za-z\s]+)', re.IGNORECASE)
+# Pipeline components that set entities; the rest are disabled while extracting,
+# except shared embedding layers they listen to (see _ner_pipes)
+NER_PIPES = ("ner", "entity_ruler")
+NER_BATCH_SIZE = 64
 
-            if "knee surgery" in clause_text and "6 months" in clause_text:
-                if duration and duration >= 6:
-                    decision = "approved"
-                    amount = 15000
-                    matching_clauses.append(clause)
-                else:
-                    matching_clauses.append(clause)
+def _entity_pairs(doc):
+    """(label, text) pairs of a parsed text, in order, with the jurisdiction keyword fallback last."""
+    pairs = [(ent.label_, ent.text) for ent in doc.ents if ent.label_ in LEGAL_LABELS]
+    if "jurisdiction" in doc.text.lower():
+        match = JURISDICTION_OF.search(doc.text)
+        pairs.append(("JURISDICTION", match.group(1).strip()) if match else ("JURISDICTION_MENTION", None))
+    return pairs
 
-            elif "emergency" in clause_text and "from day 1" in clause_text:
-                if "emergency" in procedure.lower():
-                    decision = "approved"
-                    amount = 10000
-                    matching_clauses.append(clause)
+def _ner_pipes(nlp):
+    """
+    NER_PIPES plus any shared tok2vec / transformer they listen to. The ner of
+    en_core_web_sm embeds on its own, so its tok2vec (the costliest component)
+    stays off; pipelines whose ner listens to a shared one keep it.
+    """
+    keep = set(NER_PIPES)
+    for name, pipe in nlp.pipeline:
+        if keep & set(getattr(pipe, "listening_components", ())):
+            keep.add(name)
+    return keep
 
-        return {
-            "decision": decision,
-            "amount": amount,
-            "clauses": matching_clauses
-        }
+def extract_entities(texts, batch_size=NER_BATCH_SIZE):
+    """Legal entity pairs of each text, parsed in batches with only the NER components enabled."""
+    nlp = get_nlp()
+    keep = _ner_pipes(nlp)
+    disable = [name for name in nlp.pipe_names if name not in keep]
+    with metrics.stage("ner"):
+        return [_entity_pairs(doc) for doc in nlp.pipe(texts, batch_size=batch_size, disable=disable)]
+
+def merge_legal_entities(clauses, entities):
+    """Legal evaluation of clauses from their entity pairs (a list of pair lists per clause)."""
+    parties = set()
+    organizations = set()
+    dates = set()
+    jurisdiction = None
+    for clause, chunks in zip(clauses, entities):
+        pairs = [pair for chunk in chunks for pair in chunk]
+        for label, text in pairs:
+            if label == "PERSON":
+                parties.add(text)
+            if label == "ORG":
+                organizations.add(text)
+            if label == "DATE":
+                dates.add(text)
+            if label == "GPE" and not jurisdiction:
+                jurisdiction = text
+        # Fallback: keyword matching for jurisdiction
+        if not jurisdiction:
+            places = [text for label, text in pairs if label == "JURISDICTION"]
+            if places:
+                jurisdiction = places[0]
+            elif any(label == "JURISDICTION_MENTION" for label, _ in pairs):
+                jurisdiction = clause
+    return {
+        "decision": "info_extracted",
+        "amount": None,
+        "clauses": clauses,
+        "parties": list(parties),
+        "organizations": list(organizations),
+        "dates": list(dates),
+        "jurisdiction": jurisdiction
+    }
+
+def evaluate(structured_query, clauses, domain="insurance", entities=None, matches=None):
+    if domain == "insurance":
+        # Rules come from the rules file, compiled once; matches are the
+        # clauses' phrase matches when the caller has them cached
+        return get_rules().evaluate(structured_query, clauses, matches)
     elif domain == "legal":
-        parties = set()
-        organizations = set()
-        dates = set()
-        jurisdiction = None
-        for clause in clauses:
-            # Use spaCy to extract person names, organizations, dates, and GPEs
-            doc = nlp(clause)
-            for ent in doc.ents:
-                if ent.label_ == "PERSON":
-                    parties.add(ent.text)
-                if ent.label_ == "ORG":
-                    organizations.add(ent.text)
-                if ent.label_ == "DATE":
-                    dates.add(ent.text)
-                if ent.label_ == "GPE" and not jurisdiction:
-                    jurisdiction = ent.text
-            # Fallback: keyword matching for jurisdiction
-            if not jurisdiction and "jurisdiction" in clause.lower():
-                # Try to extract the location after 'jurisdiction of'
-                import re
-                match = re.search(r'jurisdiction of ([A-Za-z\s]+)', clause, re.IGNORECASE)
-                if match:
-                    jurisdiction = match.group(1).strip()
-                else:
-                    jurisdiction = clause
-        return {
-            "decision": "info_extracted",
-            "amount": None,
-            "clauses": clauses,
-            "parties": list(parties),
-            "organizations": list(organizations),
-            "dates": list(dates),
-            "jurisdiction": jurisdiction
-        }
+        # Entities precomputed at index time (one list per chunk of each
+        # clause's window) make this a lookup; otherwise the clauses are parsed now
+        if entities is None:
+            entities = [[pairs] for pairs in extract_entities(clauses)]
+        return merge_legal_entities(clauses, entities)
     else:
         raise ValueError(f"Unsupported domain: {domain}")
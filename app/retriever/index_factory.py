@@ -0,0 +1,177 @@
+# app/retriever/index_factory.py
+
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Defaults used by scripts/build_vector_index.py (and so by /api/rebuild_index)
+INDEX_TYPE = os.environ.get("LLM_INDEX_TYPE", "flat")
+TRAIN_SIZE = int(os.environ.get("LLM_INDEX_TRAIN_SIZE", 100000))  # max vectors sampled to train IVF/PQ
+
+# FAISS wants roughly this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def default_params(index_type, n, dim):
+    """Reasonable parameters for n vectors of size dim; any of them can be overridden."""
+    params = {"type": index_type, "dim": dim}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        train_points = min(n, TRAIN_SIZE)
+        params["nlist"] = max(1, min(int(4 * math.sqrt(n)), train_points // MIN_POINTS_PER_CENTROID))
+        params["nprobe"] = min(params["nlist"], 8)
+        if index_type == "ivf_pq":
+            # 8 dims per sub-quantizer; fewer bits per code when there is little training data
+            params["pq_m"] = next(m for m in (dim // 8, dim // 4, dim // 2, dim) if m and dim % m == 0)
+            params["pq_nbits"] = max(1, min(8, int(math.log2(max(train_points // MIN_POINTS_PER_CENTROID, 2)))))
+    elif index_type == "hnsw":
+        params["hnsw_m"] = 32
+        params["ef_construction"] = 200
+        params["ef_search"] = 64
+    elif index_type != "flat":
+        raise ValueError(f"Unsupported index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+    return params
+
+
+def create_index(params):
+    """Create an empty (untrained) index from a params dict."""
+    dim = params["dim"]
+    index_type = params["type"]
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params["nlist"])
+    if index_type == "ivf_pq":
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, params["nlist"], params["pq_m"], params["pq_nbits"])
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+    raise ValueError(f"Unsupported index type: {index_type}")
+
+
+def train_index(index, embeddings, train_size=None, seed=0):
+    """Train IVF/PQ indexes on a random sample of at most train_size vectors. Returns the sample size."""
+    if index.is_trained:
+        return 0
+    train_size = min(train_size or TRAIN_SIZE, len(embeddings))
+    if train_size < len(embeddings):
+        rng = np.random.default_rng(seed)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), train_size, replace=False))]
+    else:
+        sample = embeddings
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return train_size
+
+
+def build_faiss_index(embeddings, index_type=None, train_size=None, **overrides):
+    """Build and fill an index of the given type. Returns (index, params)."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = embeddings.shape
+    params = default_params(index_type or INDEX_TYPE, n, dim)
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    index = create_index(params)
+    trained_on = train_index(index, embeddings, train_size)
+    if trained_on:
+        params["train_size"] = trained_on
+    apply_search_params(index, params)
+    index.add(embeddings)
+    params["ntotal"] = int(index.ntotal)
+    return index, params
+
+
+class IndexBuilder:
+    """
+    Fills an index from a stream of embedding batches. Flat and HNSW indexes
+    take vectors as they arrive; IVF/PQ indexes buffer the first train_size
+    vectors, train on them and then add everything else straight away, so
+    memory stays bounded whatever the corpus size. Because the corpus size is
+    not known up front, default IVF parameters are derived from the training
+    sample (or from expected_n when given).
+    """
+
+    def __init__(self, index_type=None, dim=None, train_size=None, expected_n=None, **overrides):
+        self.index_type = index_type or INDEX_TYPE
+        self.dim = dim
+        self.train_size = train_size or TRAIN_SIZE
+        self.expected_n = expected_n
+        self.overrides = {k: v for k, v in overrides.items() if v is not None}
+        self.index = None
+        self.params = None
+        self._buffer = []
+        self._buffered = 0
+
+    def _create(self, n):
+        self.params = default_params(self.index_type, n, self.dim)
+        self.params.update(self.overrides)
+        self.index = create_index(self.params)
+        apply_search_params(self.index, self.params)
+
+    def _train_and_flush(self):
+        sample = np.concatenate(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self._create(max(len(sample), self.expected_n or 0))
+        self.params["train_size"] = train_index(self.index, sample, self.train_size)
+        self.index.add(sample)
+
+    def add(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.dim = self.dim or embeddings.shape[1]
+        if self.index is None and self.index_type in ("flat", "hnsw"):
+            self._create(self.expected_n or 0)
+        if self.index is not None:
+            self.index.add(embeddings)
+            return
+        self._buffer.append(embeddings)
+        self._buffered += len(embeddings)
+        if self._buffered >= self.train_size:
+            self._train_and_flush()
+
+    def finish(self):
+        """Train on whatever is buffered if that has not happened yet. Returns (index, params)."""
+        if self.index is None:
+            if not self._buffered:
+                raise ValueError("No vectors were added")
+            self._train_and_flush()
+        self.params["ntotal"] = int(self.index.ntotal)
+        return self.index, self.params
+
+
+def search_parameters(index, nprobe=None, ef_search=None):
+    """Per-call FAISS SearchParameters (thread-safe, unlike setting attributes on a shared index)."""
+    if nprobe is not None and isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+
+def apply_search_params(index, params):
+    """Set the default nprobe / efSearch recorded in params on a freshly loaded index."""
+    if isinstance(index, faiss.IndexIVF) and params.get("nprobe"):
+        index.nprobe = int(params["nprobe"])
+    if isinstance(index, faiss.IndexHNSW) and params.get("ef_search"):
+        index.hnsw.efSearch = int(params["ef_search"])
+
+
+def params_path(index_path):
+    return os.path.splitext(index_path)[0] + ".params.json"
+
+
+def save_index_params(params, index_path):
+    path = params_path(index_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def load_index_params(index_path):
+    path = params_path(index_path)
+    if not os.path.exists(path):
+        return {"type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
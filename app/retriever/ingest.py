@@ -0,0 +1,361 @@
+# app/retriever/ingest.py
+
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+import pdfplumber
+import docx
+
+from app.retriever.chunk_store import ChunkStoreWriter
+from app.retriever.chunker import iter_chunks
+from app.retriever.embedder import get_model as get_embedder
+from app.retriever.embedding_cache import open_embedding_cache
+from app.retriever.evaluator import extract_entities, get_nlp
+
+MANIFEST_PATH = "app/data/embeddings/manifest.json"
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+
+# Chunking strategy can be adjusted here; chunk budgets are in chunker.py
+CHUNK_STRATEGY = "paragraph"  # options: 'paragraph', 'section', 'sentence'
+
+# Streaming ingestion: parser processes, chunks per embedding batch, seconds between progress lines
+PARSE_WORKERS = int(os.environ.get("LLM_PARSE_WORKERS", os.cpu_count() or 1))
+EMBED_BATCH_SIZE = int(os.environ.get("LLM_EMBED_BATCH_SIZE", 256))
+PROGRESS_EVERY = float(os.environ.get("LLM_PROGRESS_EVERY", 5))
+# Extract legal entities of every chunk while indexing, so legal queries need no spaCy calls
+INDEX_ENTITIES = os.environ.get("LLM_INDEX_ENTITIES", "1") != "0"
+
+
+def iter_document(filepath):
+    """Yield the plain text of a TXT, PDF or DOCX file piece by piece (lines, pages, paragraphs)."""
+    if filepath.endswith(".txt"):
+        with open(filepath, "r", encoding="utf-8") as f:
+            yield from f
+    elif filepath.endswith(".pdf"):
+        with pdfplumber.open(filepath) as pdf:
+            for n, page in enumerate(pdf.pages):
+                if n:
+                    yield "\n"
+                yield page.extract_text() or ""
+                page.close()  # drop the page's parsed layout objects so large PDFs stay small in memory
+    elif filepath.endswith(".docx"):
+        doc = docx.Document(filepath)
+        for n, para in enumerate(doc.paragraphs):
+            if n:
+                yield "\n"
+            yield para.text
+
+
+def read_document(filepath):
+    """Return the plain text of a TXT, PDF or DOCX file (None for other types)."""
+    if not filepath.endswith(SUPPORTED_EXTENSIONS):
+        return None
+    return "".join(iter_document(filepath))
+
+
+def file_hash(filepath, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_document(filepath):
+    """
+    Stream the (section_header, chunk_text, char_start, char_end) chunks of
+    one file; the file is read piece by piece as the chunks are consumed.
+    """
+    return iter_chunks(iter_document(filepath), strategy=CHUNK_STRATEGY)
+
+
+def parse_document(filepath, digest=None):
+    """Read, hash and chunk one file. Runs in a parser process; returns (sha256, chunks, seconds)."""
+    start = time.perf_counter()
+    digest = digest or file_hash(filepath)
+    chunks = list(chunk_document(filepath))
+    return digest, chunks, time.perf_counter() - start
+
+
+def _stream_chunks(filepath, progress):
+    """chunk_document() that reports the document to progress once it has been read through."""
+    seconds = 0.0
+    count = 0
+    chunks = chunk_document(filepath)
+    while True:
+        # Only the time spent parsing counts, not the embedder's work between chunks
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        count += 1
+        yield chunk
+    if progress:
+        progress.parsed(count, seconds)
+
+
+def parse_documents(docs_dir, filenames, workers=None, digests=None, progress=None):
+    """
+    Yield (filename, sha256, chunks) for each file, in order. With more than
+    one worker, files are parsed in a process pool with at most 2 * workers
+    documents in flight, so memory does not grow with the number of files.
+    With one worker, chunks is a generator reading the file as it is
+    consumed, so memory does not grow with the size of a file either; it
+    must be consumed before the next document is taken.
+    """
+    workers = min(workers or PARSE_WORKERS, len(filenames))
+    digests = digests or {}
+    if workers <= 1:
+        for filename in filenames:
+            filepath = os.path.join(docs_dir, filename)
+            digest = digests.get(filename) or file_hash(filepath)
+            yield filename, digest, _stream_chunks(filepath, progress)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        names = iter(filenames)
+        while True:
+            for filename in names:
+                pending.append((filename, pool.submit(parse_document, os.path.join(docs_dir, filename), digests.get(filename))))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            filename, future = pending.popleft()
+            wait_start = time.perf_counter()
+            digest, chunks, seconds = future.result()
+            if progress:
+                progress.parsed(len(chunks), seconds, waited=time.perf_counter() - wait_start)
+            yield filename, digest, chunks
+
+
+def _entities_available():
+    try:
+        get_nlp()
+        return True
+    except Exception as e:
+        print(f"Not extracting entities ({e}); legal queries will parse clauses at query time")
+        return False
+
+
+def embed_and_store(documents, add_vectors, writer, batch_size=None, progress=None, entities=None):
+    """
+    Embed the chunks of a (filename, sha256, chunks) stream in fixed-size
+    batches, passing each batch of vectors to add_vectors and its rows to the
+    chunk store writer in the same order. With entities (default
+    INDEX_ENTITIES) each batch also goes through spaCy NER, and the entities
+    are stored with the rows. Chunks whose text is in the embedding cache
+    are not encoded again. Returns {filename: manifest entry}.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    entities = (INDEX_ENTITIES if entities is None else entities) and _entities_available()
+    cache = open_embedding_cache()
+    entries = {}
+    batch = []
+
+    def encode(texts):
+        return get_embedder().encode(texts, show_progress_bar=False)
+
+    def flush():
+        start = time.perf_counter()
+        texts = [chunk for _, _, chunk, _, _ in batch]
+        hits = cache.hits if cache is not None else 0
+        embeddings = cache.encode(texts, encode) if cache is not None else encode(texts)
+        if entities:
+            # Parsed as the chunk appears in a retrieved clause, section header included
+            found = extract_entities([f"[{section}] {chunk}" if section else chunk
+                                      for _, section, chunk, _, _ in batch])
+        else:
+            found = [None] * len(batch)
+        embedded = time.perf_counter()
+        add_vectors(np.asarray(embeddings, dtype=np.float32))
+        for record, pairs in zip(batch, found):
+            writer.add(*record, entities=pairs)
+        if progress:
+            progress.embedded(len(batch), embedded - start, time.perf_counter() - embedded,
+                              cached=(cache.hits - hits) if cache is not None else 0)
+        batch.clear()
+
+    for filename, digest, chunks in documents:
+        count = 0
+        for section_header, chunk, start, end in chunks:
+            batch.append((filename, section_header, chunk, start, end))
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        entries[filename] = {"sha256": digest, "chunks": count}
+    if batch:
+        flush()
+    if cache is not None:
+        cache.close()
+    return entries
+
+
+class IngestProgress:
+    """
+    Counts and timings of the parse, embed and index stages, printed every
+    PROGRESS_EVERY seconds. callback(stage, progress) is called after every
+    parsed document ("parsed") and every embedded batch ("embedded").
+    """
+
+    def __init__(self, total_documents, label="ingest", callback=None):
+        self.total_documents = total_documents
+        self.label = label
+        self.callback = callback
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.documents = 0
+        self.chunks = 0
+        self.embedded_chunks = 0
+        self.cached_chunks = 0  # embedded chunks found in the embedding cache
+        self.parse_seconds = 0.0    # summed over parser processes
+        self.parse_wait_seconds = 0.0  # time the embedder sat waiting for parsed documents
+        self.embed_seconds = 0.0
+        self.index_seconds = 0.0
+
+    def parsed(self, chunks, seconds, waited=0.0):
+        self.documents += 1
+        self.chunks += chunks
+        self.parse_seconds += seconds
+        self.parse_wait_seconds += waited
+        if self.callback:
+            self.callback("parsed", self)
+        self._maybe_report()
+
+    def embedded(self, chunks, embed_seconds, index_seconds, cached=0):
+        self.embedded_chunks += chunks
+        self.cached_chunks += cached
+        self.embed_seconds += embed_seconds
+        self.index_seconds += index_seconds
+        if self.callback:
+            self.callback("embedded", self)
+        self._maybe_report()
+
+    def _maybe_report(self):
+        if time.perf_counter() - self.last_report >= PROGRESS_EVERY:
+            self.report()
+
+    def stats(self):
+        def rate(n, seconds):
+            return round(n / seconds, 1) if seconds else None
+        return {
+            "documents": self.documents,
+            "chunks": self.embedded_chunks,
+            "seconds": round(time.perf_counter() - self.start, 3),
+            "parse": {"seconds": round(self.parse_seconds, 3), "wait_seconds": round(self.parse_wait_seconds, 3),
+                      "documents_per_s": rate(self.documents, self.parse_seconds)},
+            "embed": {"seconds": round(self.embed_seconds, 3), "chunks_per_s": rate(self.embedded_chunks, self.embed_seconds),
+                      "cached": self.cached_chunks},
+            "index": {"seconds": round(self.index_seconds, 3), "chunks_per_s": rate(self.embedded_chunks, self.index_seconds)},
+        }
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        s = self.stats()
+        print(f"[{self.label}] {s['documents']}/{self.total_documents} documents, {s['chunks']} chunks in {s['seconds']:.1f}s"
+              f" | parse {s['parse']['documents_per_s']} docs/s per process (embedder waited {s['parse']['wait_seconds']:.1f}s)"
+              f" | embed {s['embed']['chunks_per_s']} chunks/s ({s['embed']['cached']} cached) | index {s['index']['chunks_per_s']} chunks/s")
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def save_index(index, index_path):
+    """Write the FAISS index, replacing the old file atomically."""
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+
+
+def _remove_positions(index, positions):
+    if not len(positions):
+        return
+    if not isinstance(index, faiss.IndexFlat):
+        # Only flat indexes renumber vectors on removal, keeping them aligned with the chunk store
+        raise ValueError(f"Documents that are already indexed cannot be replaced in a {type(index).__name__}; "
+                         "run a full rebuild instead")
+    index.remove_ids(np.asarray(positions, dtype=np.int64))
+
+
+def ingest_documents(index, store, docs_dir, manifest, store_path, filenames=None, workers=1, on_progress=None):
+    """
+    Incrementally bring index/store in line with the files in docs_dir.
+    - New or changed files (by content hash) are chunked, embedded and appended.
+    - Unchanged files are skipped.
+    - When filenames is None the whole folder is scanned and files that no
+      longer exist are dropped from the index.
+    index and manifest are updated in place (index may be None, in which case
+    a new IndexFlatL2 is created); when anything changed, a new chunk store is
+    written to store_path. workers > 1 parses files in a process pool (the
+    API keeps the default of 1, since forking a threaded server is unsafe).
+    on_progress is passed to IngestProgress as its callback.
+    Returns (index, store, summary).
+    """
+    if index is None:
+        index = faiss.IndexFlatL2(get_embedder().get_sentence_embedding_dimension())
+    summary = {"added": [], "updated": [], "skipped": [], "removed": [], "chunks_added": 0}
+
+    if filenames is None:
+        filenames = sorted(os.listdir(docs_dir))
+        summary["removed"] = [f for f in manifest if f not in filenames]
+
+    to_ingest = []
+    for filename in filenames:
+        filepath = os.path.join(docs_dir, filename)
+        if not filename.endswith(SUPPORTED_EXTENSIONS) or not os.path.isfile(filepath):
+            continue
+        digest = file_hash(filepath)
+        entry = manifest.get(filename)
+        if entry and entry["sha256"] == digest:
+            summary["skipped"].append(filename)
+        else:
+            to_ingest.append((filename, digest, entry is not None))
+    if not to_ingest and not summary["removed"]:
+        return index, store, summary
+
+    # Chunks of replaced and deleted documents (including ones indexed before the manifest existed)
+    old_count = len(store) if store is not None else 0
+    drop = [store.positions(f) for f in summary["removed"] + [f for f, _, _ in to_ingest]] if old_count else []
+    drop = np.concatenate(drop) if drop else np.zeros(0, dtype=np.int64)
+    _remove_positions(index, drop)
+
+    writer = ChunkStoreWriter(store_path)
+    if old_count:
+        keep = np.ones(old_count, dtype=bool)
+        keep[drop] = False
+        writer.copy_from(store, np.flatnonzero(keep))
+
+    progress = IngestProgress(len(to_ingest), callback=on_progress)
+    filenames = [filename for filename, _, _ in to_ingest]
+    documents = parse_documents(docs_dir, filenames, workers, {f: d for f, d, _ in to_ingest}, progress)
+    entries = embed_and_store(documents, index.add, writer, progress=progress)
+    for filename, digest, existed in to_ingest:
+        manifest[filename] = entries[filename]
+        summary["updated" if existed else "added"].append(filename)
+        summary["chunks_added"] += entries[filename]["chunks"]
+        print(f"Ingested {filename}: {entries[filename]['chunks']} chunks")
+    summary["timings"] = progress.stats()
+    for filename in summary["removed"]:
+        del manifest[filename]
+
+    return index, writer.close(), summary
@@ -0,0 +1,309 @@
+# app/retriever/lexical.py
+#
+# Inverted index over chunk text, searched next to FAISS so exact policy terms
+# ("hip replacement", clause numbers, "from day 1") are not lost to the
+# embedding. Unigrams and adjacent-word bigrams are hashed to 64-bit term ids.
+# Postings live in numpy segments (CSR layout, memory-mapped on open), and each
+# term's postings are sorted by impact, its precomputed BM25 term-frequency
+# component. A query therefore reads at most MAX_POSTINGS entries per term,
+# however common the term is. idf is computed at query time from document
+# frequencies, so it stays right as segments are added. Impacts are length
+# normalized against the average chunk length of the full build; incremental
+# updates keep that average, so it drifts until the next full rebuild.
+
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+BIGRAM_WEIGHT = float(os.environ.get("LLM_LEXICAL_BIGRAM_WEIGHT", 1.0))
+# Highest-impact postings read per query term (shared between segments by their document frequency)
+MAX_POSTINGS = int(os.environ.get("LLM_LEXICAL_MAX_POSTINGS", 1000))
+# Postings buffered by the writer before they are written out as a segment
+SEGMENT_POSTINGS = int(os.environ.get("LLM_LEXICAL_SEGMENT_POSTINGS", 5_000_000))
+# More segments than this are merged (smallest first) when a writer closes
+MAX_SEGMENTS = int(os.environ.get("LLM_LEXICAL_MAX_SEGMENTS", 8))
+
+META_FILE = "meta.json"
+LENGTHS_FILE = "lengths.npy"
+SEGMENT_FILES = ("terms", "offsets", "docs", "impacts")
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+@lru_cache(maxsize=1 << 20)
+def term_id(term):
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def average_length(texts):
+    """Mean token count of texts (BM25's avgdl), 1.0 when there are none."""
+    total = n = 0
+    for text in texts:
+        total += len(tokenize(text))
+        n += 1
+    return total / n if total else 1.0
+
+
+def _terms(tokens):
+    """Unigrams followed by bigrams (joined with a space) of a token list."""
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _write_segment(path, term_ids, docs, impacts):
+    """Write postings as one segment: terms sorted, each term's postings by impact (highest first)."""
+    order = np.lexsort((-impacts, term_ids))
+    term_ids, docs, impacts = term_ids[order], docs[order], impacts[order]
+    terms, starts = np.unique(term_ids, return_index=True)
+    os.makedirs(path)
+    np.save(os.path.join(path, "terms.npy"), terms.astype(np.uint64))
+    np.save(os.path.join(path, "offsets.npy"), np.append(starts, len(term_ids)).astype(np.int64))
+    np.save(os.path.join(path, "docs.npy"), docs.astype(np.int32))
+    np.save(os.path.join(path, "impacts.npy"), impacts.astype(np.float32))
+
+
+class _Segment:
+    def __init__(self, path):
+        self.path = path
+        # Plain ndarray views of the maps: slicing np.memmap objects is several times slower
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                  for name in SEGMENT_FILES}
+        self.terms = arrays["terms"]
+        self.offsets = arrays["offsets"]
+        self.docs = arrays["docs"]
+        self.impacts = arrays["impacts"]
+
+    def __len__(self):
+        return len(self.docs)
+
+    def postings(self, term):
+        """(start, end) of term's postings, (0, 0) when it does not occur."""
+        i = int(np.searchsorted(self.terms, term))
+        if i < len(self.terms) and self.terms[i] == term:
+            return int(self.offsets[i]), int(self.offsets[i + 1])
+        return 0, 0
+
+    def expand(self):
+        """All postings as (term id, doc, impact) arrays."""
+        lengths = np.diff(self.offsets)
+        return np.repeat(np.asarray(self.terms), lengths), np.asarray(self.docs), np.asarray(self.impacts)
+
+
+class LexicalIndex:
+    """Read side of an index written by LexicalIndexWriter. Ids are chunk ids."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_docs = meta["n_docs"]
+        self.total_length = meta["total_length"]
+        # Average length the impacts were normalized with (indexes written before it was stored: the actual one)
+        self.avg_length = meta.get("avg_length") or (self.total_length / self.n_docs if self.n_docs else 1.0)
+        self.segment_names = meta["segments"]
+        self._segments = None
+        self._local = threading.local()
+
+    @classmethod
+    def open(cls, path):
+        """The index at path, or None if there is none (e.g. a snapshot built before it existed)."""
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        return cls(path)
+
+    @property
+    def segments(self):
+        if self._segments is None:
+            self._segments = [_Segment(os.path.join(self.path, name)) for name in self.segment_names]
+        return self._segments
+
+    def lengths(self):
+        return np.load(os.path.join(self.path, LENGTHS_FILE))
+
+    def close(self):
+        self._segments = None
+
+    def search(self, query_text, k, max_postings=None):
+        """Top k (chunk ids, BM25 scores), best first."""
+        max_postings = max_postings or MAX_POSTINGS
+        tokens = tokenize(query_text)
+        weights = dict.fromkeys(tokens, 1.0)
+        weights.update(dict.fromkeys(_terms(tokens)[len(tokens):], BIGRAM_WEIGHT))
+        # Scores are accumulated in a dense per-thread buffer (ids are unique
+        # within one term's postings) and only the touched entries are read
+        # back and reset, so nothing is sorted but the final top k
+        acc = self._accumulator()
+        touched = []
+        for term, weight in weights.items():
+            tid = np.uint64(term_id(term))
+            spans = [(segment, *segment.postings(tid)) for segment in self.segments]
+            df = sum(end - start for _, start, end in spans)
+            if not df:
+                continue
+            idf = weight * math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            for segment, start, end in spans:
+                if end > start:
+                    share = -(-max_postings * (end - start) // df)
+                    docs = segment.docs[start:min(end, start + share)]
+                    acc[docs] += idf * segment.impacts[start:start + len(docs)]
+                    touched.append(docs)
+        if not touched:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.concatenate(touched)
+        scores = acc[ids]
+        # Keep one occurrence of each id: the last write of its position wins
+        acc[ids] = np.arange(len(ids))
+        first = acc[ids] == np.arange(len(ids))
+        acc[ids] = 0
+        ids, scores = ids[first], scores[first]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return ids[top].astype(np.int64), scores[top].astype(np.float32)
+
+    def _accumulator(self):
+        acc = getattr(self._local, "acc", None)
+        if acc is None:
+            acc = self._local.acc = np.zeros(self.n_docs, dtype=np.float64)
+        return acc
+
+
+class LexicalIndexWriter:
+    """
+    Writes a lexical index to path (which must not exist yet). Chunks are
+    added in chunk id order and length normalized against avg_length (see
+    average_length), so every chunk's impacts use the same average. With
+    base, the new index starts as a copy of that one, without the chunk ids
+    in drop, and keeps its average length unless avg_length is given; later
+    ids shift down the same way the chunk store and flat FAISS index renumber
+    them. Unchanged base segments are hard-linked instead of copied.
+    """
+
+    def __init__(self, path, base=None, drop=None, avg_length=None):
+        if avg_length is None:
+            if base is None:
+                raise ValueError("avg_length is required without a base index")
+            avg_length = base.avg_length
+        self.path = path
+        self.avg_length = avg_length
+        os.makedirs(path)
+        self._segments = []
+        self._lengths = array("i")
+        self.total_length = 0
+        self._pending = ([], [], [])  # term ids, docs, impacts per added chunk
+        self._pending_count = 0
+        if base is not None:
+            self._start_from(base, np.asarray(drop if drop is not None else [], dtype=np.int64))
+
+    @property
+    def n_docs(self):
+        return len(self._lengths)
+
+    def _new_segment_path(self):
+        return os.path.join(self.path, f"seg-{len(self._segments):06d}")
+
+    def _start_from(self, base, drop):
+        lengths = base.lengths()
+        keep = np.ones(base.n_docs, dtype=bool)
+        keep[drop] = False
+        new_ids = np.cumsum(keep) - 1
+        for segment in base.segments:
+            path = self._new_segment_path()
+            if not len(drop):
+                os.makedirs(path)
+                for name in SEGMENT_FILES:
+                    src, dst = os.path.join(segment.path, f"{name}.npy"), os.path.join(path, f"{name}.npy")
+                    try:
+                        os.link(src, dst)
+                    except OSError:
+                        shutil.copy2(src, dst)
+            else:
+                term_ids, docs, impacts = segment.expand()
+                mask = keep[docs]
+                if not mask.any():
+                    continue
+                _write_segment(path, term_ids[mask], new_ids[docs[mask]], impacts[mask])
+            self._segments.append(os.path.basename(path))
+        self._lengths.frombytes(lengths[keep].astype(np.int32).tobytes())
+        self.total_length = int(lengths[keep].sum())
+
+    def add(self, text):
+        """Index the next chunk; returns its chunk id."""
+        tokens = tokenize(text)
+        counts = Counter(_terms(tokens))
+        self._lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        if counts:
+            # BM25 term-frequency component
+            norm = K1 * (1 - B + B * len(tokens) / self.avg_length)
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            term_ids, docs, impacts = self._pending
+            term_ids.append(np.fromiter((term_id(t) for t in counts), dtype=np.uint64, count=len(counts)))
+            docs.append(np.full(len(counts), self.n_docs - 1, dtype=np.int32))
+            impacts.append(tf * (K1 + 1) / (tf + norm))
+            self._pending_count += len(counts)
+            if self._pending_count >= SEGMENT_POSTINGS:
+                self._flush()
+        return self.n_docs - 1
+
+    def _flush(self):
+        if not self._pending_count:
+            return
+        path = self._new_segment_path()
+        _write_segment(path, *(np.concatenate(part) for part in self._pending))
+        self._segments.append(os.path.basename(path))
+        self._pending = ([], [], [])
+        self._pending_count = 0
+
+    def _merge(self):
+        """Merge the smallest segments so at most MAX_SEGMENTS // 2 + 1 remain."""
+        sizes = sorted((len(_Segment(os.path.join(self.path, name))), name) for name in self._segments)
+        merge = [name for _, name in sizes[:len(sizes) - MAX_SEGMENTS // 2]]
+        parts = [_Segment(os.path.join(self.path, name)).expand() for name in merge]
+        path = os.path.join(self.path, f"seg-{len(self._segments):06d}")
+        _write_segment(path, *(np.concatenate(p) for p in zip(*parts)))
+        del parts
+        for name in merge:
+            shutil.rmtree(os.path.join(self.path, name))
+        self._segments = [name for name in self._segments if name not in merge] + [os.path.basename(path)]
+
+    def close(self):
+        """Write the remaining postings and the metadata; returns the opened index."""
+        self._flush()
+        if len(self._segments) > MAX_SEGMENTS:
+            self._merge()
+        np.save(os.path.join(self.path, LENGTHS_FILE), np.frombuffer(self._lengths, dtype=np.int32))
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "total_length": self.total_length, "avg_length": self.avg_length,
+                       "segments": self._segments, "k1": K1, "b": B}, f)
+        return LexicalIndex(self.path)
+
+
+def build_lexical_index(store, path, base=None, drop=None):
+    """
+    Index the chunks of store that base does not cover (all of them without
+    base). A full build reads the chunks twice: once for their average length.
+    """
+    avg_length = None
+    if base is None or not base.n_docs:
+        avg_length = average_length(store.text(i) for i in range(len(store)))
+    writer = LexicalIndexWriter(path, base, drop, avg_length)
+    for i in range(writer.n_docs, len(store)):
+        writer.add(store.text(i))
+    return writer.close()
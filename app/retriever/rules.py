@@ -0,0 +1,114 @@
+# app/retriever/rules.py
+#
+# Data-driven insurance rules (app/data/rules/insurance.json). Every phrase of
+# every rule is compiled into one Aho-Corasick automaton, so a clause is
+# scanned once whatever the number of rules, and only the rules whose rarest
+# phrase occurs in the clause are checked. Phrase matches depend only on the
+# chunk text, so they are cached per chunk id of the serving snapshot.
+
+import json
+import os
+
+from app import models
+from app.cache import LRUCache
+from app.parser.automaton import Automaton
+
+RULES_PATH = os.environ.get("LLM_INSURANCE_RULES", "app/data/rules/insurance.json")
+MATCH_CACHE_SIZE = int(os.environ.get("LLM_RULE_CACHE_SIZE", 65536))
+
+CONDITIONS = ("min", "max", "contains")
+
+
+def _holds(value, condition):
+    if value is None:
+        return False
+    if "min" in condition and not value >= condition["min"]:
+        return False
+    if "max" in condition and not value <= condition["max"]:
+        return False
+    if "contains" in condition and condition["contains"].lower() not in str(value).lower():
+        return False
+    return True
+
+
+class RuleEngine:
+    """A compiled rule list; see the description in the rules file for their meaning."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        phrases = {}
+        self._rule_phrases = []
+        for n, rule in enumerate(rules):
+            contains = rule.get("clause_contains")
+            if not contains or "decision" not in rule:
+                raise ValueError(f"Rule {rule.get('name', n)} needs clause_contains and decision")
+            for condition in rule.get("when", {}).values():
+                unknown = set(condition) - set(CONDITIONS)
+                if unknown:
+                    raise ValueError(f"Rule {rule.get('name', n)}: unknown conditions {sorted(unknown)}")
+            self._rule_phrases.append(frozenset(phrases.setdefault(p.lower(), len(phrases)) for p in contains))
+        self.automaton = Automaton(list(phrases))
+        # Each rule is only checked when its rarest phrase matched, so common
+        # phrases ("6 months") do not make every rule a candidate
+        usage = [0] * len(phrases)
+        for ids in self._rule_phrases:
+            for pid in ids:
+                usage[pid] += 1
+        self._rules_by_phrase = [[] for _ in phrases]
+        for n, ids in enumerate(self._rule_phrases):
+            self._rules_by_phrase[min(ids, key=lambda pid: (usage[pid], pid))].append(n)
+        self._cache = LRUCache(max_size=MATCH_CACHE_SIZE)
+
+    @classmethod
+    def load(cls, path=None):
+        with open(path or RULES_PATH, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["rules"])
+
+    def match(self, text):
+        """Ids of the rule phrases occurring in text."""
+        return frozenset(self.automaton.search(text))
+
+    def match_chunk(self, store, chunk_id, text):
+        """match() of a chunk's text, cached by (store, chunk id)."""
+        key = (store.path, chunk_id)
+        found = self._cache.get(key)
+        if found is None:
+            found = self.match(text)
+            self._cache.set(key, found)
+        return found
+
+    def rule_for(self, found):
+        """Index of the first rule whose phrases are all in found, or None."""
+        candidates = sorted({n for pid in found for n in self._rules_by_phrase[pid]})
+        return next((n for n in candidates if self._rule_phrases[n] <= found), None)
+
+    def evaluate(self, structured_query, clauses, matches=None):
+        """Decision, amount and cited clauses; matches are the clauses' match() results when known."""
+        decision = "rejected"
+        amount = 0
+        matching_clauses = []
+        if matches is None:
+            matches = [self.match(clause) for clause in clauses]
+        for clause, found in zip(clauses, matches):
+            n = self.rule_for(found)
+            if n is None:
+                continue
+            rule = self.rules[n]
+            if all(_holds(structured_query.get(field), condition) for field, condition in rule.get("when", {}).items()):
+                decision = rule["decision"]
+                amount = rule.get("amount", 0)
+                matching_clauses.append(clause)
+            elif rule.get("cite_when_unmet"):
+                matching_clauses.append(clause)
+        return {
+            "decision": decision,
+            "amount": amount,
+            "clauses": matching_clauses
+        }
+
+
+models.register("insurance_rules", RuleEngine.load)
+
+
+def get_rules():
+    return models.get("insurance_rules")
@@ -0,0 +1,271 @@
+# app/retriever/snapshots.py
+#
+# Versioned index snapshots. Every full build and every upload writes a
+# complete new directory under snapshots/ holding the FAISS index, its params,
+# the chunk store, the lexical index and the manifest, and CURRENT names the one to serve.
+# Snapshots are written as "<name>.partial" and renamed when complete, so a
+# reader never sees a half-written one, and the index and its chunks always
+# change together.
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+from app.retriever.chunk_store import ChunkStore, open_chunk_store
+from app.retriever.index_factory import apply_search_params, load_index_params, save_index_params
+from app.retriever.ingest import ingest_documents, load_manifest, save_index, save_manifest
+from app.retriever.lexical import LexicalIndex, build_lexical_index
+
+EMBEDDINGS_DIR = "app/data/embeddings"
+SNAPSHOTS_DIR = os.path.join(EMBEDDINGS_DIR, "snapshots")
+CURRENT_FILE = os.path.join(EMBEDDINGS_DIR, "CURRENT")
+# Published snapshots kept on disk (the current one included), for rollback
+KEEP_SNAPSHOTS = int(os.environ.get("LLM_KEEP_SNAPSHOTS", 2))
+PARTIAL_SUFFIX = ".partial"
+
+INDEX_FILE = "faiss_index.index"
+STORE_DIR = "chunks"
+LEXICAL_DIR = "lexical"
+MANIFEST_FILE = "manifest.json"
+
+# Flat layout used before snapshots; moved into the first snapshot on load
+LEGACY_INDEX_PATH = os.path.join(EMBEDDINGS_DIR, INDEX_FILE)
+LEGACY_STORE_PATH = os.path.join(EMBEDDINGS_DIR, STORE_DIR)
+LEGACY_MANIFEST_PATH = os.path.join(EMBEDDINGS_DIR, MANIFEST_FILE)
+LEGACY_META_PATH = os.path.join(EMBEDDINGS_DIR, "metadata.pkl")
+
+
+def index_path(snapshot_dir):
+    return os.path.join(snapshot_dir, INDEX_FILE)
+
+
+def store_path(snapshot_dir):
+    return os.path.join(snapshot_dir, STORE_DIR)
+
+
+def lexical_path(snapshot_dir):
+    return os.path.join(snapshot_dir, LEXICAL_DIR)
+
+
+def manifest_path(snapshot_dir):
+    return os.path.join(snapshot_dir, MANIFEST_FILE)
+
+
+def new_snapshot_dir():
+    """Create an empty "<name>.partial" directory for a snapshot being written."""
+    name = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    path = os.path.join(SNAPSHOTS_DIR, name + PARTIAL_SUFFIX)
+    os.makedirs(path)
+    return path
+
+
+def finish_snapshot(partial_dir):
+    """Mark a fully written snapshot as complete. Returns its final path."""
+    path = partial_dir[:-len(PARTIAL_SUFFIX)] if partial_dir.endswith(PARTIAL_SUFFIX) else partial_dir
+    if path != partial_dir:
+        os.rename(partial_dir, path)
+    return path
+
+
+def publish(snapshot_dir, in_use=()):
+    """Point CURRENT at a complete snapshot (atomically) and prune old ones."""
+    tmp_path = CURRENT_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(snapshot_dir) + "\n")
+    os.replace(tmp_path, CURRENT_FILE)
+    prune(in_use=in_use)
+
+
+def current_snapshot():
+    """Directory of the published snapshot (migrating the legacy layout once), or None."""
+    if os.path.exists(CURRENT_FILE):
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            path = os.path.join(SNAPSHOTS_DIR, f.read().strip())
+        if os.path.isdir(path):
+            return path
+    if os.path.exists(LEGACY_INDEX_PATH):
+        return migrate_legacy()
+    return None
+
+
+def migrate_legacy():
+    partial = new_snapshot_dir()
+    os.replace(LEGACY_INDEX_PATH, index_path(partial))
+    legacy_params = os.path.splitext(LEGACY_INDEX_PATH)[0] + ".params.json"
+    if os.path.exists(legacy_params):
+        os.replace(legacy_params, os.path.splitext(index_path(partial))[0] + ".params.json")
+    if os.path.exists(LEGACY_STORE_PATH):
+        os.replace(LEGACY_STORE_PATH, store_path(partial))
+    else:
+        open_chunk_store(store_path(partial), LEGACY_META_PATH)
+    if os.path.exists(LEGACY_MANIFEST_PATH):
+        os.replace(LEGACY_MANIFEST_PATH, manifest_path(partial))
+    path = finish_snapshot(partial)
+    publish(path)
+    print(f"Moved the index in {EMBEDDINGS_DIR} into snapshot {os.path.basename(path)}")
+    return path
+
+
+def prune(keep=None, in_use=()):
+    """Delete published snapshots beyond the newest `keep`, never CURRENT or one in in_use."""
+    if not os.path.isdir(SNAPSHOTS_DIR):
+        return
+    keep = KEEP_SNAPSHOTS if keep is None else keep
+    current = None
+    if os.path.exists(CURRENT_FILE):
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            current = f.read().strip()
+    in_use = {os.path.basename(p) for p in in_use}
+    # Names start with a timestamp, so they sort oldest first; partial ones may still be being written
+    names = sorted(n for n in os.listdir(SNAPSHOTS_DIR) if not n.endswith(PARTIAL_SUFFIX))
+    for name in names[:max(0, len(names) - keep)]:
+        if name != current and name not in in_use:
+            shutil.rmtree(os.path.join(SNAPSHOTS_DIR, name), ignore_errors=True)
+
+
+def load_snapshot(snapshot_dir):
+    """Load (index, store, manifest, lexical) of a snapshot; lexical is None for snapshots without one."""
+    path = index_path(snapshot_dir)
+    index = faiss.read_index(path)
+    # Default nprobe / efSearch recorded by the build script
+    apply_search_params(index, load_index_params(path))
+    return (index, ChunkStore(store_path(snapshot_dir)), load_manifest(manifest_path(snapshot_dir)),
+            LexicalIndex.open(lexical_path(snapshot_dir)))
+
+
+def ingest_snapshot(base, docs_dir, filenames=None, workers=1, on_progress=None):
+    """
+    Ingest new or changed files into a copy of base (a Snapshot, or None when
+    there is no index yet) written as a new snapshot directory. Returns
+    (path, index, store, manifest, lexical, summary); path is None when
+    nothing changed.
+    """
+    new_index = faiss.clone_index(base.index) if base is not None else None
+    new_manifest = dict(base.manifest) if base is not None else {}
+    partial = new_snapshot_dir()
+    try:
+        new_index, _, summary = ingest_documents(
+            new_index, base.store if base is not None else None, docs_dir, new_manifest, store_path(partial),
+            filenames=filenames, workers=workers, on_progress=on_progress,
+        )
+        if not (summary["added"] or summary["updated"] or summary["removed"]):
+            shutil.rmtree(partial, ignore_errors=True)
+            return None, None, None, None, None, summary
+        # The lexical index follows the chunk store: drop the same chunks, index the appended ones
+        new_store = ChunkStore(store_path(partial))
+        base_lexical = base.lexical if base is not None else None
+        drop = None
+        if base_lexical is not None:
+            names = summary["added"] + summary["updated"] + summary["removed"]
+            drop = np.concatenate([base.store.positions(f) for f in names]) if names else None
+        build_lexical_index(new_store, lexical_path(partial), base_lexical, drop)
+        new_store.close()
+        params = load_index_params(index_path(base.path)) if base is not None else {"type": "flat"}
+        params["ntotal"] = int(new_index.ntotal)
+        save_index(new_index, index_path(partial))
+        save_index_params(params, index_path(partial))
+        save_manifest(new_manifest, manifest_path(partial))
+        path = finish_snapshot(partial)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return (path, new_index, ChunkStore(store_path(path)), new_manifest,
+            LexicalIndex(lexical_path(path)), summary)
+
+
+class Snapshot:
+    """A loaded snapshot and the number of requests currently using it."""
+
+    def __init__(self, version, path, index, store, manifest, lexical=None):
+        self.version = version
+        self.path = path
+        self.index = index
+        self.store = store
+        self.manifest = manifest
+        self.lexical = lexical
+        self.refs = 0
+        self.retired = False
+
+
+class SnapshotManager:
+    """
+    Holds the live snapshot. Requests acquire() it for their whole duration,
+    so a swap never changes the index or chunks under a running request; a
+    replaced snapshot is closed once its last user releases it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._retired = []
+        self.current = None
+        self.version = 0
+
+    def acquire(self):
+        with self._lock:
+            snapshot = self.current
+            if snapshot is not None:
+                snapshot.refs += 1
+            return snapshot
+
+    def release(self, snapshot):
+        with self._lock:
+            snapshot.refs -= 1
+            closing = snapshot.retired and snapshot.refs == 0
+        if closing:
+            self._close(snapshot)
+
+    @contextmanager
+    def use(self):
+        snapshot = self.acquire()
+        try:
+            yield snapshot
+        finally:
+            if snapshot is not None:
+                self.release(snapshot)
+
+    def swap(self, path, index, store, manifest, lexical=None):
+        """Make a loaded snapshot live as one unit. Returns it."""
+        with self._lock:
+            self.version += 1
+            snapshot = Snapshot(self.version, path, index, store, manifest, lexical)
+            old, self.current = self.current, snapshot
+            closing = False
+            if old is not None:
+                old.retired = True
+                closing = old.refs == 0
+                if not closing:
+                    self._retired.append(old)
+        if closing:
+            self._close(old)
+        return snapshot
+
+    def _close(self, snapshot):
+        with self._lock:
+            if snapshot in self._retired:
+                self._retired.remove(snapshot)
+        snapshot.store.close()
+        if snapshot.lexical is not None:
+            snapshot.lexical.close()
+        snapshot.index = None
+        prune(in_use=self.paths())
+
+    def paths(self):
+        """Directories of the live snapshot and of replaced ones still in use."""
+        with self._lock:
+            return [s.path for s in self._retired] + ([self.current.path] if self.current else [])
+
+    def stats(self):
+        with self._lock:
+            current = self.current
+            return {
+                "version": self.version,
+                "snapshot": os.path.basename(current.path) if current else None,
+                "in_use": current.refs if current else 0,
+                "draining": [{"snapshot": os.path.basename(s.path), "in_use": s.refs} for s in self._retired],
+            }
@@ -2,35 +2,296 @@
 
 import faiss
 import numpy as np
-import pickle
-from sentence_transformers import CrossEncoder
+import os
+import time
+from app import metrics, models
+from app.inference import DEFAULT_BACKEND, load_cross_encoder
+from app.retriever.batcher import DEFAULT_MAX_WAIT_MS, MicroBatcher
+from app.retriever.chunk_store import open_chunk_store
+from app.retriever.index_factory import apply_search_params, load_index_params, search_parameters
 
 EMBED_DIM = 384  # For all-MiniLM-L6-v2
 
-# Initialize cross_encoder globally
-cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+# Retrieval depth: FAISS returns CANDIDATES hits, the cross-encoder scores at
+# most RERANK_DEPTH of them and search_clauses returns top_k
+CANDIDATES = int(os.environ.get("LLM_CANDIDATES", 20))
+RERANK_DEPTH = int(os.environ.get("LLM_RERANK_DEPTH", 10))
+# Skip the cross-encoder when the best FAISS hit beats the runner-up by at least
+# this squared-L2 distance (0 disables)
+RERANK_SKIP_GAP = float(os.environ.get("LLM_RERANK_SKIP_GAP", 0.5))
+# With a budget, candidates are scored RERANK_SLICE at a time and scoring stops
+# once the budget is used up (0 disables and scores everything in one call)
+RERANK_BUDGET_MS = float(os.environ.get("LLM_RERANK_BUDGET_MS", 0))
+RERANK_SLICE = int(os.environ.get("LLM_RERANK_SLICE", 8))
+# Hybrid retrieval: hits pulled from the lexical index (0 disables) and the
+# reciprocal rank fusion constant used to merge them with the FAISS hits
+LEXICAL_CANDIDATES = int(os.environ.get("LLM_LEXICAL_CANDIDATES", CANDIDATES))
+RRF_K = float(os.environ.get("LLM_RRF_K", 60))
 
-def load_faiss_index(index_path, metadata_path):
+RERANKED = metrics.Counter("llm_rerank_candidates_total", "Candidates scored by the cross-encoder")
+RERANK_SKIPPED = metrics.Counter("llm_rerank_skipped_total", "Queries answered without reranking (FAISS decisive)")
+
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_BACKEND = os.environ.get("LLM_RERANK_BACKEND", DEFAULT_BACKEND)
+
+def _load_cross_encoder():
+    return load_cross_encoder(CROSS_ENCODER_MODEL, RERANK_BACKEND)
+
+# Loaded on first rerank (or /api/warmup), never at import time
+models.register("cross_encoder", _load_cross_encoder)
+
+def get_cross_encoder():
+    return models.get("cross_encoder")
+
+def rerank_pairs(pairs):
+    return get_cross_encoder().predict(pairs)
+
+# (query, clause) pairs from concurrent requests are scored in one forward pass
+rerank_batcher = MicroBatcher(
+    rerank_pairs,
+    max_batch_size=int(os.environ.get("LLM_RERANK_BATCH_SIZE", 64)),
+    max_wait_ms=float(os.environ.get("LLM_RERANK_BATCH_WAIT_MS", DEFAULT_MAX_WAIT_MS)),
+    name="rerank",
+)
+
+def load_faiss_index(index_path, store_path, legacy_metadata_path=None):
+    """Load the FAISS index and its chunk store (converting a legacy metadata.pkl if needed)."""
     index = faiss.read_index(index_path)
-    with open(metadata_path, "rb") as f:
-        metadata = pickle.load(f)
-    return index, metadata
-
-def search_clauses(query_embedding, index, metadata, top_k=3, context_window=1, query_text=None):
-    D, I = index.search(np.array([query_embedding]), top_k)
-    candidates = []
-    for i in I[0]:
-        context = []
-        for offset in range(-context_window, context_window + 1):
-            idx = i + offset
-            if 0 <= idx < len(metadata):
-                context.append(metadata[idx])
-        candidate = "\n---\n".join(context)
-        candidates.append(candidate)
-    # Rerank with cross-encoder if query_text is provided
-    if query_text is not None and candidates:
-        pairs = [(query_text, c) for c in candidates]
-        scores = cross_encoder.predict(pairs)
-        reranked = [c for _, c in sorted(zip(scores, candidates), reverse=True)]
-        return reranked
-    return candidates
\ No newline at end of file
+    # Default nprobe / efSearch recorded by the build script
+    apply_search_params(index, load_index_params(index_path))
+    store = open_chunk_store(store_path, legacy_metadata_path)
+    return index, store
+
+def _window(r, store, context_window):
+    """Chunk ids of a result's context window (set by _merge_windows, or looked up in the store)."""
+    if "window" in r:
+        return range(*r["window"])
+    return range(*store.window(r["chunk_id"], context_window))
+
+def _chunk_line(store, idx):
+    section = store.section(idx)
+    text = store.text(idx)
+    return f"[{section}] {text}" if section else text
+
+def _build_context(window, store):
+    # A window lies within one section, so its header is given once
+    start, end = window
+    section = store.section(start)
+    text = store.window_text(start, end)
+    return f"[{section}] {text}" if section else text
+
+def _merge_windows(results, store, context_window):
+    """
+    Set each result's context "window" (chunk ids [start, end), never
+    crossing a document or section boundary) so no text is scored twice.
+    A result whose window overlaps better ranked ones is folded into the best
+    of them (listed in its "merged_chunk_ids") when the union spans at most
+    2 * context_window + 1 chunks, so a run of adjacent hits does not become
+    one long clause. Otherwise a hit already inside a kept window is folded
+    into it unchanged, and any other hit keeps its own window, clipped to the
+    chunks no kept window covers.
+    """
+    max_span = 2 * context_window + 1
+    kept = []
+    for r in results:
+        idx = r["chunk_id"]
+        start, end = store.window(idx, context_window)
+        hits = [k for k in kept if start < k["window"][1] and k["window"][0] < end]
+        if hits:
+            first = hits[0]
+            lo = min(start, *(k["window"][0] for k in hits))
+            hi = max(end, *(k["window"][1] for k in hits))
+            if hi - lo <= max_span:
+                # Kept windows are disjoint, so everything overlapping r joins the best ranked one
+                for k in hits[1:]:
+                    kept.remove(k)
+                    first["merged_chunk_ids"] += [k["chunk_id"]] + k["merged_chunk_ids"]
+                first["merged_chunk_ids"].append(idx)
+                first["window"] = [lo, hi]
+                continue
+            inside = [k for k in hits if k["window"][0] <= idx < k["window"][1]]
+            if inside:
+                inside[0]["merged_chunk_ids"].append(idx)
+                continue
+            start = max([start] + [k["window"][1] for k in hits if k["window"][1] <= idx])
+            end = min([end] + [k["window"][0] for k in hits if k["window"][0] > idx])
+        r["window"] = [start, end]
+        r["merged_chunk_ids"] = []
+        kept.append(r)
+    return kept
+
+def clause_entities(results, store, context_window=1):
+    """
+    Entities stored at index time for each result's clause (a list of pair
+    lists, one per chunk of its context window), as evaluate() takes them.
+    None when the store was written without entities.
+    """
+    if not store.has_entities:
+        return None
+    return [[store.entities(idx) for idx in _window(r, store, context_window)] for r in results]
+
+def clause_matches(results, store, engine, context_window=1):
+    """
+    Rule phrase matches of each result's clause, as the union of its window
+    chunks' matches (cached per chunk id by the rule engine). Rule phrases do
+    not span the separator between chunks, so this equals matching the
+    clause text.
+    """
+    return [frozenset().union(*(engine.match_chunk(store, idx, _chunk_line(store, idx))
+                                for idx in _window(r, store, context_window)))
+            for r in results]
+
+def _fuse(results, lexical_ids, lexical_scores):
+    """Merge FAISS results with lexical hits by reciprocal rank fusion, best first."""
+    by_id = {r["chunk_id"]: r for r in results}
+    for rank, r in enumerate(results):
+        r["fused_score"] = 1.0 / (RRF_K + rank + 1)
+    for rank, (i, s) in enumerate(zip(lexical_ids.tolist(), lexical_scores.tolist())):
+        r = by_id.get(i)
+        if r is None:
+            r = by_id[i] = {"clause": None, "chunk_id": i, "distance": None, "rerank_score": None,
+                            "lexical_score": None, "fused_score": 0.0}
+        r["lexical_score"] = float(s)
+        r["fused_score"] += 1.0 / (RRF_K + rank + 1)
+    return sorted(by_id.values(), key=lambda r: r["fused_score"], reverse=True)
+
+def _candidates(distances, ids, store, query_text, skip_gap, lexical, lexical_candidates, context_window):
+    """
+    Result dicts for one query's FAISS hits (fused with its lexical hits,
+    overlapping context windows merged), and whether FAISS is decisive.
+    """
+    results = [
+        {"clause": None, "chunk_id": int(i), "distance": float(d), "rerank_score": None, "lexical_score": None}
+        for i, d in zip(ids, distances) if i >= 0
+    ]
+    decisive = skip_gap > 0 and len(results) > 1 and results[1]["distance"] - results[0]["distance"] >= skip_gap
+
+    if lexical is not None and query_text and lexical_candidates > 0:
+        with metrics.stage("lexical_search"):
+            ids, scores = lexical.search(query_text, lexical_candidates)
+        keep = ids < len(store)
+        ids, scores = ids[keep], scores[keep]
+        # FAISS is only decisive if the lexical stage agrees on the best hit
+        decisive = decisive and (not len(ids) or int(ids[0]) == results[0]["chunk_id"])
+        results = _fuse(results, ids, scores)
+    return _merge_windows(results, store, context_window), decisive
+
+def _finish(results, store, top_k, with_scores):
+    results = results[:top_k]
+    for r in results:
+        if r["clause"] is None:
+            r["clause"] = _build_context(r["window"], store)
+        r["document"] = store.document(r["chunk_id"])
+        r["section"] = store.section(r["chunk_id"])
+        r["text"] = store.text(r["chunk_id"])
+    if with_scores:
+        return results
+    return [r["clause"] for r in results]
+
+def search_clauses(query_embedding, index, store, top_k=3, context_window=1, query_text=None, scorer=None,
+                   candidates=None, rerank_depth=None, skip_gap=None, budget_ms=None, with_scores=False,
+                   nprobe=None, ef_search=None, lexical=None, lexical_candidates=None, on_candidates=None):
+    """
+    Return the top_k clauses (with neighbouring context) for query_embedding.
+    - candidates: how many hits to pull from FAISS (default CANDIDATES)
+    - rerank_depth: how many of those the cross-encoder scores (default RERANK_DEPTH)
+    - skip_gap: skip reranking when FAISS is already decisive (default RERANK_SKIP_GAP)
+    - budget_ms: per-request rerank time budget, checked between slices (default RERANK_BUDGET_MS)
+    - nprobe / ef_search: override the IVF / HNSW search breadth for this call
+    - lexical / lexical_candidates: a LexicalIndex and how many of its hits to
+      fuse with the FAISS hits before reranking (default LEXICAL_CANDIDATES)
+    Reranking only happens when query_text is given; scorer maps a list of
+    (query, clause) pairs to scores (default: rerank_pairs, the cross-encoder).
+    With with_scores=True each result is a dict with the clause (the hit plus
+    up to context_window neighbours each side within its document section),
+    the hit's chunk id, document, section and own text, its FAISS distance,
+    lexical score and rerank score (None when the hit did not come from that
+    stage), the window's chunk ids and the hits merged into it.
+    on_candidates, when given, is called with the top_k result dicts in
+    retrieval order before reranking starts, so callers can show them early.
+    """
+    candidates = CANDIDATES if candidates is None else candidates
+    rerank_depth = RERANK_DEPTH if rerank_depth is None else rerank_depth
+    skip_gap = RERANK_SKIP_GAP if skip_gap is None else skip_gap
+    budget_ms = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    lexical_candidates = LEXICAL_CANDIDATES if lexical_candidates is None else lexical_candidates
+
+    with metrics.stage("index_search"):
+        D, I = index.search(np.asarray([query_embedding], dtype=np.float32), max(top_k, candidates),
+                            params=search_parameters(index, nprobe, ef_search))
+    results, decisive = _candidates(D[0], I[0], store, query_text, skip_gap, lexical, lexical_candidates,
+                                    context_window)
+    if on_candidates is not None:
+        # Copies: reranking below fills in scores and reorders the originals
+        on_candidates(_finish([dict(r) for r in results], store, top_k, True))
+
+    depth = min(rerank_depth, len(results))
+    if query_text is not None and depth > 0 and decisive:
+        RERANK_SKIPPED.inc()
+    if query_text is not None and depth > 0 and not decisive:
+        head, tail = results[:depth], results[depth:]
+        for r in head:
+            r["clause"] = _build_context(r["window"], store)
+        score = scorer or rerank_pairs
+        slice_size = RERANK_SLICE if budget_ms > 0 else depth
+        started = time.perf_counter()
+        scored = 0
+        with metrics.stage("rerank"):
+            while scored < depth:
+                batch = head[scored:scored + slice_size]
+                for r, s in zip(batch, score([(query_text, r["clause"]) for r in batch])):
+                    r["rerank_score"] = float(s)
+                scored += len(batch)
+                if budget_ms > 0 and (time.perf_counter() - started) * 1000 >= budget_ms:
+                    break
+        RERANKED.inc(scored)
+        # Scored hits by cross-encoder score, then anything the budget cut off in retrieval order
+        reranked = sorted(head[:scored], key=lambda r: r["rerank_score"], reverse=True)
+        results = reranked + head[scored:] + tail
+
+    return _finish(results, store, top_k, with_scores)
+
+def search_clauses_batch(query_embeddings, index, store, query_texts=None, top_k=3, context_window=1, scorer=None,
+                         candidates=None, rerank_depth=None, skip_gap=None, with_scores=False,
+                         nprobe=None, ef_search=None, lexical=None, lexical_candidates=None):
+    """
+    search_clauses for many queries at once: one FAISS search over the whole
+    query matrix and one scorer call with the (query, clause) pairs of every
+    query that needs reranking. Returns one result list per query, in order.
+    There is no rerank time budget; the options mean the same as above.
+    """
+    candidates = CANDIDATES if candidates is None else candidates
+    rerank_depth = RERANK_DEPTH if rerank_depth is None else rerank_depth
+    skip_gap = RERANK_SKIP_GAP if skip_gap is None else skip_gap
+    lexical_candidates = LEXICAL_CANDIDATES if lexical_candidates is None else lexical_candidates
+    query_texts = query_texts if query_texts is not None else [None] * len(query_embeddings)
+
+    with metrics.stage("index_search"):
+        D, I = index.search(np.asarray(query_embeddings, dtype=np.float32), max(top_k, candidates),
+                            params=search_parameters(index, nprobe, ef_search))
+    per_query = []
+    heads = []
+    for q, query_text in enumerate(query_texts):
+        results, decisive = _candidates(D[q], I[q], store, query_text, skip_gap, lexical, lexical_candidates,
+                                        context_window)
+        per_query.append(results)
+        depth = min(rerank_depth, len(results))
+        if query_text is not None and depth > 0 and decisive:
+            RERANK_SKIPPED.inc()
+        if query_text is not None and depth > 0 and not decisive:
+            for r in results[:depth]:
+                r["clause"] = _build_context(r["window"], store)
+            heads.append((q, depth))
+
+    pairs = [(query_texts[q], r["clause"]) for q, depth in heads for r in per_query[q][:depth]]
+    if pairs:
+        with metrics.stage("rerank"):
+            scores = iter((scorer or rerank_pairs)(pairs))
+        RERANKED.inc(len(pairs))
+        for q, depth in heads:
+            head = per_query[q][:depth]
+            for r in head:
+                r["rerank_score"] = float(next(scores))
+            per_query[q] = sorted(head, key=lambda r: r["rerank_score"], reverse=True) + per_query[q][depth:]
+
+    return [_finish(results, store, top_k, with_scores) for results in per_query]
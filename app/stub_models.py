@@ -0,0 +1,97 @@
+# app/stub_models.py
+#
+# Deterministic stand-ins for the embedder, tokenizer, cross-encoder and
+# spaCy pipeline, used instead of the real models when LLM_STUB_MODELS=1 (or
+# after models.use_stubs()). They need no download, load instantly and give
+# the same output on every machine, so benchmarks and smoke tests run
+# offline with results that can be compared between commits. Their scores
+# mean little: texts sharing words embed close together and rerank higher.
+
+import hashlib
+import re
+
+import numpy as np
+
+STUB_DIM = 384
+STUB_MODEL_ID = "stub-hashed-bow"
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+WORD_RE = re.compile(r"\w+")
+
+# Names the stub NER recognises; scripts/bench_stages.py writes its legal corpus from them
+PERSONS = ("Alice Smith", "Bob Johnson", "Priya Sharma", "Rahul Mehta", "Maria Garcia", "Chen Wei")
+ORGANIZATIONS = ("Acme Corporation", "Star Health Insurance", "Bharat Logistics Limited", "Globex Holdings")
+PLACES = ("Pune", "Delhi", "Mumbai", "Bangalore", "Chennai", "Hyderabad")
+MONTHS = ("january", "february", "march", "april", "may", "june", "july", "august", "september",
+          "october", "november", "december")
+
+
+def _bucket(word, _cache={}):
+    bucket = _cache.get(word)
+    if bucket is None:
+        bucket = _cache[word] = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(),
+                                               "little") % STUB_DIM
+    return bucket
+
+
+class StubEmbedder:
+    """Normalised hashed bag of words, with the SentenceTransformer calls the app makes."""
+
+    def get_sentence_embedding_dimension(self):
+        return STUB_DIM
+
+    def encode(self, texts, show_progress_bar=False, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        out = np.zeros((len(texts), STUB_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in WORD_RE.findall(text.lower()):
+                out[i, _bucket(word)] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        out /= np.where(norms > 0, norms, 1.0)
+        return out[0] if single else out
+
+
+class StubCrossEncoder:
+    """Fraction of the query's words found in the clause."""
+
+    def predict(self, pairs, show_progress_bar=False, batch_size=32, **kwargs):
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for i, (query, clause) in enumerate(pairs):
+            words = set(WORD_RE.findall(query.lower()))
+            if words:
+                scores[i] = len(words & set(WORD_RE.findall(clause.lower()))) / len(words)
+        return scores
+
+
+class StubTokenizer:
+    """Words and punctuation marks as tokens; only the call chunker.token_offsets makes."""
+
+    def __call__(self, text, return_offsets_mapping=False, **kwargs):
+        offsets = [m.span() for m in TOKEN_RE.finditer(text)]
+        encoding = {"input_ids": list(range(len(offsets)))}
+        if return_offsets_mapping:
+            encoding["offset_mapping"] = offsets
+        return encoding
+
+
+def load_stub_nlp():
+    """A blank English spaCy pipeline whose entity ruler knows PERSONS, ORGANIZATIONS, PLACES and dates."""
+    import spacy
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns(
+        [{"label": "PERSON", "pattern": name} for name in PERSONS]
+        + [{"label": "ORG", "pattern": name} for name in ORGANIZATIONS]
+        + [{"label": "GPE", "pattern": name} for name in PLACES]
+        + [{"label": "DATE", "pattern": [{"IS_DIGIT": True}, {"LOWER": {"IN": list(MONTHS)}}, {"IS_DIGIT": True}]}]
+    )
+    return nlp
+
+
+# Loader of each stubbed model, by registry name
+STUBS = {
+    "embedder": StubEmbedder,
+    "tokenizer": StubTokenizer,
+    "cross_encoder": StubCrossEncoder,
+    "nlp": load_stub_nlp,
+}
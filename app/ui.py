@@ -1,12 +1,12 @@
 import streamlit as st
 import httpx
+import json
 import re
-import time
 from datetime import datetime
 from PyPDF2 import PdfReader
 import docx
 
-API_URL = "http://localhost:8000/api/analyze_query"
+STREAM_URL = "http://localhost:8000/api/analyze_stream"
 UPLOAD_URL = "http://localhost:8000/api/upload_document"
 LIST_URL = "http://localhost:8000/api/list_documents"
 REBUILD_URL = "http://localhost:8000/api/rebuild_index"
@@ -14,18 +14,24 @@ DELETE_URL = "http://localhost:8000/api/delete_document"
 
 
 # ---------- Backend Functions ----------
-def analyze(query, domain, use_llm=True):
+def analyze_stream(query, domain, use_llm=True):
+    """(event, data) pairs from the streaming endpoint as they arrive: retrieved, reranked, then result or error."""
     try:
         with httpx.Client(timeout=120) as client:
-            response = client.post(
-                API_URL,
-                json={"query": query, "domain": domain, "use_llm": use_llm},
-            )
-        if response.status_code != 200:
-            return {"error": f"❌ Error {response.status_code}"}
-        return response.json()
+            with client.stream(
+                "POST", STREAM_URL, json={"query": query, "domain": domain, "use_llm": use_llm}
+            ) as response:
+                if response.status_code != 200:
+                    yield "error", {"detail": f"❌ Error {response.status_code}"}
+                    return
+                event = None
+                for line in response.iter_lines():
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:") and event:
+                        yield event, json.loads(line[len("data:"):])
     except Exception as e:
-        return {"error": f"⚠️ Error: {str(e)}"}
+        yield "error", {"detail": f"⚠️ Error: {str(e)}"}
 
 
 def upload_document(file):
@@ -82,14 +88,55 @@ def rebuild_index():
 
 
 # ---------- Helpers ----------
-def stream_response(text):
-    placeholder = st.empty()
-    final_output = ""
-    for word in text.split():
-        final_output += word + " "
-        placeholder.markdown(final_output)
-        time.sleep(0.03)
-    return final_output
+def format_answer(result):
+    answer = f"**Decision:** {result.get('decision')}"
+    if result.get("amount") is not None:
+        answer += f"  \n**Amount:** {result['amount']}"
+    answer += f"\n\n{result.get('justification', '')}"
+    for field in ("parties", "organizations", "dates"):
+        if result.get(field):
+            answer += f"\n\n**{field.capitalize()}:** {', '.join(result[field])}"
+    if result.get("jurisdiction"):
+        answer += f"\n\n**Jurisdiction:** {result['jurisdiction']}"
+    return answer
+
+
+def format_clause(clause):
+    if clause.get("section"):
+        return f"**{clause['section']}** ({clause['document']})\n\n{clause['clause']}"
+    return clause["clause"]
+
+
+def show_clauses(placeholder, clauses, title):
+    with placeholder.container():
+        st.markdown(f"**{title}**")
+        for clause in clauses:
+            st.markdown(highlight_entities(format_clause(clause)), unsafe_allow_html=True)
+
+
+def show_stream(query, domain, use_llm, answer_box, clauses_box):
+    """
+    Render an analysis as it streams in: the retrieved clauses as soon as
+    the index search returns, their reranked order, then the decision.
+    Returns the final answer text.
+    """
+    answer_box.markdown("🔎 Searching...")
+    for event, data in analyze_stream(query, domain, use_llm):
+        if event == "retrieved":
+            answer_box.markdown("⚖️ Ranking clauses...")
+            show_clauses(clauses_box, data["clauses"], "📂 Retrieved Clauses (ranking...)")
+        elif event == "reranked":
+            answer_box.markdown("🧮 Evaluating...")
+            show_clauses(clauses_box, data["clauses"], "📂 Retrieved Clauses")
+        elif event == "result":
+            answer = format_answer(data)
+            answer_box.markdown(highlight_entities(answer), unsafe_allow_html=True)
+            show_clauses(clauses_box, data.get("retrieved_clauses", []), "📂 Retrieved Clauses")
+            return answer
+        elif event == "error":
+            answer_box.error(data["detail"])
+            return data["detail"]
+    return ""
 
 
 def extract_preview(file):
@@ -155,22 +202,11 @@ def main():
         use_llm = st.checkbox("Use LLM for reasoning", value=True)
 
         if st.button("Analyze"):
-            with st.spinner("🔎 Analyzing..."):
-                result = analyze(query, domain, use_llm)
-
-            if "error" in result:
-                st.error(result["error"])
-            else:
-                answer = result.get("answer", "")
-                sources = result.get("sources", [])
-
-                with st.expander("📌 Analysis Result", expanded=True):
-                    st.markdown(highlight_entities(answer), unsafe_allow_html=True)
-
-                if sources:
-                    with st.expander("📂 Retrieved Clauses / Sources"):
-                        for src in sources:
-                            st.markdown(highlight_entities(src), unsafe_allow_html=True)
+            with st.expander("📌 Analysis Result", expanded=True):
+                answer_box = st.empty()
+            with st.expander("📂 Retrieved Clauses / Sources", expanded=True):
+                clauses_box = st.empty()
+            show_stream(query, domain, use_llm, answer_box, clauses_box)
 
     # -------- Tab 2: Chat Interface --------
     with tab2:
@@ -180,9 +216,6 @@ def main():
         domain_chat = st.selectbox("Select Domain (Chat)", ["insurance", "legal"], index=0, key="chat_domain")
         use_llm_chat = st.checkbox("Use LLM", value=True, key="chat_llm")
 
-        docs = list_documents()
-        selected_docs = st.multiselect("Select documents to include in chat context", docs, default=docs[:1])
-
         # Display chat history
         for user_msg, bot_msg, timestamp in st.session_state.chat_history:
             with st.chat_message("user", avatar="📘"):
@@ -199,36 +232,9 @@ def main():
 
             with st.chat_message("assistant", avatar="🤖"):
                 placeholder = st.empty()
-                final_answer = ""
-
-                try:
-                    with httpx.Client(timeout=120) as client:
-                        response = client.post(
-                            API_URL,
-                            json={
-                                "query": prompt,
-                                "domain": domain_chat,
-                                "use_llm": use_llm_chat,
-                                "documents": selected_docs
-                            },
-                        )
-                    if response.status_code == 200:
-                        result = response.json()
-                        final_answer = result.get("answer", "")
-                        sources = result.get("sources", [])
-
-                        placeholder.markdown(highlight_entities(final_answer), unsafe_allow_html=True)
-
-                        if sources:
-                            with st.expander("📂 Sources"):
-                                for src in sources:
-                                    st.markdown(highlight_entities(src), unsafe_allow_html=True)
-                    else:
-                        final_answer = f"❌ Error {response.status_code}"
-                        placeholder.error(final_answer)
-                except Exception as e:
-                    final_answer = f"⚠️ Error: {str(e)}"
-                    placeholder.error(final_answer)
+                with st.expander("📂 Sources", expanded=True):
+                    sources_box = st.empty()
+                final_answer = show_stream(prompt, domain_chat, use_llm_chat, placeholder, sources_box)
 
             st.session_state.chat_history.append((prompt, final_answer, timestamp))
 
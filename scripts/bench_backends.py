@@ -0,0 +1,145 @@
+# scripts/bench_backends.py
+#
+# Latency and throughput of the inference backends (app/inference.py) for
+# the embedder and the cross-encoder, per torch thread count: single-text
+# encode latency, one query's rerank call, and batch throughput. By default
+# both models are small random BERTs built in a temporary directory, so no
+# network is needed; --real times the configured models (downloaded or from
+# the Hugging Face cache). Random weights say nothing about accuracy: check
+# that with scripts/check_backend_parity.py before switching backends.
+#
+#   python scripts/bench_backends.py --backends torch int8 onnx --threads 1 4
+#   python scripts/bench_backends.py --real
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from app.inference import BACKENDS, load_cross_encoder, load_sentence_transformer
+from app.retriever.embedder import EMBEDDING_MODEL
+from app.retriever.vector_store import CROSS_ENCODER_MODEL
+
+WORDS = ("policy insured claim hospital surgery premium coverage waiting period clause party court knee "
+         "jurisdiction agreement notice termination benefit exclusion amount payable days months the of "
+         "for in is to a be and shall under after within any").split()
+
+
+def build_tiny_models(path, seed=0):
+    """A small random sentence-transformers embedder and cross-encoder over WORDS, saved under path."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling, Transformer
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import BertConfig, BertForSequenceClassification, BertModel, PreTrainedTokenizerFast
+
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    vocab = {token: i for i, token in enumerate(specials + sorted(set(WORDS)))}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.post_processor = processors.BertProcessing(("[SEP]", vocab["[SEP]"]), ("[CLS]", vocab["[CLS]"]))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]", pad_token="[PAD]",
+                                        cls_token="[CLS]", sep_token="[SEP]", mask_token="[MASK]")
+    config = BertConfig(vocab_size=len(vocab), hidden_size=128, num_hidden_layers=2, num_attention_heads=4,
+                        intermediate_size=512, max_position_embeddings=512, initializer_range=0.1, num_labels=1)
+    torch.manual_seed(seed)
+
+    encoder_path = os.path.join(path, "encoder")
+    BertModel(config).save_pretrained(encoder_path)
+    tokenizer.save_pretrained(encoder_path)
+    embedder_path = os.path.join(path, "embedder")
+    SentenceTransformer(modules=[Transformer(encoder_path, max_seq_length=256), Pooling(config.hidden_size, "mean"),
+                                 Normalize()]).save(embedder_path)
+
+    cross_encoder_path = os.path.join(path, "cross_encoder")
+    BertForSequenceClassification(config).save_pretrained(cross_encoder_path)
+    tokenizer.save_pretrained(cross_encoder_path)
+    return embedder_path, cross_encoder_path
+
+
+def synthetic_texts(count, rng):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 120))) for _ in range(count)]
+
+
+def rerank_groups(texts, queries, candidates, rng):
+    return [[(q, c) for c in rng.sample(texts, candidates)] for q in queries]
+
+
+def latency_ms(fn, batches):
+    """Median milliseconds of fn(batch) over batches."""
+    times = []
+    for batch in batches:
+        start = time.perf_counter()
+        fn(batch)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def throughput(fn, items, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        fn(items[i:i + batch_size])
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference backend latency and throughput")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="torch intra-op thread counts to time")
+    parser.add_argument("--real", action="store_true", help=f"use {EMBEDDING_MODEL} and {CROSS_ENCODER_MODEL}")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=20, help="clauses reranked per query")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=50, help="single-text calls timed for latency")
+    args = parser.parse_args()
+
+    import torch
+
+    rng = random.Random(0)
+    texts = synthetic_texts(args.texts, rng)
+    groups = rerank_groups(texts, synthetic_texts(args.queries, rng), args.candidates, rng)
+    pairs = [pair for group in groups for pair in group]
+
+    with tempfile.TemporaryDirectory(prefix="bench_backends_") as tmp:
+        if args.real:
+            embedder_name, cross_encoder_name = EMBEDDING_MODEL, CROSS_ENCODER_MODEL
+        else:
+            embedder_name, cross_encoder_name = build_tiny_models(tmp)
+
+        print(f"{'backend':>8} {'threads':>7} {'embed ms':>8} {'texts/s':>8} {'rerank ms':>9} {'pairs/s':>8}")
+        for backend in args.backends:
+            try:
+                embedder = load_sentence_transformer(embedder_name, backend)
+                cross_encoder = load_cross_encoder(cross_encoder_name, backend)
+            except ImportError as e:
+                print(f"{backend:>8} skipped: {e}")
+                continue
+
+            def encode(items):
+                return embedder.encode(items, batch_size=args.batch_size, show_progress_bar=False)
+
+            def predict(items):
+                return cross_encoder.predict(items, batch_size=args.batch_size, show_progress_bar=False)
+
+            # Warm-up pass (lazy initialisation, allocator)
+            encode(texts[:args.batch_size])
+            predict(pairs[:args.batch_size])
+            for threads in args.threads:
+                torch.set_num_threads(threads)
+                embed_ms = latency_ms(encode, [[t] for t in texts[:args.repeat]])
+                texts_per_s = throughput(encode, texts, args.batch_size)
+                # One request's rerank: all candidates of a query in one call
+                rerank_ms = latency_ms(predict, groups[:args.repeat])
+                pairs_per_s = throughput(predict, pairs, args.batch_size)
+                print(f"{backend:>8} {threads:>7} {embed_ms:>8.2f} {texts_per_s:>8.0f} {rerank_ms:>9.2f} {pairs_per_s:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
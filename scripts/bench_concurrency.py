@@ -0,0 +1,65 @@
+# scripts/bench_concurrency.py
+#
+# Measures /api/analyze_query throughput against a running server at
+# increasing client counts. With the model stages off the event loop,
+# requests/s should grow with the number of clients until the inference
+# pool (LLM_INFERENCE_WORKERS) is saturated, instead of staying flat.
+#
+#   uvicorn app.main:app
+#   python scripts/bench_concurrency.py --clients 1 2 4 8 16
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_URL = "http://localhost:8000/api/analyze_query"
+DEFAULT_QUERY = "46-year-old male, knee surgery in Pune, 3-month-old insurance policy"
+
+
+def post_query(url, query, domain):
+    body = json.dumps({"query": query, "domain": domain}).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+
+def run_level(url, query, domain, clients, requests_per_client):
+    total = clients * requests_per_client
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(lambda _: post_query(url, query, domain), range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "clients": clients,
+        "requests": total,
+        "throughput_rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (total - 1))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency benchmark for /api/analyze_query")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--query", default=DEFAULT_QUERY)
+    parser.add_argument("--domain", default="insurance")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=20, help="requests per client at each level")
+    args = parser.parse_args()
+
+    post_query(args.url, args.query, args.domain)  # warm-up
+    print(f"{'clients':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for clients in args.clients:
+        r = run_level(args.url, args.query, args.domain, clients, args.requests)
+        print(f"{r['clients']:>8} {r['requests']:>9} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
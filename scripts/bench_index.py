@@ -0,0 +1,104 @@
+# scripts/bench_index.py
+#
+# Recall@k versus query latency of the approximate index types against the
+# exact IndexFlatL2 baseline, to choose an index setting per corpus size.
+# Runs either on the vectors of the current (flat) index or on synthetic
+# clustered vectors of the given sizes:
+#
+#   python scripts/bench_index.py
+#   python scripts/bench_index.py --synthetic 10000 100000 --nprobe 4 16 64 --ef-search 32 128
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.retriever.index_factory import build_faiss_index, search_parameters
+from app.retriever.snapshots import current_snapshot, index_path
+
+
+def synthetic_vectors(n, dim, seed, clusters=256):
+    """Unit-length vectors drawn around random cluster centres, like sentence embeddings of a corpus."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centres[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def time_queries(index, queries, k, params):
+    latencies = []
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], k, params=params)
+        latencies.append(time.perf_counter() - start)
+        ids[i] = I[0]
+    latencies.sort()
+    return ids, 1000 * float(np.mean(latencies)), 1000 * latencies[int(0.95 * (len(latencies) - 1))]
+
+
+def recall_at_k(ids, truth):
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(ids, truth)]))
+
+
+def report(corpus, queries, args):
+    n, dim = corpus.shape
+    flat, _ = build_faiss_index(corpus, "flat")
+    truth, flat_mean, flat_p95 = time_queries(flat, queries, args.k, None)
+    print(f"\n{n} vectors x {dim} dims, {len(queries)} queries, recall@{args.k} vs IndexFlatL2")
+    print(f"{'type':<9} {'setting':<13} {'build s':>8} {'MB':>8} {'recall':>7} {'mean ms':>8} {'p95 ms':>8}")
+    flat_mb = faiss.serialize_index(flat).nbytes / 2**20
+    print(f"{'flat':<9} {'exact':<13} {'':>8} {flat_mb:>8.1f} {1.0:>7.3f} {flat_mean:>8.3f} {flat_p95:>8.3f}")
+
+    for index_type in args.types:
+        start = time.perf_counter()
+        index, params = build_faiss_index(corpus, index_type, args.train_size)
+        build_s = time.perf_counter() - start
+        mb = faiss.serialize_index(index).nbytes / 2**20
+        if index_type == "hnsw":
+            settings = [("efSearch", ef, search_parameters(index, ef_search=ef)) for ef in args.ef_search]
+        else:
+            settings = [("nprobe", p, search_parameters(index, nprobe=p))
+                        for p in args.nprobe if p <= params["nlist"]]
+        for name, value, search_params in settings:
+            ids, mean_ms, p95_ms = time_queries(index, queries, args.k, search_params)
+            print(f"{index_type:<9} {f'{name}={value}':<13} {build_s:>8.2f} {mb:>8.1f} "
+                  f"{recall_at_k(ids, truth):>7.3f} {mean_ms:>8.3f} {p95_ms:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency of approximate FAISS indexes vs flat")
+    parser.add_argument("--synthetic", type=int, nargs="*", help="corpus sizes of synthetic vectors to test")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=["ivf_flat", "ivf_pq", "hnsw"])
+    parser.add_argument("--train-size", type=int)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        for n in args.synthetic:
+            data = synthetic_vectors(n + args.queries, args.dim, args.seed)
+            report(data[args.queries:], data[:args.queries], args)
+    else:
+        snapshot = current_snapshot()
+        if snapshot is None:
+            sys.exit("No index yet; run scripts/build_vector_index.py first or use --synthetic")
+        index = faiss.read_index(index_path(snapshot))
+        if not isinstance(index, faiss.IndexFlat):
+            sys.exit("The current index is not flat; rebuild it with --index-type flat or use --synthetic")
+        corpus = index.reconstruct_n(0, index.ntotal)
+        rng = np.random.default_rng(args.seed)
+        queries = corpus[rng.choice(len(corpus), min(args.queries, len(corpus)), replace=False)]
+        report(corpus, queries, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# scripts/bench_ingest.py
+#
+# Wall time and peak memory of the streaming ingestion pipeline on synthetic
+# TXT corpora, per corpus size and number of parser processes. Each run
+# happens in a fresh process so peak RSS is not shared between runs. Peak RSS
+# should stay roughly flat as --docs grows, and wall time should drop as
+# --workers grows until embedding becomes the bottleneck (--parse-only
+# isolates the parsing stage):
+#
+#   python scripts/bench_ingest.py --docs 200 2000 --workers 1 2 4
+#   python scripts/bench_ingest.py --docs 5000 --workers 1 4 --parse-only
+
+import sys
+import os
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+import argparse
+import json
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+WORDS = ("policy insured claim hospital surgery premium coverage waiting period clause party court "
+         "jurisdiction agreement notice termination benefit exclusion amount payable days months").split()
+
+
+def write_corpus(folder, n_docs, sections, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for d in range(n_docs):
+        with open(os.path.join(folder, f"doc_{d:06d}.txt"), "w", encoding="utf-8") as f:
+            for s in range(sections):
+                f.write(f"SECTION {s + 1}: {rng.choice(WORDS).upper()}\n")
+                for _ in range(rng.randint(1, 3)):
+                    f.write(" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))) + ".\n\n")
+
+
+def run_child(docs_dir, workers, batch_size, parse_only):
+    from app.retriever.chunk_store import ChunkStoreWriter
+    from app.retriever.index_factory import IndexBuilder
+    from app.retriever.ingest import IngestProgress, embed_and_store, parse_documents
+
+    filenames = sorted(os.listdir(docs_dir))
+    progress = IngestProgress(len(filenames), label="bench")
+    start = time.perf_counter()
+    documents = parse_documents(docs_dir, filenames, workers, progress=progress)
+    if parse_only:
+        for _, _, chunks in documents:
+            for _ in chunks:
+                pass
+    else:
+        store_path = os.path.join(os.path.dirname(docs_dir), "chunks")
+        builder = IndexBuilder("flat")
+        embed_and_store(documents, builder.add, ChunkStoreWriter(store_path), batch_size, progress)
+    wall = time.perf_counter() - start
+    print(json.dumps({
+        "wall_s": wall,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "chunks": progress.chunks,
+        "stats": progress.stats(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming ingestion wall time and peak RSS")
+    parser.add_argument("--docs", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--sections", type=int, default=10, help="sections per synthetic document")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--parse-only", action="store_true", help="skip embedding and indexing")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workers[0], args.batch_size, args.parse_only)
+        return
+
+    print(f"{'docs':>7} {'workers':>7} {'chunks':>8} {'wall s':>8} {'chunks/s':>9} {'peak MB':>8} {'parse wait s':>12}")
+    for n_docs in args.docs:
+        tmp = tempfile.mkdtemp(prefix="bench_ingest_")
+        try:
+            docs_dir = os.path.join(tmp, "documents")
+            write_corpus(docs_dir, n_docs, args.sections)
+            for workers in args.workers:
+                cmd = [sys.executable, __file__, "--child", docs_dir, "--workers", str(workers),
+                       "--batch-size", str(args.batch_size)] + (["--parse-only"] if args.parse_only else [])
+                out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                print(f"{n_docs:>7} {workers:>7} {r['chunks']:>8} {r['wall_s']:>8.2f} {r['chunks'] / r['wall_s']:>9.0f} "
+                      f"{r['peak_rss_mb']:>8.0f} {r['stats']['parse']['wait_seconds']:>12.2f}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# scripts/bench_lexical.py
+#
+# Build time and query latency of the lexical index on synthetic chunks, and
+# of rank_bm25 on the same corpus when it is installed and the corpus is small
+# enough for it. p50 should stay below a millisecond as --chunks grows:
+#
+#   python scripts/bench_lexical.py --chunks 10000 100000 1000000
+#   python scripts/bench_lexical.py --chunks 20000 --compare-bm25
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.retriever.lexical import LexicalIndexWriter, average_length, tokenize
+
+# A skewed vocabulary: a few very common words and a long tail of rare ones
+COMMON = ("the of and to in a is for be by or any shall policy insured such this with under as".split())
+
+
+def synthetic_chunks(n, vocabulary, seed):
+    rng = random.Random(seed)
+    tail = [f"term{i}" for i in range(vocabulary)]
+    for _ in range(n):
+        words = [rng.choice(COMMON) if rng.random() < 0.5 else tail[int(rng.paretovariate(1.1)) % vocabulary]
+                 for _ in range(rng.randint(40, 120))]
+        yield " ".join(words)
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lexical index build time and query latency")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--compare-bm25", action="store_true", help="also time rank_bm25 (slow above ~50k chunks)")
+    args = parser.parse_args()
+
+    print(f"{'chunks':>9} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'bm25 p50 ms':>12}")
+    for n in args.chunks:
+        tmp = tempfile.mkdtemp(prefix="bench_lexical_")
+        try:
+            start = time.perf_counter()
+            avg_length = average_length(synthetic_chunks(n, args.vocabulary, seed=n))
+            writer = LexicalIndexWriter(os.path.join(tmp, "lexical"), avg_length=avg_length)
+            for text in synthetic_chunks(n, args.vocabulary, seed=n):
+                writer.add(text)
+            index = writer.close()
+            build = time.perf_counter() - start
+
+            queries = [" ".join(text.split()[:4]) for text in synthetic_chunks(args.queries, args.vocabulary, seed=1)]
+            index.search(queries[0], args.k)  # map the segments
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                index.search(q, args.k)
+                latencies.append(time.perf_counter() - start)
+            p50, p95 = percentiles(latencies)
+
+            bm25 = "-"
+            if args.compare_bm25:
+                try:
+                    from rank_bm25 import BM25Okapi
+                except ImportError:
+                    bm25 = "not installed"
+                else:
+                    ranker = BM25Okapi([tokenize(t) for t in synthetic_chunks(n, args.vocabulary, seed=n)])
+                    latencies = []
+                    for q in queries[:20]:
+                        start = time.perf_counter()
+                        np.argsort(-ranker.get_scores(tokenize(q)))[:args.k]
+                        latencies.append(time.perf_counter() - start)
+                    bm25 = f"{percentiles(latencies)[0]:.2f}"
+            index.close()
+            print(f"{n:>9} {build:>8.1f} {p50:>8.3f} {p95:>8.3f} {bm25:>12}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# scripts/bench_parser.py
+#
+# extract_info cost per query as the gazetteers grow: synthetic procedure,
+# city and hospital lists of each size are compiled into a QueryParser and
+# timed on synthetic claim descriptions. The time per query should stay
+# roughly flat:
+#
+#   python scripts/bench_parser.py --entries 10 1000 10000 100000
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import random
+import time
+
+from app.parser.gazetteer import QueryParser
+
+
+def synthetic_gazetteers(n, rng):
+    gazetteers = {}
+    for field, prefix in (("procedure", "procedure"), ("location", "city"), ("hospital", "hospital")):
+        names = [f"{prefix} {rng.randrange(10 ** 6)}" for _ in range(n)]
+        gazetteers[field] = ([(name, name) for name in names], False)
+    codes = [(f"Z{i // 100:02d}.{i % 100:02d}", f"code {i}") for i in range(min(n, 10000))]
+    gazetteers["icd_codes"] = (codes, True)
+    return gazetteers
+
+
+def synthetic_queries(gazetteers, count, rng):
+    queries = []
+    for _ in range(count):
+        procedure = rng.choice(gazetteers["procedure"][0])[0]
+        city = rng.choice(gazetteers["location"][0])[0]
+        queries.append(f"{rng.randint(18, 90)}-year-old patient, {procedure} in {city}, "
+                       f"{rng.randint(1, 48)}-month-old insurance policy, claim filed last week")
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query parsing cost versus gazetteer size")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10, 1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'entries':>8} {'compile s':>9} {'us/query':>9}")
+    for n in args.entries:
+        gazetteers = synthetic_gazetteers(n, rng)
+        start = time.perf_counter()
+        query_parser = QueryParser(gazetteers)
+        compile_s = time.perf_counter() - start
+        queries = synthetic_queries(gazetteers, args.queries, rng)
+        start = time.perf_counter()
+        for q in queries:
+            query_parser.parse(q)
+        per_query = (time.perf_counter() - start) / len(queries) * 1e6
+        print(f"{n:>8} {compile_s:>9.2f} {per_query:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
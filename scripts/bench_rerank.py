@@ -0,0 +1,86 @@
+# scripts/bench_rerank.py
+#
+# Recall and latency of search_clauses across retrieval settings
+# (candidates N, rerank depth M, skip gap, rerank budget) on the current index.
+# The reference for each query is the cross-encoder order over the top
+# --reference-depth FAISS hits; recall@k is the share of the reference top-k
+# that a setting returns.
+#
+#   python scripts/bench_rerank.py --queries queries.txt --top-k 3
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import itertools
+import statistics
+import time
+
+from app.retriever.embedder import get_model as get_embedder
+from app.retriever.snapshots import current_snapshot, load_snapshot
+from app.retriever.vector_store import rerank_pairs, search_clauses
+
+DEFAULT_QUERIES = [
+    "46-year-old male, knee surgery in Pune, 3-month-old insurance policy",
+    "emergency hospitalization covered from day 1",
+    "hip replacement waiting period",
+    "which court has jurisdiction over the dispute",
+    "who are the parties to the contract",
+    "appeal to the High Court within 30 days",
+]
+
+
+def load_queries(path):
+    if not path:
+        return DEFAULT_QUERIES
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark for search_clauses settings")
+    parser.add_argument("--queries", help="text file with one query per line")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--reference-depth", type=int, default=50)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[3, 10, 20, 50])
+    parser.add_argument("--rerank-depth", type=int, nargs="+", default=[0, 3, 10, 20])
+    parser.add_argument("--skip-gap", type=float, nargs="+", default=[0.0, 0.5])
+    parser.add_argument("--budget-ms", type=float, nargs="+", default=[0.0])
+    args = parser.parse_args()
+
+    snapshot = current_snapshot()
+    if snapshot is None:
+        sys.exit("No index yet; run scripts/build_vector_index.py first")
+    index, store, _, _ = load_snapshot(snapshot)
+    queries = load_queries(args.queries)
+    embeddings = get_embedder().encode(queries, show_progress_bar=False)
+
+    references = []
+    for query, emb in zip(queries, embeddings):
+        ref = search_clauses(emb, index, store, top_k=args.top_k, query_text=query,
+                             scorer=rerank_pairs, candidates=args.reference_depth,
+                             rerank_depth=args.reference_depth, skip_gap=0, budget_ms=0, with_scores=True)
+        references.append({r["chunk_id"] for r in ref})
+
+    print(f"{len(queries)} queries, {index.ntotal} vectors, recall@{args.top_k} vs full rerank "
+          f"of the top {args.reference_depth}")
+    print(f"{'N':>5} {'M':>5} {'gap':>5} {'budget':>7} {'recall':>7} {'mean ms':>8} {'p95 ms':>8}")
+    for n, m, gap, budget in itertools.product(args.candidates, args.rerank_depth, args.skip_gap, args.budget_ms):
+        if m > n:
+            continue
+        latencies, recalls = [], []
+        for query, emb, ref in zip(queries, embeddings, references):
+            start = time.perf_counter()
+            hits = search_clauses(emb, index, store, top_k=args.top_k, query_text=query,
+                                  scorer=rerank_pairs, candidates=n, rerank_depth=m,
+                                  skip_gap=gap, budget_ms=budget, with_scores=True)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(ref & {r["chunk_id"] for r in hits}) / max(len(ref), 1))
+        latencies.sort()
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(f"{n:>5} {m:>5} {gap:>5.2f} {budget:>7g} {statistics.mean(recalls):>7.3f} "
+              f"{statistics.mean(latencies) * 1000:>8.2f} {p95 * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# scripts/bench_rules.py
+#
+# Insurance evaluation cost per clause as the number of rules grows: the
+# compiled rule engine (one automaton scan per clause, and a cache hit when
+# the chunk was matched before) against checking every rule's phrases with
+# substring tests, as the old hardcoded chain did. The engine's cost should
+# stay roughly flat:
+#
+#   python scripts/bench_rules.py --rules 10 100 1000 10000
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import random
+import time
+
+from app.parser.automaton import ahocorasick
+from app.retriever.rules import RuleEngine
+
+BODY = ("the insured shall be entitled to reimbursement of expenses incurred for the treatment "
+        "subject to the waiting period and the sum insured stated in the schedule of the policy").split()
+
+
+def synthetic_rules(n, rng):
+    rules = []
+    for i in range(n):
+        rules.append({
+            "name": f"rule_{i}",
+            "clause_contains": [f"procedure {i}", f"{rng.randint(1, 48)} months"],
+            "when": {"policy_duration_months": {"min": rng.randint(1, 48)}},
+            "decision": "approved",
+            "amount": rng.randint(1, 100) * 1000,
+        })
+    return rules
+
+
+def synthetic_clauses(count, n_rules, rng):
+    clauses = []
+    for _ in range(count):
+        words = [rng.choice(BODY) for _ in range(rng.randint(60, 180))]
+        # About half the clauses mention a rule's procedure
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), f"procedure {rng.randrange(n_rules)} after {rng.randint(1, 48)} months")
+        clauses.append(" ".join(words))
+    return clauses
+
+
+def naive(rules, structured, clauses):
+    decision, amount = "rejected", 0
+    for clause in clauses:
+        text = clause.lower()
+        for rule in rules:
+            if all(p in text for p in rule["clause_contains"]):
+                if (structured["policy_duration_months"] or 0) >= rule["when"]["policy_duration_months"]["min"]:
+                    decision, amount = rule["decision"], rule["amount"]
+                break
+    return decision, amount
+
+
+class _Store:
+    path = "bench"
+
+
+def per_clause_us(fn, clauses, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / (repeat * len(clauses)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule evaluation cost versus rule count")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--clauses", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    structured = {"policy_duration_months": 24, "procedure": "unknown"}
+    print(f"matcher: {'pyahocorasick' if ahocorasick else 'pure Python'}")
+    print(f"{'rules':>7} {'compile ms':>10} {'engine us':>10} {'cached us':>10} {'naive us':>10}")
+    for n in args.rules:
+        rules = synthetic_rules(n, rng)
+        clauses = synthetic_clauses(args.clauses, n, rng)
+        start = time.perf_counter()
+        engine = RuleEngine(rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        for clause, expected in zip(clauses, (naive(rules, structured, [c]) for c in clauses)):
+            result = engine.evaluate(structured, [clause])
+            assert (result["decision"], result["amount"]) == expected
+
+        store = _Store()
+
+        def cached():
+            matches = [engine.match_chunk(store, i, c) for i, c in enumerate(clauses)]
+            engine.evaluate(structured, clauses, matches)
+
+        cached()  # fill the match cache
+        engine_us = per_clause_us(lambda: engine.evaluate(structured, clauses), clauses, args.repeat)
+        cached_us = per_clause_us(cached, clauses, args.repeat)
+        naive_us = per_clause_us(lambda: naive(rules, structured, clauses), clauses, 1 if n > 1000 else args.repeat)
+        print(f"{n:>7} {compile_ms:>10.1f} {engine_us:>10.1f} {cached_us:>10.1f} {naive_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
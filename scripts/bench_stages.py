@@ -0,0 +1,327 @@
+# scripts/bench_stages.py
+#
+# Time each stage of the pipeline on its own, on generated insurance and
+# legal corpora: load_documents, split_text_to_chunks, chunk embedding,
+# index build, search_clauses without and with the cross-encoder rerank,
+# extract_info and evaluate. By default the models are the deterministic
+# stubs of app/stub_models.py, so no network is needed and runs on different
+# commits are comparable; --real times the configured models. Results are
+# written as JSON (--output), and --baseline compares a run with an earlier
+# file, exiting with status 1 when a stage got slower than --max-regression:
+#
+#   python scripts/bench_stages.py --docs 100 1000 --output bench.json
+#   python scripts/bench_stages.py --docs 100 1000 --baseline bench.json --max-regression 1.25
+#   python scripts/bench_stages.py --domains legal --docs 500 --docx 0.2 --real
+
+import sys
+import os
+SCRIPTS = os.path.abspath(os.path.dirname(__file__))
+ROOT = os.path.abspath(os.path.join(SCRIPTS, '..'))
+sys.path.insert(0, ROOT)
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from app import models
+from app.stub_models import MONTHS, ORGANIZATIONS, PERSONS, PLACES
+
+DOMAINS = ("insurance", "legal")
+PROCEDURES = ("knee surgery", "hip replacement", "heart surgery", "cataract surgery", "appendectomy")
+HOSPITALS = ("Apollo Hospital", "Fortis Hospital", "Ruby Hall Clinic", "AIIMS")
+FILLER = ("the insured person shall be entitled to the benefits described in this policy subject to the terms "
+          "conditions and exclusions set out herein and any amount payable under this clause shall not exceed "
+          "the sum insured stated in the schedule unless otherwise agreed in writing by the parties").split()
+
+# Clause templates per domain: (section title, sentences)
+CLAUSES = {
+    "insurance": (
+        ("WAITING PERIOD", ("Expenses for {procedure} are covered after a waiting period of {months} months.",
+                            "Claims for {procedure} made within {months} months of the policy start are rejected.")),
+        ("EMERGENCY COVER", ("Emergency hospitalization is covered from day 1 of the policy.",
+                             "Emergency treatment at {hospital} in {place} is payable up to Rs {amount}.")),
+        ("EXCLUSIONS", ("Pre-existing diseases are excluded for the first {months} months.",
+                        "Cosmetic procedures are not covered under any circumstances.")),
+        ("BENEFITS", ("The policy pays up to Rs {amount} for {procedure} at a network hospital.",
+                      "Maternity benefits become available after {months} months of continuous cover.")),
+    ),
+    "legal": (
+        ("PARTIES", ("This Agreement is made on {date} between {person} and {org}.",
+                     "{person} represents {org} for the purposes of this Agreement.")),
+        ("JURISDICTION", ("The courts of {place} shall have exclusive jurisdiction over any dispute.",
+                          "Any appeal lies to the High Court within {days} days of the order.")),
+        ("TERMINATION", ("Either party may terminate this Agreement by giving {days} days written notice.",
+                         "On termination {org} shall pay all amounts due up to {date}.")),
+        ("LIABILITY", ("The liability of {org} under this Agreement is limited to Rs {amount}.",
+                       "Neither party is liable for delays caused by events beyond its control.")),
+    ),
+}
+QUERIES = {
+    "insurance": ("{age}-year-old male, {procedure} in {place}, {months}-month-old insurance policy",
+                  "{age} year old female needs {procedure} at {hospital}, policy is {months} months old",
+                  "emergency hospitalization in {place} covered from day 1",
+                  "waiting period for {procedure}"),
+    "legal": ("which court has jurisdiction over the dispute between {person} and {org}",
+              "who are the parties to the agreement dated {date}",
+              "termination notice period for {org}",
+              "limitation of liability of {org}"),
+}
+# Stages faster than this in both runs are too noisy to flag as regressions
+MIN_COMPARED_SECONDS = 0.005
+
+
+def _fill(template, rng):
+    return template.format(
+        procedure=rng.choice(PROCEDURES), hospital=rng.choice(HOSPITALS), place=rng.choice(PLACES),
+        person=rng.choice(PERSONS), org=rng.choice(ORGANIZATIONS), months=rng.choice((3, 6, 12, 24, 36)),
+        days=rng.choice((15, 30, 60, 90)), amount=rng.randrange(5, 500) * 1000, age=rng.randint(18, 80),
+        date=f"{rng.randint(1, 28)} {rng.choice(MONTHS).title()} {rng.randint(2015, 2025)}",
+    )
+
+
+def synthetic_document(domain, sections, rng):
+    """Lines of one document: section headers, each followed by a few clauses padded with filler text."""
+    lines = []
+    for s in range(sections):
+        title, templates = rng.choice(CLAUSES[domain])
+        lines.append(f"SECTION {s + 1}: {title}")
+        for _ in range(rng.randint(1, 3)):
+            filler = " ".join(rng.choice(FILLER) for _ in range(rng.randint(10, 50)))
+            lines.append(f"{_fill(rng.choice(templates), rng)} {filler.capitalize()}.")
+        lines.append("")
+    return lines
+
+
+def write_corpus(folder, domain, n_docs, sections, docx_share=0.0, seed=0):
+    """Write n_docs synthetic documents of domain into folder; docx_share of them as .docx, the rest as .txt."""
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for d in range(n_docs):
+        lines = synthetic_document(domain, sections, rng)
+        name = os.path.join(folder, f"{domain}_{d:06d}")
+        if rng.random() < docx_share:
+            import docx
+            document = docx.Document()
+            for line in lines:
+                document.add_paragraph(line)
+            document.save(name + ".docx")
+        else:
+            with open(name + ".txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(lines))
+
+
+def synthetic_queries(domain, count, seed=0):
+    rng = random.Random(seed)
+    return [_fill(rng.choice(QUERIES[domain]), rng) for _ in range(count)]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def timed(fn, repeat):
+    """(result of the last call, fastest wall time in seconds) of fn() over repeat calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def stage(seconds, items, latencies=None):
+    entry = {"seconds": round(seconds, 6), "items": items,
+             "items_per_s": round(items / seconds, 2) if seconds > 0 else None}
+    if latencies:
+        entry["p50_ms"] = round(statistics.median(latencies) * 1000, 4)
+        entry["p95_ms"] = round(float(np.percentile(latencies, 95)) * 1000, 4)
+    return entry
+
+
+def per_query(fn, items, repeat):
+    """Stage entry for fn(item) over items, with per-call latency percentiles; fastest of repeat passes."""
+    best, latencies = float("inf"), None
+    for _ in range(repeat):
+        times = []
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            times.append(time.perf_counter() - start)
+        if sum(times) < best:
+            best, latencies = sum(times), times
+    return stage(best, len(items), latencies)
+
+
+def run_pipeline(folder, domain, args, tmp):
+    from build_vector_index import load_documents
+    from app.parser.ner_model import extract_info
+    from app.retriever.chunk_store import ChunkStore, ChunkStoreWriter
+    from app.retriever.chunker import split_text_to_chunks
+    from app.retriever.embedder import get_model
+    from app.retriever.evaluator import evaluate
+    from app.retriever.index_factory import IndexBuilder
+    from app.retriever.vector_store import rerank_pairs, search_clauses
+
+    stages = {}
+    documents, seconds = timed(lambda: [(name, text) for name, text in load_documents(folder)], args.repeat)
+    stages["load_documents"] = stage(seconds, len(documents))
+
+    def split():
+        return [(name, section, chunk) for name, text in documents
+                for section, chunk in split_text_to_chunks(text, strategy=args.strategy)]
+
+    chunks, seconds = timed(split, args.repeat)
+    stages["split_text_to_chunks"] = stage(seconds, len(documents))
+    texts = [chunk for _, _, chunk in chunks]
+
+    embedder = get_model()
+
+    def embed():
+        return np.concatenate([np.asarray(embedder.encode(texts[i:i + args.batch_size], show_progress_bar=False),
+                                          dtype=np.float32) for i in range(0, len(texts), args.batch_size)])
+
+    embeddings, seconds = timed(embed, args.repeat)
+    stages["embed_chunks"] = stage(seconds, len(texts))
+
+    def build():
+        builder = IndexBuilder(args.index_type, expected_n=len(embeddings))
+        for i in range(0, len(embeddings), args.batch_size):
+            builder.add(embeddings[i:i + args.batch_size])
+        return builder.finish()[0]
+
+    index, seconds = timed(build, args.repeat)
+    stages["index_build"] = stage(seconds, len(embeddings))
+
+    store_path = os.path.join(tmp, f"{domain}_chunks")
+    writer = ChunkStoreWriter(store_path)
+    for name, section, chunk in chunks:
+        writer.add(name, section, chunk)
+    writer.close()
+    store = ChunkStore(store_path)
+
+    queries = synthetic_queries(domain, args.queries, seed=args.seed)
+    query_vectors = np.asarray(embedder.encode(queries, show_progress_bar=False), dtype=np.float32)
+    pairs = list(zip(queries, query_vectors))
+    options = {"top_k": args.top_k, "lexical": None, "budget_ms": 0}
+    stages["embed_query"] = per_query(lambda q: embedder.encode([q], show_progress_bar=False), queries, args.repeat)
+    stages["search_clauses"] = per_query(lambda p: search_clauses(p[1], index, store, **options), pairs, args.repeat)
+    # skip_gap=0: every query goes through the cross-encoder
+    stages["search_clauses_rerank"] = per_query(
+        lambda p: search_clauses(p[1], index, store, query_text=p[0], scorer=rerank_pairs, skip_gap=0, **options),
+        pairs, args.repeat)
+    stages["extract_info"] = per_query(lambda q: extract_info(q, domain=domain), queries, args.repeat)
+
+    inputs = [(extract_info(q, domain=domain), search_clauses(v, index, store, query_text=q, skip_gap=0, **options))
+              for q, v in pairs]
+    stages["evaluate"] = per_query(lambda i: evaluate(i[0], i[1], domain=domain), inputs, args.repeat)
+    store.close()
+    return {"documents": len(documents), "chunks": len(texts), "queries": len(queries), "stages": stages}
+
+
+def compare(results, baseline, max_regression):
+    """Print each stage's time per item against baseline; returns the (run, stage) pairs slower than allowed."""
+    previous = {(r["domain"], r["docs"]): r for r in baseline["runs"]}
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'} (ratio of time per item, >1 is slower)")
+    if baseline["meta"].get("stub_models") != results["meta"]["stub_models"]:
+        print("Warning: one run used the stub models and the other the real ones")
+    regressions = []
+    for run in results["runs"]:
+        old = previous.get((run["domain"], run["docs"]))
+        if old is None:
+            continue
+        for name, entry in run["stages"].items():
+            before = old["stages"].get(name)
+            if not before or not before["items"] or not entry["items"] or not before["seconds"]:
+                continue
+            ratio = (entry["seconds"] / entry["items"]) / (before["seconds"] / before["items"])
+            noisy = max(entry["seconds"], before["seconds"]) < MIN_COMPARED_SECONDS
+            flag = "  REGRESSION" if ratio > max_regression and not noisy else ""
+            if flag:
+                regressions.append((f"{run['domain']}/{run['docs']}", name))
+            print(f"{run['domain']:>10} {run['docs']:>6} {name:>22} {ratio:>6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage pipeline timings on synthetic corpora")
+    parser.add_argument("--domains", nargs="+", choices=DOMAINS, default=list(DOMAINS))
+    parser.add_argument("--docs", type=int, nargs="+", default=[100, 1000], help="corpus sizes in documents")
+    parser.add_argument("--sections", type=int, default=8, help="sections per synthetic document")
+    parser.add_argument("--docx", type=float, default=0.0, help="share of documents written as .docx")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--strategy", default="paragraph", choices=("paragraph", "section", "sentence"))
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="passes per stage; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real", action="store_true", help="time the configured models instead of the stubs")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=1.2,
+                        help="slowdown of a stage's time per item that fails the comparison")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SCRIPTS)
+    models.use_stubs(not args.real)
+    # Models load before any stage is timed; their load time is reported on its own
+    from app.parser.gazetteer import get_parser
+    from app.retriever.embedder import get_model, get_tokenizer
+    from app.retriever.evaluator import get_nlp
+    from app.retriever.rules import get_rules
+    from app.retriever.vector_store import get_cross_encoder
+    for load in (get_model, get_tokenizer, get_cross_encoder, get_parser, get_rules, get_nlp):
+        load()
+
+    commit, dirty = git_commit()
+    results = {
+        "meta": {
+            "commit": commit, "dirty": dirty,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "stub_models": models.stubs_enabled(), "model_load_seconds": models.loaded(), "args": vars(args),
+        },
+        "runs": [],
+    }
+
+    print(f"{'domain':>10} {'docs':>6} {'stage':>22} {'items':>7} {'total s':>8} {'items/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory(prefix="bench_stages_") as tmp:
+        for domain in args.domains:
+            for docs in args.docs:
+                folder = os.path.join(tmp, f"{domain}_{docs}")
+                write_corpus(folder, domain, docs, args.sections, args.docx, seed=args.seed)
+                run = {"domain": domain, "docs": docs, **run_pipeline(folder, domain, args, tmp)}
+                results["runs"].append(run)
+                for name, entry in run["stages"].items():
+                    print(f"{domain:>10} {docs:>6} {name:>22} {entry['items']:>7} {entry['seconds']:>8.3f} "
+                          f"{entry['items_per_s'] or 0:>9.1f} {entry.get('p50_ms', ''):>8} {entry.get('p95_ms', ''):>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} stage(s) more than {args.max_regression}x slower per item: "
+                  + ", ".join(f"{run} {name}" for run, name in regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
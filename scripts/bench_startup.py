@@ -0,0 +1,72 @@
+# scripts/bench_startup.py
+#
+# Cold-start check: times "import app.main" in fresh interpreters and fails
+# if the median exceeds --max-seconds or if importing loaded any model (models
+# must only load on first use or through /api/warmup). Suitable for CI:
+#
+#   python scripts/bench_startup.py --runs 5 --max-seconds 3
+#   python scripts/bench_startup.py --warmup     # also time a full warm-up
+
+import sys
+import os
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+import argparse
+import json
+import statistics
+import subprocess
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app.main
+import_s = time.perf_counter() - start
+from app import models
+result = {"import_s": import_s, "loaded_on_import": sorted(models.loaded())}
+if WARMUP:
+    import asyncio
+    from app.api import warm_up
+    state = asyncio.run(warm_up())
+    result.update(warmup_s=state["seconds"], warmup_status=state["status"], models=models.loaded())
+print(json.dumps(result))
+"""
+
+
+def probe(warmup):
+    env = dict(os.environ, LLM_WARMUP_ON_STARTUP="0")
+    out = subprocess.run(
+        [sys.executable, "-c", f"WARMUP = {warmup}\n" + PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the API import and optional warm-up in fresh processes")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="fail if the median import time is above this")
+    parser.add_argument("--warmup", action="store_true", help="also time loading the index and models")
+    args = parser.parse_args()
+
+    results = [probe(args.warmup) for _ in range(args.runs)]
+    import_times = [r["import_s"] for r in results]
+    median = statistics.median(import_times)
+    print(f"import app.main: median {median:.3f}s  min {min(import_times):.3f}s  max {max(import_times):.3f}s  ({args.runs} runs)")
+    if args.warmup:
+        warm = [r["warmup_s"] for r in results]
+        print(f"warm-up:         median {statistics.median(warm):.3f}s  status {results[-1]['warmup_status']}")
+        for name, seconds in results[-1]["models"].items():
+            print(f"  {name:<15} {seconds:.3f}s")
+
+    failed = False
+    loaded = sorted({name for r in results for name in r["loaded_on_import"]})
+    if loaded:
+        print(f"FAIL: models loaded at import time: {loaded}")
+        failed = True
+    if median > args.max_seconds:
+        print(f"FAIL: median import time {median:.3f}s > {args.max_seconds}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,88 +3,122 @@
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-import faiss
-import pickle
-import pdfplumber
-import docx
-
-from app.retriever.chunker import split_text_to_chunks
-from app.retriever.embedder import model as embedder
+import argparse
+import shutil
+
+from app.retriever.chunk_store import ChunkStoreWriter
+from app.retriever.index_factory import INDEX_TYPE, INDEX_TYPES, IndexBuilder, save_index_params
+from app.retriever.ingest import (
+    PARSE_WORKERS, SUPPORTED_EXTENSIONS, IngestProgress, embed_and_store,
+    parse_documents, read_document, save_index, save_manifest,
+)
+from app.retriever.lexical import build_lexical_index
+from app.retriever.snapshots import (
+    Snapshot, current_snapshot, finish_snapshot, index_path, ingest_snapshot, lexical_path, load_snapshot,
+    manifest_path, new_snapshot_dir, publish, store_path,
+)
 
 DOCS_DIR = "app/data/documents"
 os.makedirs(DOCS_DIR, exist_ok=True)  # <-- Ensure the directory exists
-INDEX_PATH = "app/data/embeddings/faiss_index.index"
-META_PATH = "app/data/embeddings/metadata.pkl"
 
-# Chunking strategy and context window can be adjusted here
-CHUNK_STRATEGY = "paragraph"  # options: 'paragraph', 'section', 'sentence'
-CONTEXT_WINDOW = 1  # number of neighboring chunks to include
+def document_names(folder_path):
+    return sorted(f for f in os.listdir(folder_path) if f.endswith(SUPPORTED_EXTENSIONS))
 
 def load_documents(folder_path):
-    docs = []
-    for filename in os.listdir(folder_path):
-        filepath = os.path.join(folder_path, filename)
-        if filename.endswith(".txt"):
-            with open(filepath, "r", encoding="utf-8") as f:
-                docs.append((filename, f.read()))
-        elif filename.endswith(".pdf"):
-            with pdfplumber.open(filepath) as pdf:
-                text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-                docs.append((filename, text))
-        elif filename.endswith(".docx"):
-            doc = docx.Document(filepath)
-            text = "\n".join([para.text for para in doc.paragraphs])
-            docs.append((filename, text))
-    return docs
+    """Yield (filename, text) one document at a time."""
+    for filename in document_names(folder_path):
+        yield filename, read_document(os.path.join(folder_path, filename))
 
 # ...existing code...
 
-def build_index():
-    print("Loading documents...")
-    documents = load_documents(DOCS_DIR)
-
-    all_chunks = []
-    metadata = []
-
-    for filename, text in documents:
-        chunks = split_text_to_chunks(text, strategy=CHUNK_STRATEGY, context_window=CONTEXT_WINDOW)
-        for section_header, chunk in chunks:
-            all_chunks.append(chunk)
-            meta = f"{filename} :: "
-            if section_header:
-                meta += f"[{section_header}] "
-            meta += chunk
-            metadata.append(meta)
-
-    print(f"Embedding {len(all_chunks)} chunks...")
-    if not all_chunks:
+def build_index(index_type=INDEX_TYPE, train_size=None, workers=None, batch_size=None, output=None, **index_params):
+    """
+    Build a new snapshot. Without output it is written under the snapshots
+    directory and published; with output (used by /api/rebuild_index) it is
+    only written into that directory, and the caller publishes it.
+    Returns False when there was nothing to index.
+    """
+    # Parsing (process pool) -> chunking -> embedding in fixed-size batches ->
+    # index and chunk store, all streamed so memory stays flat as the corpus grows
+    snapshot = output or new_snapshot_dir()
+    filenames = document_names(DOCS_DIR)
+    workers = workers or PARSE_WORKERS
+    print(f"Indexing {len(filenames)} documents into a {index_type} index ({workers} parser processes)...")
+
+    builder = IndexBuilder(index_type, train_size=train_size, **index_params)
+    writer = ChunkStoreWriter(store_path(snapshot))
+    progress = IngestProgress(len(filenames), label="build")
+    documents = parse_documents(DOCS_DIR, filenames, workers, progress=progress)
+    manifest = embed_and_store(documents, builder.add, writer, batch_size, progress)
+    progress.report()
+
+    if not progress.embedded_chunks:
+        writer.abort()
+        if not output:
+            shutil.rmtree(snapshot, ignore_errors=True)
         print("No document chunks found. Please add valid documents to app/data/documents.")
-        return
-
-    embeddings = embedder.encode(all_chunks, show_progress_bar=True)
-
-    print("Building FAISS index...")
-    dim = embeddings[0].shape[0]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
-
-    print("Saving FAISS index and metadata...")
-    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-
-    with open(META_PATH, "wb") as f:
-        pickle.dump(metadata, f)
+        return False
+
+    index, params = builder.finish()
+    print(f"Index parameters: {params}")
+
+    print("Saving FAISS index, parameters, chunk store and manifest...")
+    store = writer.close()
+    print("Building the lexical index...")
+    build_lexical_index(store, lexical_path(snapshot))
+    store.close()
+    save_index(index, index_path(snapshot))
+    save_index_params(params, index_path(snapshot))
+    save_manifest(manifest, manifest_path(snapshot))
+    if not output:
+        snapshot = finish_snapshot(snapshot)
+        publish(snapshot)
+        print(f"Published snapshot {os.path.basename(snapshot)}")
 
     print("Done!")
+    return True
+
+def update_index(workers=None):
+    """Embed only new or changed documents into a new snapshot based on the current one."""
+    base_path = current_snapshot()
+    base = Snapshot(0, base_path, *load_snapshot(base_path)) if base_path else None
+
+    path, _, _, _, _, summary = ingest_snapshot(base, DOCS_DIR, workers=workers)
+    print(f"Added {len(summary['added'])}, updated {len(summary['updated'])}, "
+          f"skipped {len(summary['skipped'])}, removed {len(summary['removed'])} documents "
+          f"({summary['chunks_added']} new chunks)")
+    if path is not None:
+        publish(path)
+        print(f"Published snapshot {os.path.basename(path)}")
+    print("Done!")
 
 if __name__ == "__main__":
-    build_index()
-
-    # Simple ingestion tests for PDF and DOCX
-    test_dir = "app/data/documents"
-    docs = load_documents(test_dir)
-    print(f"Loaded {len(docs)} documents from {test_dir}")
-    for fname, text in docs:
-        print(f"{fname}: {len(text)} characters")
-        assert isinstance(text, str) and len(text) > 0, f"Document {fname} is empty or not a string"
-    print("PDF/DOCX/txt ingestion test passed.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the FAISS vector index from app/data/documents")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only embed new or changed documents instead of rebuilding everything")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE,
+                        help="flat (exact), ivf_flat, ivf_pq or hnsw (default: $LLM_INDEX_TYPE or flat)")
+    parser.add_argument("--workers", type=int, help="parser processes (default: $LLM_PARSE_WORKERS or CPU count)")
+    parser.add_argument("--batch-size", type=int, help="chunks per embedding batch (default: $LLM_EMBED_BATCH_SIZE or 256)")
+    parser.add_argument("--train-size", type=int, help="max vectors used to train IVF/PQ")
+    parser.add_argument("--output", help="write the snapshot into this directory without publishing it")
+    parser.add_argument("--nice", type=int, default=0, help="lower this process's CPU priority by this much")
+    parser.add_argument("--nlist", type=int, help="IVF: number of inverted lists")
+    parser.add_argument("--nprobe", type=int, help="IVF: default lists probed per query")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ: sub-quantizers (must divide the dimension)")
+    parser.add_argument("--pq-nbits", type=int, help="IVF-PQ: bits per sub-quantizer code")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW: neighbours per node")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: build-time search breadth")
+    parser.add_argument("--ef-search", type=int, help="HNSW: default query-time search breadth")
+    args = parser.parse_args()
+    if args.nice:
+        os.nice(args.nice)
+    if args.incremental:
+        update_index(args.workers or PARSE_WORKERS)
+    else:
+        built = build_index(args.index_type, args.train_size, args.workers, args.batch_size, args.output,
+                            nlist=args.nlist, nprobe=args.nprobe, pq_m=args.pq_m, pq_nbits=args.pq_nbits,
+                            hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, ef_search=args.ef_search)
+        if args.output and not built:
+            sys.exit(1)
+
@@ -0,0 +1,121 @@
+# scripts/check_backend_parity.py
+#
+# Accuracy check of an inference backend (app/inference.py) against the
+# default torch backend, with the real embedder and cross-encoder on the
+# chunks of the published index:
+# - embedding cosine similarity to the torch embedding of every chunk
+# - retrieval: overlap of each query's top-k chunks (backend query and
+#   chunk vectors against torch ones)
+# - reranking: how often the cross-encoder keeps a query's best clause
+#   among the torch top --candidates, and the rank correlation of its scores
+# The exit status is 1 when a backend is below a threshold, so this can gate
+# a switch of LLM_INFERENCE_BACKEND:
+#
+#   python scripts/check_backend_parity.py --backends int8 onnx
+#   python scripts/check_backend_parity.py --backends int8 --queries queries.txt --min-top1 0.95
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+
+import numpy as np
+
+from app.inference import BACKENDS, load_cross_encoder, load_sentence_transformer
+from app.retriever.chunk_store import ChunkStore
+from app.retriever.embedder import EMBEDDING_MODEL
+from app.retriever.snapshots import current_snapshot, store_path
+from app.retriever.vector_store import CROSS_ENCODER_MODEL
+
+DEFAULT_QUERIES = [
+    "46-year-old male, knee surgery in Pune, 3-month-old insurance policy",
+    "emergency hospitalization covered from day 1",
+    "hip replacement waiting period",
+    "pre-existing disease exclusion",
+    "maternity benefits after two years",
+    "which court has jurisdiction over the dispute",
+    "who are the parties to the contract",
+    "appeal to the High Court within 30 days",
+    "termination notice period",
+    "limitation of liability",
+]
+
+
+def load_queries(path):
+    if not path:
+        return DEFAULT_QUERIES
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def spearman(a, b):
+    ra, rb = np.argsort(np.argsort(a)), np.argsort(np.argsort(b))
+    return float(np.corrcoef(ra, rb)[0, 1]) if len(a) > 1 else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy parity of inference backends with torch")
+    parser.add_argument("--backends", nargs="+", choices=[b for b in BACKENDS if b != "torch"], default=["int8"])
+    parser.add_argument("--queries", help="text file with one query per line")
+    parser.add_argument("--texts", type=int, default=2000, help="chunks of the index compared (at most)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20, help="torch hits reranked per query")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--min-top1", type=float, default=0.9)
+    args = parser.parse_args()
+
+    snapshot = current_snapshot()
+    if snapshot is None:
+        sys.exit("No index yet; run scripts/build_vector_index.py first")
+    store = ChunkStore(store_path(snapshot))
+    texts = [store.text(i) for i in range(min(len(store), args.texts))]
+    queries = load_queries(args.queries)
+    candidates = min(args.candidates, len(texts))
+    top_k = min(args.top_k, len(texts))
+
+    def run(backend):
+        embedder = load_sentence_transformer(EMBEDDING_MODEL, backend)
+        chunks = np.asarray(embedder.encode(texts, show_progress_bar=False), dtype=np.float32)
+        query_vectors = np.asarray(embedder.encode(queries, show_progress_bar=False), dtype=np.float32)
+        return embedder, chunks, query_vectors
+
+    _, ref_chunks, ref_queries = run("torch")
+    # The torch rerank set of each query: its nearest chunks by torch embeddings
+    ref_similarity = ref_queries @ ref_chunks.T
+    ref_top = np.argsort(-ref_similarity, axis=1)
+    groups = [ref_top[q, :candidates] for q in range(len(queries))]
+    pairs = [(query, texts[i]) for query, group in zip(queries, groups) for i in group]
+    ref_scores = np.asarray(load_cross_encoder(CROSS_ENCODER_MODEL, "torch").predict(pairs, show_progress_bar=False),
+                            dtype=np.float32).reshape(len(queries), candidates)
+
+    print(f"{len(texts)} chunks, {len(queries)} queries")
+    print(f"{'backend':>8} {'cos min':>8} {'cos mean':>8} {f'recall@{top_k}':>9} {'top1':>5} {'spearman':>8}  result")
+    failed = []
+    for backend in args.backends:
+        try:
+            _, chunks, query_vectors = run(backend)
+            scores = np.asarray(load_cross_encoder(CROSS_ENCODER_MODEL, backend).predict(pairs, show_progress_bar=False),
+                                dtype=np.float32).reshape(len(queries), candidates)
+        except ImportError as e:
+            print(f"{backend:>8} skipped: {e}")
+            continue
+        cosine = (chunks * ref_chunks).sum(1) / (np.linalg.norm(chunks, axis=1) * np.linalg.norm(ref_chunks, axis=1))
+        top = np.argsort(-(query_vectors @ chunks.T), axis=1)[:, :top_k]
+        recall = float(np.mean([len(set(a) & set(b)) / top_k for a, b in zip(top, ref_top[:, :top_k])]))
+        top1 = float(np.mean(scores.argmax(1) == ref_scores.argmax(1)))
+        rho = float(np.mean([spearman(s, r) for s, r in zip(scores, ref_scores)]))
+        ok = cosine.min() >= args.min_cosine and recall >= args.min_recall and top1 >= args.min_top1
+        if not ok:
+            failed.append(backend)
+        print(f"{backend:>8} {cosine.min():>8.4f} {cosine.mean():>8.4f} {recall:>9.3f} {top1:>5.2f} {rho:>8.3f}  "
+              f"{'ok' if ok else 'BELOW THRESHOLD'}")
+
+    if failed:
+        print(f"Below parity thresholds (cosine >= {args.min_cosine}, recall >= {args.min_recall}, "
+              f"top-1 >= {args.min_top1}): {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# scripts/gc_embedding_cache.py
+#
+# Drop embedding cache entries that no index snapshot on disk uses any more
+# (old chunking strategies, deleted or edited documents). The chunk text of
+# every snapshot under app/data/embeddings/snapshots is kept:
+#
+#   python scripts/gc_embedding_cache.py
+#   python scripts/gc_embedding_cache.py --dry-run
+#   python scripts/gc_embedding_cache.py --drop-other-models
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import shutil
+
+import numpy as np
+
+from app.retriever.chunk_store import ChunkStore, STRINGS_FILE
+from app.retriever.embedder import embedding_model_id
+from app.retriever.embedding_cache import CACHE_DIR, KEY_DTYPE, EmbeddingCache, model_dir, text_keys
+from app.retriever.snapshots import SNAPSHOTS_DIR, store_path
+
+KEY_BLOCK = 65536
+
+
+def snapshot_keys():
+    """text_keys of the chunks of every snapshot on disk (partial ones included, they may be in use)."""
+    keys = [np.zeros(0, dtype=KEY_DTYPE)]
+    names = sorted(os.listdir(SNAPSHOTS_DIR)) if os.path.isdir(SNAPSHOTS_DIR) else []
+    for name in names:
+        path = store_path(os.path.join(SNAPSHOTS_DIR, name))
+        if not os.path.exists(os.path.join(path, STRINGS_FILE)):
+            continue
+        store = ChunkStore(path)
+        for start in range(0, len(store), KEY_BLOCK):
+            keys.append(np.unique(text_keys([store.text(i) for i in range(start, min(start + KEY_BLOCK, len(store)))])))
+        store.close()
+        print(f"{name}: {len(store)} chunks")
+    return np.unique(np.concatenate(keys))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Garbage-collect the embedding cache")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be dropped")
+    parser.add_argument("--drop-other-models", action="store_true",
+                        help="also delete the caches of models other than the configured one")
+    args = parser.parse_args()
+
+    model = embedding_model_id()
+
+    if not CACHE_DIR or not os.path.isdir(model_dir(model)):
+        print("No embedding cache to collect.")
+        return
+    keep = snapshot_keys()
+    cache = EmbeddingCache.for_model(model)
+    before, before_bytes = len(cache), cache.nbytes()
+    if args.dry_run:
+        _, found = cache.lookup(keep)
+        print(f"{before} entries ({before_bytes / 2 ** 20:.1f} MB), {int(found.sum())} still used by a snapshot")
+    else:
+        dropped = cache.gc(keep)
+        print(f"Dropped {dropped} of {before} entries ({before_bytes / 2 ** 20:.1f} MB -> {cache.nbytes() / 2 ** 20:.1f} MB)")
+
+    for name in sorted(os.listdir(CACHE_DIR)):
+        path = os.path.join(CACHE_DIR, name)
+        if path == model_dir(model) or not os.path.isdir(path):
+            continue
+        if args.drop_other_models and not args.dry_run:
+            shutil.rmtree(path, ignore_errors=True)
+            print(f"Deleted the cache of {name}")
+        else:
+            print(f"Cache of another model kept: {name} (--drop-other-models deletes it)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# scripts/load_test.py
+#
+# End-to-end load test of the API: /api/analyze_query traffic at increasing
+# request rates, mixed with uploads and document listings, outside and
+# during an index rebuild. Requests are sent open-loop (on a fixed schedule
+# whatever the server's speed) and latency counts from the scheduled send
+# time, so a stalled server shows up in the tail instead of slowing the
+# client down. Queries come from a recorded log (--queries: one query per
+# line, or JSON lines with "query" and optionally "domain" and the other
+# request fields) replayed in order, or are generated.
+#
+# Without --url a server is started on a free local port, with the stub
+# models of app/stub_models.py (--real for the configured ones) and its own
+# data directory holding a synthetic corpus (--docs) that is indexed first;
+# --in-process runs it in a thread of this process instead of a uvicorn
+# subprocess. With --url an existing server is loaded as it is; note that
+# uploads then add documents to it. The exit status is 1 when a latency or
+# error-rate SLO is exceeded at any level:
+#
+#   python scripts/load_test.py --rps 5 10 20 --duration 20 --rebuild
+#   python scripts/load_test.py --queries queries.jsonl --rps 50 --slo-p99-ms 800 --max-error-rate 0.001
+#   python scripts/load_test.py --url http://localhost:8000 --mix analyze_query=1 --rps 10 30
+
+import sys
+import os
+SCRIPTS = os.path.abspath(os.path.dirname(__file__))
+ROOT = os.path.abspath(os.path.join(SCRIPTS, '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, SCRIPTS)
+import argparse
+import json
+import random
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MIX = "analyze_query=90,list_documents=8,upload_document=2"
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def http(method, url, body=None, headers=None, timeout=30):
+    """(status, parsed JSON body or None) of one request; HTTP errors are returned, not raised."""
+    req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            status, data = resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        status, data = e.code, e.read()
+    try:
+        return status, json.loads(data) if data else None
+    except ValueError:
+        return status, None
+
+
+def post_json(url, payload, timeout=30):
+    return http("POST", url, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"}, timeout)
+
+
+def multipart(filename, content):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: text/plain\r\n\r\n").encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def load_queries(path, count, seed):
+    """Request payloads of a recorded query log, or count generated ones of both domains."""
+    if not path:
+        from bench_stages import synthetic_queries
+        half = max(1, count // 2)
+        queries = ([{"query": q, "domain": "insurance"} for q in synthetic_queries("insurance", count - half, seed)]
+                   + [{"query": q, "domain": "legal"} for q in synthetic_queries("legal", half, seed)])
+        random.Random(seed).shuffle(queries)
+        return queries
+    payloads = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            payloads.append(json.loads(line) if line.startswith("{") else {"query": line})
+    if not payloads:
+        sys.exit(f"No queries in {path}")
+    return payloads
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("analyze_query", "list_documents", "upload_document"):
+            sys.exit(f"Unknown request type in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Client:
+    """Builds and sends the requests of each type against base_url."""
+
+    def __init__(self, base_url, queries, timeout, seed):
+        self.base_url = base_url.rstrip("/")
+        self.queries = queries
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self._next_query = 0
+        self._uploads = 0
+        self._lock = threading.Lock()
+
+    def analyze_query(self):
+        with self._lock:
+            payload = self.queries[self._next_query % len(self.queries)]
+            self._next_query += 1
+        return post_json(f"{self.base_url}/api/analyze_query", payload, self.timeout)[0]
+
+    def list_documents(self):
+        return http("GET", f"{self.base_url}/api/list_documents", timeout=self.timeout)[0]
+
+    def upload_document(self):
+        from bench_stages import synthetic_document
+        with self._lock:
+            self._uploads += 1
+            n = self._uploads
+            lines = synthetic_document(self.rng.choice(("insurance", "legal")), 4, self.rng)
+        body, headers = multipart(f"load_test_{os.getpid()}_{n:06d}.txt", "\n".join(lines).encode("utf-8"))
+        return http("POST", f"{self.base_url}/api/upload_document", body, headers, self.timeout)[0]
+
+
+def run_level(client, mix, rps, duration, concurrency, seed):
+    """Send Poisson arrivals at rps for duration seconds; returns {request type: [(latency s, status)]}."""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+
+    def send(name, scheduled):
+        try:
+            status = getattr(client, name)()
+        except Exception:
+            status = None  # connection refused, timeout...
+        with lock:
+            samples[name].append((time.perf_counter() - scheduled, status))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        at = start
+        while True:
+            at += rng.expovariate(rps)
+            if at - start >= duration:
+                break
+            delay = at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, rng.choices(names, weights)[0], at)
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    summary = {}
+    for name, results in samples.items():
+        if not results:
+            continue
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, status in results if status is None or status >= 400)
+        summary[name] = {
+            "requests": len(results),
+            "errors": errors,
+            "error_rate": errors / len(results),
+            "throughput_rps": (len(results) - errors) / elapsed,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            **{f"p{p}_ms": percentile(latencies, p) * 1000 for p in PERCENTILES},
+            "max_ms": latencies[-1] * 1000,
+        }
+    return summary
+
+
+def check_slos(level, args):
+    """Violated SLOs of one level's summary, as messages."""
+    failures = []
+    where = f"{level['phase']} @ {level['rps']} rps"
+    analyze = level["endpoints"].get("analyze_query")
+    if analyze:
+        for p in PERCENTILES:
+            limit = getattr(args, f"slo_p{p}_ms")
+            if limit is not None and analyze[f"p{p}_ms"] > limit:
+                failures.append(f"{where}: analyze_query p{p} {analyze[f'p{p}_ms']:.1f} ms > {limit} ms")
+    for name, stats in level["endpoints"].items():
+        if stats["error_rate"] > args.max_error_rate:
+            failures.append(f"{where}: {name} error rate {stats['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    return failures
+
+
+def wait_for_job(base_url, job_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, job = http("GET", f"{base_url}/api/jobs/{job_id}")
+        if status == 200 and job["status"] in ("indexed", "failed", "duplicate"):
+            return job
+        time.sleep(0.2)
+    raise TimeoutError(f"Job {job_id} still running after {timeout}s")
+
+
+def wait_until(url, timeout, expected=200):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if http("GET", url, timeout=5)[0] == expected:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not answer {expected} within {timeout}s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_env(args):
+    """Settings of a server started here: stub models, and the repository's gazetteers and rules."""
+    env = {
+        "LLM_STUB_MODELS": "0" if args.real else "1",
+        "LLM_GAZETTEER_DIR": os.path.join(ROOT, "app", "data", "gazetteers"),
+        "LLM_INSURANCE_RULES": os.path.join(ROOT, "app", "data", "rules", "insurance.json"),
+        "LLM_EMBEDDING_CACHE_DIR": "",
+        "LLM_WARMUP_MODELS": "embedder,cross_encoder,insurance_rules,gazetteer,nlp",
+    }
+    if args.no_result_cache:
+        env["LLM_RESULT_CACHE_SIZE"] = env["LLM_EMBEDDING_CACHE_SIZE"] = "0"
+    return env
+
+
+def start_server(args, workdir, port):
+    """Start the app on port; returns a stop() callable."""
+    if args.in_process:
+        # The app resolves its data paths against the working directory and reads its settings at import
+        os.environ.update(server_env(args))
+        os.chdir(workdir)
+        import uvicorn
+        from app.main import app
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+        thread.start()
+
+        def stop():
+            server.should_exit = True
+            thread.join(timeout=30)
+        return stop
+
+    env = {**os.environ, **server_env(args),
+           "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"],
+                            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def stop():
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    return stop
+
+
+def prepare_server(base_url, args, workdir):
+    """Index the synthetic corpus of workdir and load every model before traffic starts."""
+    from bench_stages import write_corpus
+    docs_dir = os.path.join(workdir, "app", "data", "documents")
+    half = args.docs // 2
+    write_corpus(docs_dir, "insurance", args.docs - half, args.sections, seed=args.seed)
+    write_corpus(docs_dir, "legal", half, args.sections, seed=args.seed)
+    wait_until(f"{base_url}/api/health/live", args.startup_timeout)
+    status, job = http("POST", f"{base_url}/api/rebuild_index")
+    job = wait_for_job(base_url, job["job_id"], args.startup_timeout)
+    if job["status"] != "indexed":
+        sys.exit(f"Indexing the synthetic corpus failed: {job.get('error')}")
+    post_json(f"{base_url}/api/warmup", {}, timeout=args.startup_timeout)
+    wait_until(f"{base_url}/api/health/ready", args.startup_timeout)
+    print(f"Server ready: {job['chunks']} chunks from {args.docs} documents")
+
+
+def run(base_url, args):
+    client = Client(base_url, load_queries(args.queries, args.generated_queries, args.seed), args.timeout, args.seed)
+    mix = parse_mix(args.mix)
+    phases = ["steady"] + (["rebuild"] if args.rebuild else [])
+    levels = []
+    print(f"{'phase':>8} {'rps':>6} {'request':>16} {'sent':>6} {'err':>5} {'ok/s':>7} "
+          + " ".join(f"{f'p{p} ms':>8}" for p in PERCENTILES) + f" {'max ms':>8}")
+    for phase in phases:
+        for i, rps in enumerate(args.rps):
+            job = None
+            if phase == "rebuild":
+                _, job = http("POST", f"{base_url}/api/rebuild_index")
+            samples, elapsed = run_level(client, mix, rps, args.duration, args.concurrency, args.seed + i)
+            level = {"phase": phase, "rps": rps, "seconds": elapsed, "endpoints": summarize(samples, elapsed)}
+            if job is not None:
+                # Whether the rebuild outlasted the level, i.e. all of the traffic ran during it
+                done = wait_for_job(base_url, job["job_id"], args.startup_timeout)
+                level["rebuild"] = {"status": done["status"], "seconds": done["updated_at"] - done["created_at"]}
+            levels.append(level)
+            for name, s in level["endpoints"].items():
+                print(f"{phase:>8} {rps:>6g} {name:>16} {s['requests']:>6} {s['errors']:>5} {s['throughput_rps']:>7.1f} "
+                      + " ".join(f"{s[f'p{p}_ms']:>8.1f}" for p in PERCENTILES) + f" {s['max_ms']:>8.1f}")
+            if "rebuild" in level:
+                print(f"{'':>8} {'':>6} rebuild {level['rebuild']['status']} in {level['rebuild']['seconds']:.1f}s")
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the API with latency SLO gates")
+    parser.add_argument("--url", help="base URL of a running server (default: start one here)")
+    parser.add_argument("--in-process", action="store_true", help="run the started server in this process")
+    parser.add_argument("--real", action="store_true", help="start the server with the configured models")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents indexed by a started server")
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--queries", help="recorded query log to replay (text or JSON lines)")
+    parser.add_argument("--generated-queries", type=int, default=200, help="distinct queries generated without --queries")
+    parser.add_argument("--rps", type=float, nargs="+", default=[5, 10, 20], help="request rates, one level each")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="request type weights")
+    parser.add_argument("--rebuild", action="store_true", help="repeat every level during an index rebuild")
+    parser.add_argument("--concurrency", type=int, default=64, help="most requests in flight")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+    parser.add_argument("--no-result-cache", action="store_true",
+                        help="disable the result and query-embedding caches of a started server")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--slo-p50-ms", type=float)
+    parser.add_argument("--slo-p95-ms", type=float)
+    parser.add_argument("--slo-p99-ms", type=float)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.url:
+        levels = run(args.url, args)
+    else:
+        with tempfile.TemporaryDirectory(prefix="load_test_") as workdir:
+            cwd = os.getcwd()
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            stop = start_server(args, workdir, port)
+            try:
+                prepare_server(base_url, args, workdir)
+                levels = run(base_url, args)
+            finally:
+                stop()
+                os.chdir(cwd)
+
+    failures = [failure for level in levels for failure in check_slos(level, args)]
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": levels, "slo_failures": failures}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if failures:
+        print("SLO violations:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("All SLOs met.")
+
+
+if __name__ == "__main__":
+    main()
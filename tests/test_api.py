@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from app import api
+from app.main import app
+
+
+def test_concurrent_identical_queries_run_the_pipeline_once(monkeypatch):
+    calls = []
+
+    async def analyze(request, key, on_event=None):
+        calls.append(request.query)
+        await asyncio.sleep(0.1)
+        result = {"decision": "approved", "query": request.query}
+        api.result_cache.set(key, result)
+        return result
+
+    async def loaded():
+        pass
+
+    monkeypatch.setattr(api, "_analyze", analyze)
+    monkeypatch.setattr(api, "ensure_index_loaded", loaded)
+    monkeypatch.setattr(api, "live", SimpleNamespace(current=SimpleNamespace(store=[0]), version=-1))
+    api.result_cache.clear()
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"query": "Knee surgery in Pune"}
+            first = await asyncio.gather(*(client.post("/api/analyze_query", json=body) for _ in range(5)))
+            again = await client.post("/api/analyze_query", json={"query": "knee surgery  in pune"})
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert calls == ["Knee surgery in Pune"]
+    assert [r.json()["decision"] for r in first] == ["approved"] * 5
+    timings = [r.headers["server-timing"] for r in first]
+    assert sum("cache;desc=coalesced" in t for t in timings) == 4
+    assert "cache;desc=hit" in again.headers["server-timing"]
+    api.result_cache.clear()
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.retriever.batcher import MicroBatcher
+
+
+def test_cancelled_waiter_does_not_stop_the_batcher():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_wait_ms=200)
+    cancelled = batcher.submit(1)
+    kept = batcher.submit(2)
+    assert cancelled.cancel()
+    assert kept.result(timeout=5) == 4
+    # The next batch still runs
+    assert batcher.submit(3).result(timeout=5) == 6
+
+
+def test_request_timeout_while_queued():
+    release = threading.Event()
+
+    def slow(items):
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(slow, max_wait_ms=0)
+
+    async def main():
+        running = batcher.submit("running")  # holds the batcher thread
+        await asyncio.sleep(0.05)
+        # Times out while queued behind it: wrap_future cancels the Future
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(batcher.submit("queued")), 0.05)
+        except asyncio.TimeoutError:
+            pass
+        release.set()
+        assert await asyncio.wrap_future(running) == "running"
+        assert await asyncio.wait_for(asyncio.wrap_future(batcher.submit("next")), 5) == "next"
+
+    asyncio.run(main())
+
+
+def test_short_result_fails_the_batch_not_the_batcher():
+    calls = []
+
+    def fn(items):
+        calls.append(items)
+        return items[:-1] if len(calls) == 1 else items
+
+    batcher = MicroBatcher(fn, max_wait_ms=200)
+    first, second = batcher.submit("a"), batcher.submit("b")
+    for future in (first, second):
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    assert batcher.submit("c").result(timeout=5) == "c"
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import docx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts"))
+from build_vector_index import load_documents  # noqa: E402
+
+
+def test_load_documents_reads_txt_and_docx(tmp_path):
+    (tmp_path / "policy.txt").write_text("Section 1\nClaims are settled within 30 days.\n", encoding="utf-8")
+    document = docx.Document()
+    document.add_paragraph("Section 2")
+    document.add_paragraph("Knee surgery is covered after 6 months.")
+    document.save(tmp_path / "policy.docx")
+    (tmp_path / "notes.md").write_text("not a supported type", encoding="utf-8")
+
+    loaded = dict(load_documents(str(tmp_path)))
+    assert sorted(loaded) == ["policy.docx", "policy.txt"]
+    assert loaded["policy.txt"] == "Section 1\nClaims are settled within 30 days.\n"
+    assert loaded["policy.docx"] == "Section 2\nKnee surgery is covered after 6 months."
@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+from app.retriever.lexical import B, K1, LexicalIndex, build_lexical_index, tokenize
+
+CHUNKS = [
+    "knee surgery is covered",
+    "knee knee replacement after two years of continuous cover",
+    "the waiting period for hip replacement is twenty four months from the policy start",
+    "dental treatment is excluded",
+    "surgery in a network hospital is cashless surgery",
+]
+
+
+class Store:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def __len__(self):
+        return len(self.texts)
+
+    def text(self, i):
+        return self.texts[i]
+
+
+def reference_bm25(texts, term):
+    """Okapi BM25 of a one-word query for each text, with its idf as LexicalIndex computes it."""
+    docs = [tokenize(t) for t in texts]
+    avgdl = sum(map(len, docs)) / len(docs)
+    df = sum(term in d for d in docs)
+    idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+    scores = {}
+    for i, d in enumerate(docs):
+        tf = d.count(term)
+        if tf:
+            scores[i] = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(d) / avgdl))
+    return scores
+
+
+def search_all(index, term):
+    ids, scores = index.search(term, 100)
+    return dict(zip(ids.tolist(), scores.tolist()))
+
+
+@pytest.mark.parametrize("term", ["knee", "surgery", "replacement", "dental"])
+def test_bm25_matches_reference(tmp_path, term):
+    index = build_lexical_index(Store(CHUNKS), str(tmp_path / "lexical"))
+    assert search_all(index, term) == pytest.approx(reference_bm25(CHUNKS, term), rel=1e-5)
+
+
+def test_scores_do_not_depend_on_chunk_order(tmp_path):
+    forward = build_lexical_index(Store(CHUNKS), str(tmp_path / "forward"))
+    backward = build_lexical_index(Store(CHUNKS[::-1]), str(tmp_path / "backward"))
+    last = len(CHUNKS) - 1
+    for term in ("knee", "surgery", "replacement"):
+        reversed_scores = {last - i: s for i, s in search_all(backward, term).items()}
+        assert search_all(forward, term) == pytest.approx(reversed_scores, rel=1e-5)
+
+
+def test_incremental_update_keeps_the_base_average_length(tmp_path):
+    base = build_lexical_index(Store(CHUNKS[:3]), str(tmp_path / "base"))
+    updated = build_lexical_index(Store(CHUNKS), str(tmp_path / "updated"), base)
+    assert updated.n_docs == len(CHUNKS)
+    assert updated.avg_length == base.avg_length
+    reopened = LexicalIndex(str(tmp_path / "updated"))
+    assert reopened.avg_length == base.avg_length
+    # An added chunk is normalized against the base's average, not the new one
+    idf = math.log(1 + (len(CHUNKS) - 1 + 0.5) / (1 + 0.5))
+    length = len(tokenize(CHUNKS[3]))
+    expected = idf * (K1 + 1) / (1 + K1 * (1 - B + B * length / base.avg_length))
+    assert search_all(updated, "dental") == pytest.approx({3: expected}, rel=1e-5)
@@ -0,0 +1,60 @@
+import os
+import random
+import re
+
+import pytest
+
+from app.parser.gazetteer import QueryParser
+
+GAZETTEERS = os.path.join(os.path.dirname(__file__), "..", "app", "data", "gazetteers")
+
+PROCEDURES = ["knee surgery", "heart surgery", "hip replacement", "bypass surgery"]
+LOCATIONS = ["Pune", "Delhi", "Mumbai", "Bangalore", "Chennai"]
+FILLERS = ["male", "female", "needs", "in", "with", "a", "policy", "claim", "for", "my", "father", "is", "covered?"]
+
+
+def reference_parse(query):
+    """The hardcoded regex and substring parser that the gazetteers replaced."""
+    age_match = re.search(r"(\d{2})[- ]?year[- ]?old", query.lower())
+    procedure = next((p for p in PROCEDURES if p in query.lower()), "unknown")
+    location = next((loc for loc in LOCATIONS if loc.lower() in query.lower()), "unknown")
+    duration_match = re.search(r"(\d+)[ -]?month[- ]?old insurance policy", query.lower())
+    return {
+        "age": int(age_match.group(1)) if age_match else None,
+        "procedure": procedure,
+        "location": location,
+        "policy_duration_months": int(duration_match.group(1)) if duration_match else None,
+    }
+
+
+def random_query(rng):
+    words = rng.choices(FILLERS, k=rng.randint(0, 6))
+    words += rng.sample(PROCEDURES, rng.randint(0, 2))
+    words += [rng.choice([loc, loc.lower(), loc.upper()]) for loc in rng.sample(LOCATIONS, rng.randint(0, 2))]
+    if rng.random() < 0.7:
+        words.append(f"{rng.randint(18, 99)}{rng.choice(['-', ' ', ''])}year{rng.choice(['-', ' '])}old")
+    if rng.random() < 0.7:
+        words.append(f"{rng.randint(1, 36)}{rng.choice(['-', ' ', ''])}month{rng.choice(['-', ' '])}old insurance policy")
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_gazetteer_parse_matches_the_old_parser(seed):
+    rng = random.Random(seed)
+    parser = QueryParser.load(GAZETTEERS)
+    fields = ("age", "procedure", "location", "policy_duration_months")
+    for _ in range(200):
+        query = random_query(rng)
+        parsed = parser.parse(query)
+        assert {f: parsed[f] for f in fields} == reference_parse(query), query
+
+
+def test_gazetteer_matches_whole_words_and_aliases():
+    parser = QueryParser.load(GAZETTEERS)
+    parsed = parser.parse("tkr at Apollo Hospital in Bengaluru, ICD M17.1")
+    assert parsed["procedure"] == "knee replacement"
+    assert parsed["location"] == "Bangalore"
+    assert parsed["hospital"] == "Apollo Hospital"
+    assert [c["code"] for c in parsed["icd_codes"]] == ["M17.1"]
+    assert parser.parse("Punekar needs a procedure")["location"] == "unknown"
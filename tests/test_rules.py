@@ -0,0 +1,63 @@
+import os
+import random
+
+import pytest
+
+from app.parser.automaton import Automaton
+from app.retriever.rules import RuleEngine
+
+RULES = os.path.join(os.path.dirname(__file__), "..", "app", "data", "rules", "insurance.json")
+
+FRAGMENTS = [
+    "knee surgery", "Knee Surgery", "knee surger", "6 months", "6 MONTHS", "16 months", "6 month",
+    "emergency", "EMERGENCY", "emergencies", "from day 1", "from day 10", "From Day 1",
+    "is covered", "after a waiting period of", "the policy", "hospitalisation", "is excluded",
+]
+
+
+def reference_evaluate(structured_query, clauses):
+    """The hardcoded insurance checks that insurance.json replaced."""
+    procedure = structured_query.get("procedure") or ""
+    duration = structured_query.get("policy_duration_months")
+    decision = "rejected"
+    amount = 0
+    matching_clauses = []
+    for clause in clauses:
+        clause_text = clause.lower()
+        if "knee surgery" in clause_text and "6 months" in clause_text:
+            if duration and duration >= 6:
+                decision = "approved"
+                amount = 15000
+            matching_clauses.append(clause)
+        elif "emergency" in clause_text and "from day 1" in clause_text:
+            if "emergency" in procedure.lower():
+                decision = "approved"
+                amount = 10000
+                matching_clauses.append(clause)
+    return {"decision": decision, "amount": amount, "clauses": matching_clauses}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rules_match_the_hardcoded_checks(seed):
+    rng = random.Random(seed)
+    engine = RuleEngine.load(RULES)
+    for _ in range(200):
+        clauses = [" ".join(rng.choices(FRAGMENTS, k=rng.randint(1, 6))) for _ in range(rng.randint(0, 4))]
+        structured = {
+            "policy_duration_months": rng.choice([None, 0, 3, 5, 6, 7, 24]),
+            "procedure": rng.choice([None, "knee surgery", "Emergency appendectomy", "dental"]),
+        }
+        assert engine.evaluate(structured, clauses) == reference_evaluate(structured, clauses)
+
+
+def test_automaton_finds_every_substring():
+    rng = random.Random(0)
+    patterns = ["a", "ab", "bab", "abab", "bc", "c", "abc", "ab"]
+    automaton = Automaton(patterns, native=False)
+    for _ in range(500):
+        text = "".join(rng.choices("abcAB", k=rng.randint(0, 12)))
+        expected = {pid for pid, p in enumerate(patterns) if p in text.lower()}
+        assert automaton.search(text) == expected
+        assert {pid for _, _, pid in automaton.finditer(text)} == expected
+        for start, end, pid in automaton.finditer(text):
+            assert text[start:end].lower() == patterns[pid]
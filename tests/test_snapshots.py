@@ -0,0 +1,63 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from app.retriever import snapshots
+from app.retriever.chunk_store import ChunkStoreWriter
+from app.retriever.ingest import save_index, save_manifest
+from app.retriever.lexical import build_lexical_index
+
+
+@pytest.fixture
+def snapshot_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOTS_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(snapshots, "CURRENT_FILE", str(tmp_path / "CURRENT"))
+    monkeypatch.setattr(snapshots, "KEEP_SNAPSHOTS", 1)
+    return tmp_path
+
+
+def write_snapshot(name, texts):
+    """Publish a snapshot called name holding texts, with a flat index of one-hot vectors."""
+    partial = os.path.join(snapshots.SNAPSHOTS_DIR, name + snapshots.PARTIAL_SUFFIX)
+    os.makedirs(partial)
+    writer = ChunkStoreWriter(snapshots.store_path(partial))
+    for text in texts:
+        writer.add("policy.txt", None, text)
+    store = writer.close()
+    build_lexical_index(store, snapshots.lexical_path(partial))
+    store.close()
+    index = faiss.IndexFlatL2(len(texts))
+    index.add(np.eye(len(texts), dtype=np.float32))
+    save_index(index, snapshots.index_path(partial))
+    save_manifest({"policy.txt": name}, snapshots.manifest_path(partial))
+    return snapshots.finish_snapshot(partial)
+
+
+def test_acquired_snapshot_survives_swap_until_released(snapshot_root):
+    live = snapshots.SnapshotManager()
+    # Names sort by their timestamp prefix, so the first one is the older
+    first = write_snapshot("20260101T000000-aaaaaa", ["knee surgery is covered", "dental is excluded"])
+    snapshots.publish(first, in_use=live.paths())
+    live.swap(first, *snapshots.load_snapshot(first))
+
+    old = live.acquire()
+    second = write_snapshot("20260101T000001-bbbbbb", ["cataract surgery", "hip replacement", "angioplasty"])
+    snapshots.publish(second, in_use=live.paths())
+    live.swap(second, *snapshots.load_snapshot(second))
+
+    assert live.current.path == second
+    assert old.retired and os.path.isdir(first)
+    assert old.store.text(0) == "knee surgery is covered"
+    _, ids = old.index.search(np.array([[0, 1]], dtype=np.float32), 1)
+    assert ids.tolist() == [[1]]
+    lexical_ids, _ = old.lexical.search("dental", 5)
+    assert lexical_ids.tolist() == [1]
+    assert live.stats()["draining"] == [{"snapshot": os.path.basename(first), "in_use": 1}]
+
+    live.release(old)
+    assert old.index is None
+    assert not os.path.exists(first)
+    assert os.path.isdir(second)
+    assert live.stats()["draining"] == []
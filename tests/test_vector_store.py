@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.retriever.vector_store import RRF_K, _fuse, _merge_windows
+
+
+class Runs:
+    """The window() of a chunk store whose runs (same document and section) start at starts."""
+
+    def __init__(self, starts, n):
+        self.bounds = list(starts) + [n]
+
+    def window(self, i, radius):
+        r = max(j for j, start in enumerate(self.bounds[:-1]) if start <= i)
+        return max(self.bounds[r], i - radius), min(self.bounds[r + 1], i + radius + 1)
+
+
+def hits(*chunk_ids):
+    return [{"chunk_id": i} for i in chunk_ids]
+
+
+def windows(results):
+    return [(r["chunk_id"], r["window"], r["merged_chunk_ids"]) for r in results]
+
+
+def test_overlapping_hits_merge_within_the_span_cap():
+    merged = _merge_windows(hits(5, 6), Runs([0], 20), 1)
+    # [4, 7) and [5, 8) would span 4 chunks: 6 is already in 5's window
+    assert windows(merged) == [(5, [4, 7], [6])]
+    merged = _merge_windows(hits(5, 7), Runs([0, 6], 20), 1)
+    # Different runs never overlap
+    assert windows(merged) == [(5, [4, 6], []), (7, [6, 9], [])]
+
+
+def test_adjacent_run_of_hits_is_not_one_clause():
+    merged = _merge_windows(hits(*range(10, 18)), Runs([0], 40), 1)
+    spans = [r["window"] for r in merged]
+    assert len(merged) > 1
+    assert all(end - start <= 3 for start, end in spans)
+    # Windows are disjoint and every hit is covered by exactly one result
+    covered = [i for start, end in spans for i in range(start, end)]
+    assert len(covered) == len(set(covered))
+    assert set(range(10, 18)) <= set(covered)
+
+
+def test_hit_outside_kept_windows_is_clipped():
+    merged = _merge_windows(hits(5, 9, 7), Runs([0], 20), 1)
+    # 7's window [6, 9) overlaps both kept windows; the union is too long, so it is clipped to itself
+    assert windows(merged) == [(5, [4, 7], []), (9, [8, 11], []), (7, [7, 8], [])]
+
+
+def test_merge_extends_a_window_clipped_by_its_run():
+    # 1's window is cut to [1, 3) by the run start; 2 extends it to [1, 4), still 3 chunks
+    merged = _merge_windows(hits(1, 2), Runs([0, 1], 20), 1)
+    assert windows(merged) == [(1, [1, 4], [2])]
+
+
+def test_fuse_orders_by_reciprocal_rank_fusion():
+    faiss_hits = [{"clause": None, "chunk_id": i, "distance": d, "rerank_score": None, "lexical_score": None}
+                  for i, d in [(10, 0.1), (11, 0.2), (12, 0.3)]]
+    fused = _fuse(faiss_hits, np.array([12, 13, 10]), np.array([9.0, 5.0, 1.0], dtype=np.float32))
+
+    def rrf(*ranks):
+        return sum(1.0 / (RRF_K + rank + 1) for rank in ranks)
+
+    expected = {10: rrf(0, 2), 11: rrf(1), 12: rrf(2, 0), 13: rrf(1)}
+    assert [r["chunk_id"] for r in fused] == sorted(expected, key=lambda i: -expected[i])
+    assert {r["chunk_id"]: r["fused_score"] for r in fused} == expected
+    by_id = {r["chunk_id"]: r for r in fused}
+    # Lexical-only hits have no distance; FAISS-only hits no lexical score
+    assert by_id[13]["distance"] is None and by_id[13]["lexical_score"] == 5.0
+    assert by_id[11]["lexical_score"] is None